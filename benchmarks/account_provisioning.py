@@ -0,0 +1,114 @@
+#-*- coding:utf-8 -*-
+"""
+Benchmark: account registration throughput.
+
+Each account is created with its default organization, member, VPC and SSH key:
+* register: the `AccountRegister` endpoint, RSA key generation included.
+* register_pool: the `AccountRegister` endpoint, the keys taken from a filled keypair pool.
+* single: `create_accounts()`, one account per transaction.
+* batch: `create_accounts()`, `--batch-size` accounts per transaction.
+The settings are loaded from **BOULANGERIE_INI**, the database must be migrated.
+Every run is rolled back, and the passwords are hashed with MD5: only the database
+work is measured.
+
+    $ BOULANGERIE_INI=boulangerie/boulangerie.ini python benchmarks/account_provisioning.py
+"""
+from __future__ import print_function
+import argparse
+import itertools
+import os
+import time
+
+COUNTER = itertools.count()
+
+def new_account():
+    """
+    An unsaved account, with its unsaved default key.
+    """
+    from boulangerie.apps.accounts.models import Account
+    from boulangerie.apps.keys.models import SSHKey
+    username = 'bench{0}'.format(next(COUNTER))
+    account = Account.objects.build_user('{0}@bench.org'.format(username), 'password', username=username)
+    key = SSHKey(name='default', owner=username, public='ssh-rsa AAAA {0}'.format(username),
+                 fingerprint='MD5:{0}'.format(username))
+    return account, key
+
+def register(accounts, batch_size):#pylint:disable=unused-argument
+    """
+    Register through the API.
+    """
+    from rest_framework.test import APIClient
+    client = APIClient()
+    for _ in range(accounts):
+        username = 'bench{0}'.format(next(COUNTER))
+        body = {'username': username, 'password': 'password', 'confirm_password': 'password',
+                'email': '{0}@bench.org'.format(username)}
+        assert client.post('/api/0.1/accounts/register/', body, format='json').status_code == 201
+
+def single(accounts, batch_size):#pylint:disable=unused-argument
+    """
+    Create the accounts one by one.
+    """
+    from django.db import transaction
+    from boulangerie.apps.accounts.provisioning import create_accounts
+    for _ in range(accounts):
+        account, key = new_account()
+        with transaction.atomic():
+            create_accounts([account], {account.username: key})
+
+def batch(accounts, batch_size):
+    """
+    Create the accounts by batches.
+    """
+    from boulangerie.apps.accounts.provisioning import create_accounts
+    for start in range(0, accounts, batch_size):
+        bundles = [new_account() for _ in range(min(batch_size, accounts - start))]
+        create_accounts([account for account, _ in bundles],
+                        {account.username: key for account, key in bundles})
+
+def fill_pool(accounts, batch_size):#pylint:disable=unused-argument
+    """
+    Fill the keypair pool for the registrations.
+    """
+    from boulangerie.apps.keys import pool
+    pool.fill(accounts)
+
+def bench(name, function, accounts, batch_size, setup=None):
+    """
+    Create `accounts` accounts with `function`, and print the throughput.
+    `setup` is called first, out of the measure.
+    """
+    from django.db import transaction
+    with transaction.atomic():
+        if setup:
+            setup(accounts, batch_size)
+        start = time.time()
+        function(accounts, batch_size)
+        transaction.set_rollback(True)
+    elapsed = time.time() - start
+    print('{0:<13} {1:>8} accounts in {2:>8.3f}s: {3:>10.1f} accounts/s'.format(
+        name, accounts, elapsed, accounts / elapsed))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--register', type=int, default=10,
+                        help='The accounts registered through the API, slowed down by the RSA keys.')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'boulangerie.settings')
+    import django
+    from django.conf import settings
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+
+    if args.register:
+        bench('register', register, args.register, args.batch_size)
+        bench('register_pool', register, args.register, args.batch_size, setup=fill_pool)
+    bench('single', single, args.accounts, args.batch_size)
+    bench('batch', batch, args.accounts, args.batch_size)
+
+if __name__ == '__main__':
+    main()
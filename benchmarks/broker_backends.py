@@ -0,0 +1,57 @@
+#-*- coding:utf-8 -*-
+"""
+Benchmark: signal-to-publish throughput of each broker backend.
+
+A `post_save` signal of an SSH key is sent for each message, so the whole
+path is measured: the signal receiver, `broker.send()` and the backend.
+The settings are loaded from **BOULANGERIE_INI**, the database is not used:
+
+    $ BOULANGERIE_INI=boulangerie/boulangerie.ini python benchmarks/broker_backends.py
+    $ BOULANGERIE_INI=... python benchmarks/broker_backends.py --amqp amqp://127.0.0.1:5672/
+"""
+from __future__ import print_function
+import argparse
+import os
+import tempfile
+import time
+
+def bench(name, uri, messages):
+    """
+    Send `messages` signals with the broker `uri`, and print the throughput.
+    """
+    from django.conf import settings
+    from django.db.models.signals import post_save
+    import boulangerie.broker
+    from boulangerie.apps.keys.models import SSHKey
+
+    settings.BROKER = dict(settings.BROKER, uri=uri, outbox=False)
+    boulangerie.broker.MemoryBackend.bind('create-key', 'git', 'create-key')
+    key = SSHKey(name='benchmark', owner='benchmark', public='ssh-rsa AAAA benchmark')
+    start = time.time()
+    for _ in range(messages):
+        post_save.send(sender=SSHKey, instance=key, created=True)
+    elapsed = time.time() - start
+    boulangerie.broker.get_publisher().close()
+    boulangerie.broker.MemoryBackend.reset()
+    print('{0:<8} {1:>8} messages in {2:>8.3f}s: {3:>10.1f} msg/s'.format(
+        name, messages, elapsed, messages / elapsed))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--amqp', help='The RabbitMQ URI, skipped if not set.')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'boulangerie.settings')
+    import django
+    django.setup()
+
+    path = os.path.join(tempfile.mkdtemp(), 'events.jsonl')
+    bench('memory', 'memory://', args.messages)
+    bench('file', 'file://{0}'.format(path), args.messages)
+    if args.amqp:
+        bench('amqp', args.amqp, args.messages)
+    os.remove(path)
+
+if __name__ == '__main__':
+    main()
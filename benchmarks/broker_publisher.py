@@ -0,0 +1,60 @@
+#-*- coding:utf-8 -*-
+"""
+Benchmark: messages per second published to the broker,
+one connection per message (legacy `send()`) versus the long-lived `Publisher`.
+
+By default it runs against kombu's in-memory transport, a local stand-in
+for RabbitMQ, so that only the client side cost is measured:
+
+    $ python benchmarks/broker_publisher.py --messages 5000
+    $ python benchmarks/broker_publisher.py --uri amqp://127.0.0.1:5672/
+"""
+from __future__ import print_function
+import argparse
+import time
+import kombu
+import kombu.common
+import kombu.pools
+from boulangerie.broker import EXCHANGES, Publisher
+
+PAYLOAD = {'repo': 'benchmark.project', 'organization': 'benchmark'}
+
+def legacy_send(uri, payload, routing_key, exchange):
+    """
+    The `send()` implementation before the pooled publisher:
+    a new connection, channel and declaration for every message.
+    """
+    exchange = EXCHANGES.get(exchange)
+    with kombu.Connection(uri) as conn:
+        exchange = exchange(conn.channel())
+        exchange.declare()
+        with kombu.pools.producers[conn].acquire(block=True) as producer:
+            kombu.common.maybe_declare(exchange, producer.channel)
+            producer.publish(payload, routing_key=routing_key)
+
+def bench(name, func, messages):
+    """
+    Call `func` `messages` times and print the throughput.
+    """
+    start = time.time()
+    for _ in range(messages):
+        func(PAYLOAD, 'create-repo', 'git')
+    elapsed = time.time() - start
+    print('{0:<10} {1:>8} messages in {2:>8.3f}s: {3:>10.1f} msg/s'.format(
+        name, messages, elapsed, messages / elapsed))
+    return messages / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--uri', default='memory://')
+    parser.add_argument('--messages', type=int, default=2000)
+    args = parser.parse_args()
+
+    before = bench('legacy', lambda *a: legacy_send(args.uri, *a), args.messages)
+    publisher = Publisher(args.uri)
+    after = bench('pooled', lambda p, r, e: publisher.publish(p, r, EXCHANGES[e]), args.messages)
+    publisher.close()
+    print('speedup: x{0:.1f}'.format(after / before))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#-*- coding:utf-8 -*-
+"""
+Benchmark: latency of the git accesses resolution.
+
+`--accounts` accounts are provisioned, each with a key and a project in its default
+organization, then `--requests` random (fingerprint, repository) pairs are resolved:
+* resolve: `authorize()`, the cache cleared before each call: one database query.
+* cached: `authorize()`, the decisions cached.
+* endpoint: `GET /api/0.1/keys/authorize/` with an admin token, the decisions cached.
+The settings are loaded from **BOULANGERIE_INI**, the database must be migrated.
+The run is rolled back.
+
+    $ BOULANGERIE_INI=boulangerie/boulangerie.ini python benchmarks/git_authorization.py
+"""
+from __future__ import print_function
+import argparse
+import os
+import random
+import time
+
+def populate(accounts):
+    """
+    Provision the accounts, their keys and projects, and an admin.
+    :returns: The fingerprints, the repositories and the admin token.
+    """
+    from rest_framework_jwt.settings import api_settings
+    from boulangerie.apps.accounts.models import Account
+    from boulangerie.apps.accounts.provisioning import create_accounts, default_organization
+    from boulangerie.apps.keys.fingerprints import digests, encode_md5
+    from boulangerie.apps.keys.models import SSHKey
+    from boulangerie.apps.projects.models import Project
+    usernames = ['bench{0}'.format(index) for index in range(accounts)]
+    keys = {}
+    for username in usernames:
+        public = 'ssh-rsa AAAA {0}'.format(username)
+        md5, sha256 = digests(public)
+        keys[username] = SSHKey(name='default', owner=username, public=public,
+                                fingerprint=encode_md5(md5), md5=md5, sha256=sha256)
+    create_accounts([Account.objects.build_user('{0}@bench.org'.format(username), 'password', username=username)
+                     for username in usernames], keys)
+    Project.objects.bulk_create([Project(name='app', owner=default_organization(username), uri='bench')
+                                 for username in usernames])
+    admin = Account.objects.create_superuser('benchadmin@bench.org', 'password', username='benchadmin')
+    token = api_settings.JWT_ENCODE_HANDLER(api_settings.JWT_PAYLOAD_HANDLER(admin))
+    return [keys[username].fingerprint for username in usernames], \
+        ['{0}.app'.format(default_organization(username)) for username in usernames], token
+
+def bench(name, function, pairs):
+    """
+    Resolve the pairs with `function`, and print the latencies.
+    """
+    durations = []
+    for fingerprint, repo in pairs:
+        start = time.time()
+        function(fingerprint, repo)
+        durations.append(time.time() - start)
+    durations.sort()
+    def percentile(value):#pylint:disable=missing-docstring
+        return durations[min(len(durations) - 1, int(len(durations) * value))] * 1000
+    print('{0:<9} {1:>8} requests: p50 {2:>7.3f}ms p99 {3:>7.3f}ms max {4:>7.3f}ms'.format(
+        name, len(durations), percentile(0.5), percentile(0.99), durations[-1] * 1000))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=10000)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'boulangerie.settings')
+    import django
+    from django.conf import settings
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+    from django.core.cache import caches
+    from django.db import transaction
+    from rest_framework.test import APIClient
+    from boulangerie.apps.keys.authorization import authorize
+
+    with transaction.atomic():
+        fingerprints, repos, token = populate(args.accounts)
+        #Half of the pairs are allowed.
+        pairs = []
+        for _ in range(args.requests):
+            index = random.randrange(args.accounts)
+            other = index if random.random() < 0.5 else random.randrange(args.accounts)
+            pairs.append((fingerprints[index], repos[other]))
+
+        def resolve(fingerprint, repo):#pylint:disable=missing-docstring
+            caches['authorization'].clear()
+            authorize(fingerprint, repo)
+        bench('resolve', resolve, pairs)
+        bench('cached', authorize, pairs)
+        client = APIClient()
+        def endpoint(fingerprint, repo):#pylint:disable=missing-docstring
+            response = client.get('/api/0.1/keys/authorize/', {'fingerprint': fingerprint, 'repo': repo},
+                                  HTTP_AUTHORIZATION='JWT {0}'.format(token))
+            assert response.status_code == 200
+        bench('endpoint', endpoint, pairs)
+        transaction.set_rollback(True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#-*- coding:utf-8 -*-
+"""
+Benchmark: size and lookup latency of the key fingerprint indexes.
+
+A synthetic table of `--keys` rows is indexed on:
+* text: the colon-separated MD5 text fingerprint, the former unique column.
+* md5: the 16 bytes MD5 digest.
+* sha256: the 32 bytes SHA256 digest.
+The index sizes are read from PostgreSQL, or from the used pages for SQLite,
+then `--lookups` random keys are looked up on each index.
+The settings are loaded from **BOULANGERIE_INI**, the tables are dropped at the end.
+
+    $ BOULANGERIE_INI=boulangerie/boulangerie.ini python benchmarks/key_fingerprints.py
+"""
+from __future__ import print_function
+import argparse
+import hashlib
+import os
+import random
+import time
+
+TABLE = 'benchmark_fingerprints'
+COLUMNS = ('text', 'md5', 'sha256')
+
+def rows(count):
+    """
+    The fingerprints of `count` synthetic keys.
+    """
+    from boulangerie.apps.keys.fingerprints import encode_md5
+    for index in range(count):
+        blob = 'key{0}'.format(index).encode('ascii')
+        md5, sha256 = hashlib.md5(blob).digest(), hashlib.sha256(blob).digest()
+        yield encode_md5(md5), md5, sha256
+
+def size(cursor, index):
+    """
+    The size of an index, in bytes.
+    """
+    from django.db import connection
+    if connection.vendor == 'postgresql':
+        cursor.execute('SELECT pg_relation_size(%s)', [index])
+        return cursor.fetchone()[0]
+    cursor.execute('PRAGMA page_count')
+    pages = cursor.fetchone()[0]
+    cursor.execute('PRAGMA freelist_count')
+    pages -= cursor.fetchone()[0]
+    cursor.execute('PRAGMA page_size')
+    return pages * cursor.fetchone()[0]
+
+def populate(cursor, keys, batch_size=10000):
+    """
+    Create and fill the table, then index it.
+    :returns: The size of each index.
+    """
+    from django.db import connection, transaction
+    binary = connection.data_types['BinaryField']
+    cursor.execute('DROP TABLE IF EXISTS {0}'.format(TABLE))
+    cursor.execute('CREATE TABLE {0} (id INTEGER PRIMARY KEY, text TEXT NOT NULL, md5 {1} NOT NULL, '
+                   'sha256 {1} NOT NULL)'.format(TABLE, binary))
+    batch = []
+    for index, (text, md5, sha256) in enumerate(rows(keys)):
+        batch.append((index, text, connection.Database.Binary(md5), connection.Database.Binary(sha256)))
+        if len(batch) == batch_size or index == keys - 1:
+            with transaction.atomic():
+                cursor.executemany('INSERT INTO {0} VALUES (%s, %s, %s, %s)'.format(TABLE), batch)
+            batch = []
+    sizes = {}
+    for column in COLUMNS:
+        index = '{0}_{1}_idx'.format(TABLE, column)
+        #SQLite: the pages used by the index.
+        before = size(cursor, index) if connection.vendor != 'postgresql' else 0
+        cursor.execute('CREATE UNIQUE INDEX {0} ON {1} ({2})'.format(index, TABLE, column))
+        sizes[column] = size(cursor, index) - before
+    return sizes
+
+def bench(cursor, column, keys, lookups):
+    """
+    Look up random keys on the index of `column`, and return the latencies, in ms.
+    """
+    from django.db import connection
+    values = list(rows(keys))
+    position = COLUMNS.index(column)
+    durations = []
+    for _ in range(lookups):
+        value = random.choice(values)[position]
+        if column != 'text':
+            value = connection.Database.Binary(value)
+        start = time.time()
+        cursor.execute('SELECT id FROM {0} WHERE {1} = %s'.format(TABLE, column), [value])
+        assert cursor.fetchone() is not None
+        durations.append(time.time() - start)
+    durations.sort()
+    return [durations[min(len(durations) - 1, int(len(durations) * percentile))] * 1000 for percentile in (0.5, 0.99)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--keys', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=10000)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'boulangerie.settings')
+    import django
+    django.setup()
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        try:
+            sizes = populate(cursor, args.keys)
+            for column in COLUMNS:
+                p50, p99 = bench(cursor, column, args.keys, args.lookups)
+                print('{0:<7} {1:>8} keys: index {2:>8.1f}MB, lookup p50 {3:>7.3f}ms p99 {4:>7.3f}ms'.format(
+                    column, args.keys, sizes[column] / 1024.0 / 1024, p50, p99))
+        finally:
+            cursor.execute('DROP TABLE IF EXISTS {0}'.format(TABLE))
+
+if __name__ == '__main__':
+    main()
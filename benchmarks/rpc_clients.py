@@ -0,0 +1,107 @@
+#-*- coding:utf-8 -*-
+"""
+Benchmark: latency of the builds list and detail RPC calls, per-request vs pooled clients.
+
+A stand-in `cuisson` service answers `list` and `detail` with payloads of the size of the real ones,
+from a thread of this process. Each call is made `--calls` times:
+* farine: a new `farine.rpc.Client` per call, the former views.
+* pooled: a client borrowed from `boulangerie.rpc`, the connection and the reply queue are kept.
+The in-memory transport is used by default, `--amqp` runs against a RabbitMQ broker:
+the setup of the connection and of the reply queue on the network is what the pool saves.
+The settings are loaded from **BOULANGERIE_INI** and **FARINE_INI**.
+
+    $ BOULANGERIE_INI=boulangerie/boulangerie.ini FARINE_INI=boulangerie/boulangerie.ini python benchmarks/rpc_clients.py
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import threading
+import time
+
+BUILD = {'tag_uri': None, 'context': {}, 'uid': '3b73f69f3fb94f159d8a3230596c2e3b', 'repo': 'toto', 'fail': False,
+         'step': 'done', 'branch': 'master', 'owner': 'orga', 'date_created': '2018-01-21T17:10:59.793568', 'id': 28}
+RESULTS = {
+    'list': {'count': 10, 'previous': None, 'next': None, 'results': [json.dumps(BUILD)] * 10},
+    'detail': {'count': 8, 'previous': None, 'next': None, 'results': [json.dumps(BUILD)] * 8},
+}
+
+def serve(uri, stop):
+    """
+    Stand-in `cuisson` service: answers the calls until `stop` is set.
+    """
+    import kombu
+    conn = kombu.Connection(uri, transport_options={'polling_interval': 0.0005})
+    channel = conn.channel()
+    exchange = kombu.Exchange('cuisson', type='direct')
+    producer = kombu.Producer(channel, exchange=exchange)
+    def reply(_, message):#pylint:disable=missing-docstring
+        properties = {'routing_key': message.properties['reply_to'],
+                      'correlation_id': message.properties['correlation_id']}
+        method = message.delivery_info['routing_key'].split('__', 1)[1]
+        producer.publish({'body': RESULTS[method], '__end__': False}, **properties)
+        producer.publish({'__end__': True}, **properties)
+        message.ack()
+    queues = [kombu.Queue('cuisson__{0}'.format(method), exchange=exchange, routing_key='cuisson__{0}'.format(method))
+              for method in RESULTS]
+    consumer = kombu.Consumer(channel, queues=queues, callbacks=[reply])
+    consumer.consume()
+    while not stop.is_set():
+        try:
+            conn.drain_events(timeout=0.05)
+        except Exception:#pylint:disable=broad-except
+            pass
+    conn.release()
+
+def bench(call, calls):
+    """
+    Make the call `calls` times, and return the latencies, in ms.
+    """
+    durations = []
+    for _ in range(calls):
+        start = time.time()
+        call()
+        durations.append(time.time() - start)
+    durations.sort()
+    return [durations[min(len(durations) - 1, int(len(durations) * percentile))] * 1000 for percentile in (0.5, 0.99)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--amqp', help='The URI of a RabbitMQ broker, instead of the in-memory transport.')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'boulangerie.settings')
+    import django
+    django.setup()
+    import farine.rpc
+    import farine.settings
+    import kombu.transport.memory
+    import boulangerie.rpc
+
+    uri = args.amqp or 'memory://'
+    #The default polling of the in-memory transport is 1s.
+    kombu.transport.memory.Transport.polling_interval = 0.0005
+    farine.settings.cuisson = dict(getattr(farine.settings, 'cuisson', {}), amqp_uri=uri)
+    stop = threading.Event()
+    server = threading.Thread(target=serve, args=(uri, stop))
+    server.daemon = True
+    server.start()
+    time.sleep(0.5)
+    try:
+        for method, params in (('list', ('orga', 0, 10)), ('detail', ('orga', BUILD['uid']))):
+            def farine_call():#pylint:disable=missing-docstring
+                assert getattr(farine.rpc.Client('cuisson', 5), method)(*params) == RESULTS[method]
+            def pooled_call():#pylint:disable=missing-docstring
+                with boulangerie.rpc.client('cuisson') as rpc:
+                    assert getattr(rpc, method)(*params) == RESULTS[method]
+            for name, call in (('farine', farine_call), ('pooled', pooled_call)):
+                p50, p99 = bench(call, args.calls)
+                print('{0:<6} {1:<6} {2:>6} calls: p50 {3:>7.3f}ms p99 {4:>7.3f}ms'.format(
+                    method, name, args.calls, p50, p99))
+    finally:
+        stop.set()
+        server.join()
+
+if __name__ == '__main__':
+    main()
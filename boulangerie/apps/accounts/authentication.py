@@ -0,0 +1,73 @@
+#-*- coding:utf-8 -*-
+"""
+Authentication for the accounts.
+"""
+from django.utils.deprecation import CallableFalse, CallableTrue
+from django.utils.functional import cached_property
+from django.utils.translation import ugettext as _
+from rest_framework import exceptions
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication as BaseJSONWebTokenAuthentication
+from rest_framework_jwt.settings import api_settings
+import boulangerie.metrics
+from .models import Account
+
+class Principal(object):
+    """
+    The account of a verified token.
+    Most of the views only need its username, and the admin views its admin flag:
+    the `Account` row is loaded on the first access to another field.
+    """
+    is_active = True
+    is_authenticated = CallableTrue
+    is_anonymous = CallableFalse
+
+    def __init__(self, username, payload, status):
+        self.username = self.pk = username
+        self.jwt_payload = payload
+        self.membership_version = status.membership_version
+        #Read by `rest_framework.permissions.IsAdminUser`, cf `Account.is_staff`.
+        self.is_staff = self.is_superuser = self.is_admin = status.is_admin
+
+    @cached_property
+    def account(self):
+        """
+        The account row, loaded once.
+        :rtype: boulangerie.apps.accounts.models.Account
+        """
+        boulangerie.metrics.incr('principal.loads')
+        return Account.objects.get(username=self.username)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.account, name)
+
+    def __eq__(self, other):
+        return getattr(other, 'username', None) == self.username
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.username)
+
+    def __str__(self):
+        return self.username
+
+class JSONWebTokenAuthentication(BaseJSONWebTokenAuthentication):
+    """
+    JWT authentication without loading the account: the request user is a `Principal`.
+    It keeps the decoded payload, the organization claims are read from it,
+    cf `boulangerie.apps.accounts.tokens`.
+    The status of the account, its membership version and its admin flag, is cached for a short time,
+    the deleted accounts are rejected.
+    """
+
+    def authenticate_credentials(self, payload):
+        username = api_settings.JWT_PAYLOAD_GET_USERNAME_HANDLER(payload)
+        if not username:
+            raise exceptions.AuthenticationFailed(_('Invalid payload.'))
+        status = Account.objects.status(username)
+        if status is None:
+            raise exceptions.AuthenticationFailed(_('Invalid signature.'))
+        return Principal(username, payload, status)
@@ -0,0 +1,62 @@
+#-*- coding:utf-8 -*-
+"""
+Authentication backends for the accounts.
+"""
+import time
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.utils.crypto import salted_hmac
+import boulangerie.metrics
+
+UserModel = get_user_model()#pylint:disable=invalid-name
+
+class CachedModelBackend(ModelBackend):
+    """
+    Model backend caching the successful password checks: the scripted clients
+    authenticate every call, each PBKDF2 check costs tens of milliseconds.
+    The entries are keyed on an HMAC of the credentials and of the stored password hash:
+    they don't match anymore once the password changes.
+    """
+
+    @staticmethod
+    def cache_key(user, password):
+        """
+        The cache key of the credentials.
+        :rtype: str
+        """
+        value = u'\0'.join((user.get_username(), password, user.password))
+        return u'credentials:{0}'.format(salted_hmac('boulangerie.credentials', value).hexdigest())
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)#pylint:disable=protected-access
+        except UserModel.DoesNotExist:
+            #Hash the password anyway, cf `ModelBackend.authenticate`.
+            UserModel().set_password(password)
+            return None
+        if not self.user_can_authenticate(user):
+            return None
+        cache = caches['credentials']
+        key = self.cache_key(user, password)
+        #The duration of the check saved by the entry.
+        saved = cache.get(key)
+        if saved is not None:
+            boulangerie.metrics.incr('credentials_cache.hits')
+            boulangerie.metrics.incr('credentials_cache.seconds_saved', saved)
+            return user
+        boulangerie.metrics.incr('credentials_cache.misses')
+        start = time.time()
+        valid = user.check_password(password)
+        elapsed = time.time() - start
+        boulangerie.metrics.timing('credentials.check', elapsed)
+        if not valid:
+            return None
+        #The check may have upgraded the hash.
+        cache.set(self.cache_key(user, password), elapsed)
+        return user
+
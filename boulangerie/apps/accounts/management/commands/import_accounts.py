@@ -0,0 +1,222 @@
+#-*- coding:utf-8 -*-
+"""
+Import accounts in bulk.
+"""
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import sshpubkeys
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.core.validators import validate_email, validate_slug
+from django.db import transaction
+from django.db.models import Q
+from boulangerie.apps.accounts.models import Account
+from boulangerie.apps.accounts.provisioning import create_accounts
+from boulangerie.apps.keys import pool as keypool
+from boulangerie.apps.keys.fingerprints import decode, encode_md5
+from boulangerie.apps.keys.models import KeyPair, SSHKey
+
+def read_rows(stream, fmt):
+    """
+    Stream the rows of a CSV file, with a header, or of a JSON lines file.
+    :rtype: generator
+    """
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield row
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+def validate(row):
+    """
+    Check a row, lower its username.
+    :raises ValidationError: if the row is invalid.
+    """
+    row['username'] = (row.get('username') or '').lower()
+    validate_slug(row['username'])
+    validate_email(row.get('email') or '')
+    if len(row.get('password') or '') < 6:
+        raise ValidationError('Password too short.')
+    if row.get('public_key'):
+        ssh = sshpubkeys.SSHKey()
+        try:
+            ssh.parse(row['public_key'])
+        except (sshpubkeys.InvalidKeyException, NotImplementedError):
+            raise ValidationError('Invalid public key.')
+        row['fingerprint'] = ssh.hash_md5()
+    return row
+
+
+class Command(BaseCommand):
+    """
+    Create the accounts of a file with their default organization, VPC and key, by chunks:
+    one transaction and one INSERT per table for each chunk, the broker events are published
+    after its commit. The number of rows done is saved in the checkpoint after each chunk,
+    an interrupted import resumes from it. The existing accounts are skipped.
+    """
+    help = 'Import accounts from a CSV or a JSON lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The file to import, - for the standard input. '
+                                         'Columns: username, email, password, firstname, lastname, company, public_key.')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default=None,
+                            help='Guessed from the file extension by default.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of rows imported per transaction.')
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                            help='Number of processes hashing the passwords, 0 to hash them inline.')
+        parser.add_argument('--checkpoint', default=None,
+                            help='File keeping the number of rows done.')
+        parser.add_argument('--keys', default=None,
+                            help='Give a key from the keypair pool to the accounts without public_key, '
+                                 'their private keys are appended to this JSON lines file.')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('csv' if options['path'].endswith('.csv') else 'jsonl')
+        stream = sys.stdin if options['path'] == '-' else open(options['path'])
+        done = self.read_checkpoint(options['checkpoint'])
+        self.forget_keys(options['keys'])
+        workers = multiprocessing.Pool(options['workers']) if options['workers'] else None
+        hash_passwords = workers.map if workers else map
+        rows = itertools.islice(read_rows(stream, fmt), done, None)
+        imported = skipped = 0
+        start = time.time()
+        try:
+            while True:
+                chunk = list(itertools.islice(rows, options['chunk_size']))
+                if not chunk:
+                    break
+                created = self.import_chunk(chunk, hash_passwords, options['keys'])
+                imported += created
+                skipped += len(chunk) - created
+                done += len(chunk)
+                self.write_checkpoint(options['checkpoint'], done)
+                self.stdout.write('{0} rows done: {1} imported, {2} skipped, {3:.1f} rows/s.'.format(
+                    done, imported, skipped, (imported + skipped) / (time.time() - start)))
+        finally:
+            if workers:
+                workers.close()
+            if stream is not sys.stdin:
+                stream.close()
+
+    def import_chunk(self, chunk, hash_passwords, keys_path):
+        """
+        Import the valid rows of the chunk that don't exist yet.
+        :returns: The number of accounts created.
+        :rtype: int
+        """
+        rows = []
+        for row in chunk:
+            try:
+                rows.append(validate(row))
+            except ValidationError as error:
+                self.stderr.write('{0}: {1}'.format(row.get('username'), '; '.join(error.messages)))
+        existing = set(itertools.chain.from_iterable(
+            Account.objects.filter(Q(username__in=[row['username'] for row in rows]) |
+                                   Q(email__in=[Account.objects.normalize_email(row['email']) for row in rows]))\
+                           .values_list('username', 'email')))
+        existing.update(encode_md5(md5) for md5 in
+                        SSHKey.objects.filter(md5__in=[decode(row['fingerprint'])[1] for row in rows if 'fingerprint' in row])\
+                                      .values_list('md5', flat=True))
+        accepted = []
+        for row in rows:
+            identifiers = [row['username'], Account.objects.normalize_email(row['email'])]
+            if 'fingerprint' in row:
+                identifiers.append(row['fingerprint'])
+            if existing.intersection(identifiers):
+                self.stderr.write('{0}: already exists.'.format(row['username']))
+                continue
+            existing.update(identifiers)
+            accepted.append(row)
+        passwords = hash_passwords(make_password, [row['password'] for row in accepted])
+        with transaction.atomic():
+            accounts, privates = self.create_chunk(accepted, passwords, keys_path)
+            #Written before the commit: a crash in between leaves keys of accounts not created,
+            #taken out of the pool by the next run, but never loses the keys of created accounts.
+            if privates:
+                self.write_keys(keys_path, privates)
+        return len(accounts)
+
+    @staticmethod
+    def create_chunk(accepted, passwords, keys_path):
+        """
+        Create the accounts, the keypairs given to them are taken out of the pool in the same transaction.
+        :returns: The accounts, and the private keys to write.
+        :rtype: tuple
+        """
+        accounts, keys, privates = [], {}, []
+        for row, password in zip(accepted, passwords):
+            account = Account.objects.build_user(row['email'], None, username=row['username'],
+                                                 firstname=row.get('firstname') or None,
+                                                 lastname=row.get('lastname') or None,
+                                                 company=row.get('company') or None)
+            account.password = password
+            accounts.append(account)
+            if row.get('public_key'):
+                keys[account.username] = SSHKey(name='default', owner=account.username,
+                                                public=row['public_key'], fingerprint=row['fingerprint'])
+            elif keys_path:
+                pair = keypool.take()
+                keys[account.username] = SSHKey(name='default', owner=account.username,
+                                                public=pair.public, fingerprint=pair.fingerprint)
+                privates.append({'username': account.username, 'fingerprint': pair.fingerprint,
+                                 'private': pair.private})
+        create_accounts(accounts, keys)
+        return accounts, privates
+
+    @staticmethod
+    def write_keys(path, privates):
+        """
+        Append the private keys to the file, readable by its owner only, and flush them to the disk.
+        """
+        descriptor = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        with os.fdopen(descriptor, 'a') as output:
+            os.fchmod(descriptor, 0o600)
+            output.write(''.join(json.dumps(private) + '\n' for private in privates))
+            output.flush()
+            os.fsync(descriptor)
+
+    @staticmethod
+    def forget_keys(path, chunk_size=1000):
+        """
+        Delete from the pool the keypairs written by a previous run:
+        the ones of a chunk not committed have been written, they must not be given to another account.
+        """
+        if not path or not os.path.exists(path):
+            return
+        with open(path) as stream:
+            while True:
+                fingerprints = [json.loads(line).get('fingerprint') for line in itertools.islice(stream, chunk_size)]
+                if not fingerprints:
+                    return
+                KeyPair.objects.filter(fingerprint__in=fingerprints).delete()
+
+    @staticmethod
+    def read_checkpoint(path):
+        """
+        The number of rows done by the previous runs.
+        :rtype: int
+        """
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path) as checkpoint:
+            return int(checkpoint.read().strip() or 0)
+
+    @staticmethod
+    def write_checkpoint(path, done):
+        """
+        Save the number of rows done, atomically.
+        """
+        if not path:
+            return
+        with open(path + '.tmp', 'w') as checkpoint:
+            checkpoint.write(str(done))
+        os.rename(path + '.tmp', path)
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_auto_20170517_2054'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='membership_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
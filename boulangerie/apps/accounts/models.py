@@ -2,25 +2,31 @@
 """
 User models.
 """
-from django.db import models
+import collections
+from django.core.cache import caches
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.contrib.auth.models import BaseUserManager
+import boulangerie.metrics
+
+#The fields of an account the token authentication needs, cf `AccountManager.status()`.
+Status = collections.namedtuple('Status', ['membership_version', 'is_admin'])
 
 class AccountManager(BaseUserManager):
     """
     Manager for our Account model.
     Can create quickly user with it.
     """
-    def create_user(self, email, password=None, **kwargs):
+    def build_user(self, email, password=None, **kwargs):
         """
-        Create an user.
+        Build an unsaved user.
         :param email: The user email, required.
         :type email: str
         :param password: The user password, optional(will be generated).
         :type password: None, str
         :param kwargs: Optional parameters (cf `Account`).
         :type kwargs: dict
-        :rtype: None
+        :rtype: Account
         """
         # Ensure that an email address is set
         if not email:
@@ -39,6 +45,20 @@ class AccountManager(BaseUserManager):
         )
 
         account.set_password(password)
+        return account
+
+    def create_user(self, email, password=None, **kwargs):
+        """
+        Create an user.
+        :param email: The user email, required.
+        :type email: str
+        :param password: The user password, optional(will be generated).
+        :type password: None, str
+        :param kwargs: Optional parameters (cf `Account`).
+        :type kwargs: dict
+        :rtype: None
+        """
+        account = self.build_user(email, password, **kwargs)
         account.save()
         return account
 
@@ -51,6 +71,48 @@ class AccountManager(BaseUserManager):
         account.save()
         return account
 
+    def bump_membership_version(self, *usernames):
+        """
+        Increment the membership version of the accounts:
+        the organization claims of their tokens are stale.
+        :param usernames: The accounts which memberships changed.
+        :type usernames: list
+        :rtype: None
+        """
+        self.filter(username__in=usernames).update(membership_version=models.F('membership_version') + 1)
+        self.forget(*usernames)
+
+    def status(self, username):
+        """
+        Retrieve the membership version and the admin flag of an account, kept in the `principal` cache:
+        the token authentication doesn't load the account, cf `boulangerie.apps.accounts.authentication`.
+        :param username: The account username.
+        :type username: str
+        :returns: None if the account doesn't exist: not cached, another worker may create it.
+        :rtype: None, Status
+        """
+        cache = caches['principal']
+        key = u'principal:{0}:status'.format(username)
+        status = cache.get(key)
+        if status is None:
+            boulangerie.metrics.incr('principal_cache.misses')
+            status = self.filter(username=username).values_list('membership_version', 'is_admin').first()
+            if status is not None:
+                cache.set(key, tuple(status))
+        else:
+            boulangerie.metrics.incr('principal_cache.hits')
+        return None if status is None else Status(*status)
+
+    def forget(self, *usernames):#pylint:disable=no-self-use
+        """
+        Drop the cached status of the accounts, right now and once the transaction is committed.
+        Only the cache of this worker is reached, unless it is shared, cf `settings.ACCESS_CACHES`.
+        :rtype: None
+        """
+        keys = [u'principal:{0}:status'.format(username) for username in usernames]
+        caches['principal'].delete_many(keys)
+        transaction.on_commit(lambda: caches['principal'].delete_many(keys))
+
 class Account(AbstractBaseUser, PermissionsMixin):#pylint: disable=abstract-method
     """
     Account model. Inherit of the AbstractBaseUser.
@@ -66,6 +128,8 @@ class Account(AbstractBaseUser, PermissionsMixin):#pylint: disable=abstract-meth
     date_modified = models.DateTimeField(auto_now=True)
 
     is_admin = models.BooleanField(default=False)
+    #Incremented on each change of the memberships, cf `boulangerie.apps.accounts.tokens`.
+    membership_version = models.PositiveIntegerField(default=0)
 
     objects = AccountManager()
 
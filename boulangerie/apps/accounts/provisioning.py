@@ -0,0 +1,79 @@
+#-*- coding:utf-8 -*-
+"""
+Provisioning of the new accounts: their default organization, member, VPC and SSH key.
+The rows are created with one INSERT per table, whatever the number of accounts,
+instead of a chain of `post_save` receivers.
+"""
+from django.db import transaction
+import boulangerie.broker
+
+def default_organization(username):
+    """
+    The name of the default organization of an account.
+    :rtype: str
+    """
+    return u'{0}-default'.format(username)
+
+def provision(usernames, keys=None):
+    """
+    Create the default bundle of the saved accounts.
+    The receivers of these rows are not called: the caches and the events are handled here,
+    the quotas usages are counted by their first reservation.
+    The events are published after the commit of the outermost transaction,
+    by the batch of the request if any, cf `boulangerie.broker.Batch.close`.
+    :param usernames: The accounts to provision.
+    :type usernames: list
+    :param keys: The unsaved default key of the accounts, by username: their digests are computed if missing.
+    :type keys: dict
+    :rtype: None
+    """
+    from boulangerie.apps.keys import authorization, export, fingerprints
+    from boulangerie.apps.keys.models import SSHKey
+    from boulangerie.apps.organizations.models import Member, Organization
+    from boulangerie.apps.vpcs.models import VPC
+    keys = keys or {}
+    with transaction.atomic(), boulangerie.broker.batch():
+        Organization.objects.bulk_create([
+            Organization(name=default_organization(username), description='default', deletable=False)
+            for username in usernames])
+        Member.objects.bulk_create([
+            Member(account=username, organization_id=default_organization(username), is_owner=True, is_admin=True)
+            for username in usernames])
+        VPC.objects.bulk_create([
+            VPC(name='default', owner=default_organization(username), deletable=False)
+            for username in usernames])
+        created = [keys[username] for username in usernames if username in keys]
+        for key in created:
+            if not key.sha256:
+                key.md5, key.sha256 = fingerprints.digests(key.public)
+        SSHKey.objects.bulk_create(created)
+        #A denial may be cached for a key registered before.
+        authorization.invalidate(keys=created)
+        export.journal(*[key.owner for key in created])
+        for username in usernames:
+            Organization.objects.invalidate(default_organization(username), username)
+            #The git event carries the account and its default organization with the key.
+            if username in keys:
+                payload = {'key': keys[username].public, 'user': username,
+                           'user_creation': True, 'organization_creation': True,
+                           'organization': default_organization(username)}
+                boulangerie.broker.send(payload, 'create-key', 'git', aggregate=username)
+            payload = {'namespace': u'{0}-default'.format(default_organization(username))}
+            boulangerie.broker.send(payload, 'create', 'namespace', aggregate=default_organization(username))
+
+def create_accounts(accounts, keys=None):
+    """
+    Create the accounts and their default bundle, within one transaction.
+    :param accounts: The unsaved accounts, cf `AccountManager.build_user`.
+    :type accounts: list
+    :param keys: The unsaved default key of the accounts, by username.
+    :type keys: dict
+    :returns: The accounts.
+    :rtype: list
+    """
+    from .models import Account
+    with transaction.atomic():
+        Account.objects.bulk_create(accounts)
+        Account.objects.forget(*[account.username for account in accounts])
+        provision([account.username for account in accounts], keys)
+    return accounts
@@ -4,7 +4,7 @@ Signal handler for keys.
 """
 import boulangerie.broker
 from django.dispatch import receiver
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, post_save
 from .models import Account
 
 @receiver(post_delete, sender=Account)
@@ -21,4 +21,20 @@ def delete_user(sender, instance, **kwargs):#pylint:disable=unused-argument
     :rtype:None
     """
     payload = {'user': instance.username}
-    boulangerie.broker.send(payload, 'delete-user', 'git')
+    boulangerie.broker.send(payload, 'delete-user', 'git', aggregate=instance.username)
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def forget_user(sender, instance, **kwargs):#pylint:disable=unused-argument
+    """
+    When saving or deleting an user,
+    we need to drop its cached status.
+    :param sender: The signal sender.
+    :type sender: boulangerie.apps.accounts.models.Account
+    :param instance: The signal sender instance.
+    :type instance: boulangerie.apps.accounts.models.Account
+    :param kwargs: Context.
+    :type kwargs: django.db.models.base.ModelBase
+    :rtype:None
+    """
+    Account.objects.forget(instance.username)
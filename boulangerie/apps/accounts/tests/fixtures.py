@@ -10,50 +10,55 @@ from boulangerie.apps.accounts.models import Account as User
 pytestmark = pytest.mark.django_db#pylint:disable=invalid-name
 
 @pytest.fixture
-def user_factory():
+def user_factory(commit):
     """
     Create a dummy user.
     """
     def factory(name):
         infos = {'username':name, 'email':'%s@test.org' % name, 'password':'password'}
         created = User.objects.create_user(**infos)
+        commit()
         return infos
     return factory
 
 @pytest.fixture
-def user1():
+def user1(commit):
     """
     Create a dummy user.
     """
     infos = {'username':'user1', 'email':'user1@test.org', 'password':'password'}
     created = User.objects.create_user(**infos)
+    commit()
     return infos
 
 @pytest.fixture
-def user2():
+def user2(commit):
     """
     Create another dummy user.
     """
     infos = {'username':'user2', 'email':'user2@test.org', 'password':'password'}
     User.objects.create_user(**infos)
+    commit()
     return infos
 
 @pytest.fixture
-def user3():
+def user3(commit):
     """
     Create another dummy user.
     """
     infos = {'username':'user3', 'email':'user3@test.org', 'password':'password'}
     User.objects.create_user(**infos)
+    commit()
     return infos
 
 @pytest.fixture
-def admin1():
+def admin1(commit):
     """
     Create an admin user.
     """
     infos = {'username':'admin1', 'email':'admin1@test.org', 'password':'password'}
     User.objects.create_superuser(**infos)
+    commit()
     return infos
 
 @pytest.fixture
@@ -0,0 +1,73 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the token authentication.
+"""
+#pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,invalid-name,no-member
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from boulangerie.apps.accounts.authentication import Principal
+from boulangerie.apps.accounts.models import Status
+from .fixtures import *
+
+def account_queries(context):
+    """
+    The queries on the accounts table.
+    """
+    return [query for query in context.captured_queries if 'accounts_account' in query['sql']]
+
+def test_no_account_query(user1, login):
+    """
+    Once its status is cached, the authenticated requests don't read the account.
+    """
+    token = login(user1)
+    client = APIClient()
+    response = client.get('/api/0.1/keys/', HTTP_AUTHORIZATION='JWT {}'.format(token))
+    assert response.status_code == 200
+    with CaptureQueriesContext(connection) as context:
+        response = client.get('/api/0.1/keys/', HTTP_AUTHORIZATION='JWT {}'.format(token))
+        assert response.status_code == 200
+    assert not account_queries(context)
+
+def test_deleted_account(user1, login):
+    """
+    The tokens of a deleted account are rejected.
+    """
+    token = login(user1)
+    client = APIClient()
+    response = client.get('/api/0.1/keys/', HTTP_AUTHORIZATION='JWT {}'.format(token))
+    assert response.status_code == 200
+    User.objects.filter(username='user1').delete()
+    response = client.get('/api/0.1/keys/', HTTP_AUTHORIZATION='JWT {}'.format(token))
+    assert response.status_code == 403
+
+def test_principal_lazy(user1):
+    """
+    The account is loaded on the first access to a field other than the username.
+    """
+    principal = Principal('user1', {}, Status(0, False))
+    with CaptureQueriesContext(connection) as context:
+        assert principal.username == 'user1'
+        assert principal.is_authenticated()
+        assert not principal.is_staff
+    assert not context.captured_queries
+    assert principal.email == 'user1@test.org'
+    assert principal == User.objects.get(username='user1')
+
+def test_status_workers(tmpdir, user1, monkeypatch):
+    """
+    With a shared backend, the status forgotten by a worker is reloaded by the others,
+    a missing account isn't cached: it may be created by another worker.
+    """
+    from django.core.cache.backends.filebased import FileBasedCache
+    import boulangerie.apps.accounts.models
+    workers = [{'principal': FileBasedCache(str(tmpdir), {})} for _ in range(2)]
+    monkeypatch.setattr(boulangerie.apps.accounts.models, 'caches', workers[1])
+    assert User.objects.status('user1') == (0, False)
+    assert User.objects.status('user2') is None
+    monkeypatch.setattr(boulangerie.apps.accounts.models, 'caches', workers[0])
+    User.objects.bump_membership_version('user1')
+    User.objects.create_user(username='user2', email='user2@test.org', password='password')
+    monkeypatch.setattr(boulangerie.apps.accounts.models, 'caches', workers[1])
+    assert User.objects.status('user1') == (1, False)
+    assert User.objects.status('user2') == (0, False)
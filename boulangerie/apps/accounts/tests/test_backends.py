@@ -0,0 +1,60 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the cached authentication backend.
+"""
+#pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,invalid-name,no-member
+import base64
+from rest_framework.test import APIClient
+import boulangerie.metrics
+from .fixtures import *
+
+def basic(username, password):
+    """
+    The Basic authorization header.
+    """
+    return 'Basic {0}'.format(base64.b64encode('{0}:{1}'.format(username, password).encode('utf-8')).decode('ascii'))
+
+def counters():
+    """
+    The credentials cache counters.
+    """
+    current = boulangerie.metrics.snapshot()['counters']
+    return current.get('credentials_cache.hits', 0), current.get('credentials_cache.misses', 0)
+
+def test_basic_cached(user1):
+    """
+    The password is checked once, then the credentials are read from the cache.
+    """
+    client = APIClient()
+    hits, misses = counters()
+    for _ in range(3):
+        response = client.get('/api/0.1/keys/', HTTP_AUTHORIZATION=basic('user1', 'password'))
+        assert response.status_code == 200
+    assert counters() == (hits + 2, misses + 1)
+    assert boulangerie.metrics.snapshot()['counters']['credentials_cache.seconds_saved'] > 0
+
+def test_basic_wrong_password(user1):
+    """
+    The failed checks are not cached.
+    """
+    client = APIClient()
+    hits, misses = counters()
+    for _ in range(2):
+        response = client.get('/api/0.1/keys/', HTTP_AUTHORIZATION=basic('user1', 'wrong'))
+        assert response.status_code == 403
+    assert counters() == (hits, misses + 2)
+
+def test_password_change(user1):
+    """
+    Once the password changes, the cached credentials don't match anymore.
+    """
+    client = APIClient()
+    response = client.get('/api/0.1/keys/', HTTP_AUTHORIZATION=basic('user1', 'password'))
+    assert response.status_code == 200
+    account = User.objects.get(username='user1')
+    account.set_password('new_password')
+    account.save()
+    response = client.get('/api/0.1/keys/', HTTP_AUTHORIZATION=basic('user1', 'password'))
+    assert response.status_code == 403
+    response = client.get('/api/0.1/keys/', HTTP_AUTHORIZATION=basic('user1', 'new_password'))
+    assert response.status_code == 200
@@ -0,0 +1,114 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the accounts import.
+"""
+#pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,invalid-name,no-member
+import json
+import os
+import stat
+import mock
+from Crypto.PublicKey import RSA
+from django.core.management import call_command
+from django.utils.six import StringIO
+from boulangerie.apps.accounts.management.commands.import_accounts import Command
+from boulangerie.apps.keys import pool
+from boulangerie.apps.keys.models import SSHKey
+from boulangerie.apps.organizations.models import Organization
+from boulangerie.apps.vpcs.models import VPC
+from .fixtures import *
+
+def run(path, **options):
+    """
+    Run the import, return its output.
+    """
+    stdout, stderr = StringIO(), StringIO()
+    call_command('import_accounts', str(path), workers=0, stdout=stdout, stderr=stderr, **options)
+    return stdout.getvalue(), stderr.getvalue()
+
+def test_import_csv(tmpdir, user1, broker_namespace_create, commit):
+    """
+    The valid and new rows are imported with their default organization and VPC.
+    """
+    queue, _ = broker_namespace_create
+    path = tmpdir.join('accounts.csv')
+    path.write('username,email,password,firstname\n'
+               'Alice,alice@test.org,password,Alice\n'
+               'user1,user1-bis@test.org,password,\n'
+               'bob,bob@test.org,short,\n'
+               'carol,carol@test.org,password,\n')
+    stdout, stderr = run(path, chunk_size=2)
+    assert '4 rows done: 2 imported, 2 skipped' in stdout
+    assert 'user1: already exists.' in stderr
+    assert 'bob: Password too short.' in stderr
+    alice = User.objects.get(username='alice')
+    assert alice.firstname == 'Alice'
+    assert alice.check_password('password')
+    assert Organization.objects.has_member('alice-default', 'alice', is_owner=True)
+    assert VPC.objects.filter(owner='carol-default').exists()
+    assert not User.objects.filter(username='bob').exists()
+    commit()
+    namespaces = [json.loads(message.body)['namespace'] for message in queue.consume()]
+    assert namespaces == ['user1-default-default', 'alice-default-default', 'carol-default-default']
+
+def test_import_checkpoint(tmpdir):
+    """
+    An import resumes from its checkpoint.
+    """
+    path = tmpdir.join('accounts.jsonl')
+    checkpoint = tmpdir.join('checkpoint')
+    checkpoint.write('1')
+    path.write('\n'.join(json.dumps({'username': name, 'email': '{0}@test.org'.format(name), 'password': 'password'})
+                         for name in ('alice', 'bob', 'carol')))
+    stdout, _ = run(path, checkpoint=str(checkpoint))
+    assert '3 rows done: 2 imported, 0 skipped' in stdout
+    assert checkpoint.read() == '3'
+    assert sorted(User.objects.values_list('username', flat=True)) == ['bob', 'carol']
+    stdout, _ = run(path, checkpoint=str(checkpoint))
+    assert not stdout
+
+def test_import_keys(tmpdir, settings):
+    """
+    The public keys are imported, the other accounts get a keypair from the pool.
+    """
+    settings.KEYPOOL = dict(settings.KEYPOOL, bits=1024)
+    public = RSA.generate(1024).publickey().exportKey('OpenSSH')
+    path = tmpdir.join('accounts.jsonl')
+    keys = tmpdir.join('keys.jsonl')
+    path.write(json.dumps({'username': 'alice', 'email': 'alice@test.org', 'password': 'password', 'public_key': public}) + '\n' +
+               json.dumps({'username': 'bob', 'email': 'bob@test.org', 'password': 'password'}) + '\n')
+    run(path, keys=str(keys))
+    assert SSHKey.objects.get(owner='alice').public == public
+    private = json.loads(keys.read())
+    assert private['username'] == 'bob'
+    assert RSA.importKey(private['private']).publickey().exportKey('OpenSSH') == SSHKey.objects.get(owner='bob').public
+    assert private['fingerprint'] == SSHKey.objects.get(owner='bob').fingerprint
+    assert stat.S_IMODE(os.stat(str(keys)).st_mode) == 0o600
+
+def test_import_keys_interrupted(tmpdir, settings, monkeypatch):
+    """
+    The keypair of an account is taken out of the pool with it, its private key is written before the commit.
+    An interrupted chunk leaves its keys written and in the pool: the next run takes them out of it.
+    """
+    settings.KEYPOOL = dict(settings.KEYPOOL, bits=1024)
+    pool.fill(size=2)
+    path = tmpdir.join('accounts.jsonl')
+    keys = tmpdir.join('keys.jsonl')
+    path.write(json.dumps({'username': 'bob', 'email': 'bob@test.org', 'password': 'password'}) + '\n')
+    monkeypatch.setattr(Command, 'write_keys', mock.Mock(side_effect=IOError))
+    with pytest.raises(IOError):
+        run(path, keys=str(keys))
+    assert (pool.depth(), User.objects.filter(username='bob').exists()) == (2, False)
+    monkeypatch.undo()
+    write_keys = Command.write_keys
+    def crash(path, privates):#pylint:disable=missing-docstring
+        write_keys(path, privates)
+        raise IOError()
+    monkeypatch.setattr(Command, 'write_keys', staticmethod(crash))
+    with pytest.raises(IOError):
+        run(path, keys=str(keys))
+    assert (pool.depth(), User.objects.filter(username='bob').exists()) == (2, False)
+    interrupted = json.loads(keys.read())['fingerprint']
+    monkeypatch.undo()
+    run(path, keys=str(keys))
+    assert pool.depth() == 0
+    assert SSHKey.objects.get(owner='bob').fingerprint != interrupted
@@ -0,0 +1,84 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the accounts provisioning.
+"""
+#pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,invalid-name,no-member
+import json
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+import boulangerie.broker
+from boulangerie.apps.accounts.provisioning import create_accounts
+from boulangerie.apps.keys.models import SSHKey
+from boulangerie.apps.organizations.models import Member, Organization
+from boulangerie.apps.vpcs.models import VPC
+from .fixtures import *
+
+def inserts(context):
+    """
+    The tables inserted into.
+    """
+    return sorted(query['sql'].split('"')[1] for query in context.captured_queries if query['sql'].startswith('INSERT'))
+
+def test_register_inserts(broker_git_create_key, broker_namespace_create):
+    """
+    The registration creates the account and its default bundle with one INSERT per table.
+    """
+    queue, _ = broker_git_create_key
+    queue2, _ = broker_namespace_create
+    client = APIClient()
+    body = {'username':'username', 'password':'password', 'confirm_password': 'password', 'email': 'username@test.org'}
+    with CaptureQueriesContext(connection) as context:
+        response = client.post('/api/0.1/accounts/register/', body, format='json')
+        assert response.status_code == 201
+    assert inserts(context) == ['accounts_account', 'keys_keychange', 'keys_sshkey', 'organizations_member',
+                                'organizations_organization', 'vpcs_vpc']
+    assert len(queue) == 1
+    assert len(queue2) == 1
+
+def test_create_accounts(broker_git_create_key, broker_namespace_create, commit):
+    """
+    Many accounts are provisioned with the same number of INSERTs.
+    """
+    queue, _ = broker_git_create_key
+    queue2, _ = broker_namespace_create
+    accounts = [User.objects.build_user('user{0}@test.org'.format(i), 'password', username='user{0}'.format(i)) for i in range(3)]
+    keys = {'user0': SSHKey(name='default', owner='user0', public='ssh-rsa AAAA user0', fingerprint='MD5:00')}
+    with CaptureQueriesContext(connection) as context:
+        create_accounts(accounts, keys)
+    assert len(inserts(context)) == 6
+    for i in range(3):
+        assert Organization.objects.has_member('user{0}-default'.format(i), 'user{0}'.format(i), is_owner=True)
+        assert VPC.objects.filter(owner='user{0}-default'.format(i), name='default').exists()
+    assert list(SSHKey.objects.values_list('owner', flat=True)) == ['user0']
+    commit()
+    msg = json.loads(next(queue.consume()).body)
+    assert msg == {'user': 'user0', 'key': 'ssh-rsa AAAA user0', 'user_creation': True, 'organization_creation': True, 'organization': 'user0-default'}
+    assert len(queue2) == 3
+
+def test_create_accounts_rollback(broker_git_create_key, broker_namespace_create, commit):
+    """
+    The events are not published before the commit of the outermost transaction, nor after its rollback.
+    """
+    queue, _ = broker_git_create_key
+    queue2, _ = broker_namespace_create
+    keys = {'user0': SSHKey(name='default', owner='user0', public='ssh-rsa AAAA user0', fingerprint='MD5:00')}
+    with boulangerie.broker.batch():
+        with pytest.raises(ValueError):
+            with transaction.atomic():
+                create_accounts([User.objects.build_user('user0@test.org', 'password', username='user0')], keys)
+                assert (len(queue), len(queue2)) == (0, 0)
+                raise ValueError()
+    commit()
+    assert (len(queue), len(queue2)) == (0, 0)
+    assert not User.objects.filter(username='user0').exists()
+
+def test_create_user(user1):
+    """
+    The accounts created outside of the registration are provisioned too.
+    """
+    member = Member.objects.get(account='user1')
+    assert member.organization_id == 'user1-default'
+    assert member.is_owner and member.is_admin
+    assert not Organization.objects.get(name='user1-default').deletable
+    assert VPC.objects.filter(owner='user1-default', name='default').exists()
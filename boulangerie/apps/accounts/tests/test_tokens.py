@@ -0,0 +1,100 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the JWT organization claims.
+"""
+#pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,invalid-name,no-member,unused-import
+import time
+import pytest
+import rest_framework_jwt.serializers
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_jwt.utils import jwt_decode_handler
+from boulangerie.apps.accounts.tokens import payload_handler
+from boulangerie.apps.organizations.tests.fixtures import member_factory, orga_factory
+from boulangerie.apps.projects.tests.fixtures import project_factory
+from .fixtures import *
+
+@pytest.fixture
+def claims(monkeypatch):
+    """
+    Enable the organization claims.
+    """
+    monkeypatch.setattr(rest_framework_jwt.serializers, 'jwt_payload_handler', payload_handler)
+
+def test_claims(claims, user1, user2, login, orga_factory, member_factory):
+    """
+    The token carries the roles of the account, and its membership version.
+    """
+    token1 = login(user1)
+    orga_factory('my_orga', token1)
+    member_factory('my_orga', user2, token1)
+    payload = jwt_decode_handler(login(user2))
+    assert payload['orgs'] == {'user2-default': 'owner', 'my_orga': 'member'}
+    assert payload['mv'] == User.objects.get(username='user2').membership_version
+
+def test_claims_no_member_query(claims, user1, login, project_factory):
+    """
+    With current claims, the permissions don't look up the memberships.
+    """
+    token = login(user1)
+    project_factory('my_project', token, 'user1-default')
+    caches['membership'].clear()
+    client = APIClient()
+    with CaptureQueriesContext(connection) as context:
+        response = client.get('/api/0.1/projects/user1-default/my_project/', HTTP_AUTHORIZATION='JWT {}'.format(token))
+        assert response.status_code == 200
+        response = client.get('/api/0.1/projects/user2-default/', HTTP_AUTHORIZATION='JWT {}'.format(token))
+        assert response.status_code == 403
+    assert not [query for query in context.captured_queries if 'organizations_member' in query['sql']]
+
+def test_claims_revoked(claims, user1, user2, login, orga_factory, member_factory, project_factory):
+    """
+    When a member is removed, the claims of its token are stale: the database is checked.
+    """
+    token1 = login(user1)
+    orga_factory('my_orga', token1)
+    member_factory('my_orga', user2, token1)
+    project_factory('my_project', token1, 'my_orga')
+    token2 = login(user2)
+    client = APIClient()
+    response = client.get('/api/0.1/projects/my_orga/my_project/', HTTP_AUTHORIZATION='JWT {}'.format(token2))
+    assert response.status_code == 200
+    response = client.delete('/api/0.1/members/my_orga/user2/', HTTP_AUTHORIZATION='JWT {}'.format(token1))
+    assert response.status_code == 204
+    response = client.get('/api/0.1/projects/my_orga/my_project/', HTTP_AUTHORIZATION='JWT {}'.format(token2))
+    assert response.status_code == 403
+
+@pytest.mark.parametrize('shared', [True, False])
+def test_claims_revoked_workers(shared, tmpdir, monkeypatch, claims, user1, user2, login, orga_factory, member_factory, project_factory):
+    """
+    A member removed on a worker is revoked on the others once their principal cache is current:
+    right away with a shared cache, when the entry expires with a cache per worker.
+    """
+    from django.core.cache.backends.filebased import FileBasedCache
+    import django.core.cache.backends.locmem
+    import boulangerie.apps.accounts.models
+    from boulangerie.cache import LRUCache
+    if shared:
+        workers = [{'principal': FileBasedCache(str(tmpdir), {})} for _ in range(2)]
+    else:
+        workers = [{'principal': LRUCache('principal-worker{0}'.format(index), {'TIMEOUT': 5})} for index in range(2)]
+    def on(worker):#pylint:disable=missing-docstring
+        monkeypatch.setattr(boulangerie.apps.accounts.models, 'caches', workers[worker])
+    token1 = login(user1)
+    orga_factory('my_orga', token1)
+    member_factory('my_orga', user2, token1)
+    project_factory('my_project', token1, 'my_orga')
+    token2 = login(user2)
+    client = APIClient()
+    path = '/api/0.1/projects/my_orga/my_project/'
+    on(1)
+    assert client.get(path, HTTP_AUTHORIZATION='JWT {}'.format(token2)).status_code == 200
+    on(0)
+    assert client.delete('/api/0.1/members/my_orga/user2/', HTTP_AUTHORIZATION='JWT {}'.format(token1)).status_code == 204
+    on(1)
+    assert client.get(path, HTTP_AUTHORIZATION='JWT {}'.format(token2)).status_code == (403 if shared else 200)
+    now = time.time()
+    monkeypatch.setattr(django.core.cache.backends.locmem.time, 'time', lambda: now + 6)
+    assert client.get(path, HTTP_AUTHORIZATION='JWT {}'.format(token2)).status_code == 403
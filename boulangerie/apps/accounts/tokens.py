@@ -0,0 +1,58 @@
+#-*- coding:utf-8 -*-
+"""
+JWT with organization claims:
+the token carries the roles of the account in its organizations,
+and the membership version of the account when they were read.
+The claims are trusted as long as the version is current,
+which the authentication already reads with the status of the account
+(cf `boulangerie.apps.accounts.authentication`): from the `principal` cache,
+the other workers see a new version once their entry expires, unless the cache is shared.
+"""
+from rest_framework_jwt.utils import jwt_payload_handler
+
+#Beyond this number of organizations, the claims are left out of the token.
+MAX_ORGANIZATIONS = 100
+
+def get_role(is_admin, is_owner):
+    """
+    :returns: The role claim: owner, admin or member.
+    :rtype: str
+    """
+    if is_owner:
+        return 'owner'
+    if is_admin:
+        return 'admin'
+    return 'member'
+
+def payload_handler(user):
+    """
+    Build the JWT payload, with the organization claims.
+    Enabled by the `jwt_claims` option of the security section.
+    :param user: The account to build the token for.
+    :type user: boulangerie.apps.accounts.models.Account
+    :rtype: dict
+    """
+    from boulangerie.apps.organizations.models import Member
+    payload = jwt_payload_handler(user)
+    memberships = Member.objects.filter(account=user.username)\
+                                .values_list('organization', 'is_admin', 'is_owner')[:MAX_ORGANIZATIONS + 1]
+    if len(memberships) <= MAX_ORGANIZATIONS:
+        payload['orgs'] = dict((name, get_role(is_admin, is_owner)) for name, is_admin, is_owner in memberships)
+        payload['mv'] = user.membership_version
+    return payload
+
+def get_claims(request):
+    """
+    Retrieve the organization claims of the request token.
+    :param request: The authenticated request.
+    :type request: rest_framework.request.Request
+    :returns: The role by organization, None if there is no claim or if they are stale,
+              as far as the `principal` cache of this worker knows.
+    :rtype: None, dict
+    """
+    payload = getattr(request.user, 'jwt_payload', None)
+    if not payload or 'orgs' not in payload:
+        return None
+    if payload.get('mv') != request.user.membership_version:
+        return None
+    return payload['orgs']
@@ -2,15 +2,14 @@
 """
 Account views.
 """
-import sshpubkeys
-from Crypto.PublicKey import RSA
-from django.contrib.contenttypes.models import ContentType
 from rest_framework import status
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from boulangerie.apps.keys import pool
 from boulangerie.apps.keys.models import SSHKey
 from .models import Account
+from .provisioning import create_accounts
 from .serializers import AccountSerializer
 
 class AccountRegister(APIView):
@@ -23,26 +22,24 @@ class AccountRegister(APIView):
     def post(self, request, **kwargs):#pylint:disable=all
         if hasattr(request.data, '_mutable'):
             request.data._mutable = True#pylint:disable=protected-access
-        #1. Create the account
+        #1. Validate the account
         serializer = self.serializer_class(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        #2. Create it's SSH key
-        account = Account.objects.get(username=serializer.data['username'],
-                                      email=serializer.data['email'])
-        key = RSA.generate(4096)
+        account = Account.objects.build_user(**serializer.validated_data)
+        #2. Take it's SSH key from the pool
+        key = pool.take()
         model = SSHKey(
             name='default',
             owner=account.username,
-            public=key.exportKey('OpenSSH'),
-            fingerprint=sshpubkeys.SSHKey(key.exportKey('OpenSSH')).hash_md5()
+            public=key.public,
+            fingerprint=key.fingerprint
         )
-        model.user_creation = True
-        model.organization_creation = True
-        model.save()
+        #3. Create them with the default organization
+        create_accounts([account], {account.username: model})
+        serializer.instance = account
         key = {
             'name': model.name,
-            'private': key.exportKey('PEM'),
+            'private': key.private,
             'public': model.public,
             'fingerprint': model.fingerprint
         }
@@ -12,8 +12,11 @@ class BuildsConfig(AppConfig):
 
     def ready(self):
         """
-        Import the builds signal handlers.
+        Import the builds signal handlers, and expose the staleness of the read model.
         """
         import boulangerie.apps.builds.signals
+        import boulangerie.metrics
+        from boulangerie.apps.builds import readmodel
+        boulangerie.metrics.probe('builds.staleness', readmodel.staleness)
         import farine.settings
         farine.settings.load()
@@ -0,0 +1,18 @@
+#-*- coding:utf-8 -*-
+"""
+Consume the build steps published by cuisson into the read model.
+"""
+from boulangerie.apps.builds import readmodel
+from boulangerie.readmodels import ConsumeCommand
+
+
+class Command(ConsumeCommand):
+    """
+    Apply the build steps from a durable queue bound to the cuisson exchange, cf `ConsumeCommand`.
+    """
+    help = 'Apply the build steps published by cuisson to the read model.'
+    service = 'cuisson'
+    readmodel = readmodel
+    settings_name = 'BUILDS'
+    metric = 'builds'
+    noun = 'build step'
@@ -0,0 +1,19 @@
+#-*- coding:utf-8 -*-
+"""
+Backfill the read model of the builds from cuisson, or catch up after a consumer outage.
+"""
+from boulangerie.apps.builds import readmodel
+from boulangerie.apps.builds.models import Build
+from boulangerie.readmodels import SyncCommand
+
+
+class Command(SyncCommand):
+    """
+    Apply the steps of the builds missing or behind their latest step, cf `SyncCommand`.
+    """
+    help = 'Backfill the builds read model from cuisson.'
+    service = 'cuisson'
+    readmodel = readmodel
+    model = Build
+    version = 'step_id'
+    noun = 'builds'
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Build',
+            fields=[
+                ('uid', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('organization', models.SlugField(db_index=False)),
+                ('repo', models.CharField(max_length=100)),
+                ('branch', models.CharField(max_length=255)),
+                ('step_id', models.BigIntegerField()),
+                ('step', models.CharField(max_length=50)),
+                ('fail', models.BooleanField(default=False)),
+                ('tag_uri', models.TextField(null=True)),
+                ('context', models.TextField(default='{}')),
+                ('date_created', models.DateTimeField()),
+                ('date_updated', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ('-date_created',),
+            },
+        ),
+        migrations.CreateModel(
+            name='BuildStep',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('step', models.CharField(max_length=50)),
+                ('fail', models.BooleanField(default=False)),
+                ('tag_uri', models.TextField(null=True)),
+                ('context', models.TextField(default='{}')),
+                ('date_created', models.DateTimeField()),
+                ('build', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='steps', to='builds.Build')),
+            ],
+            options={
+                'ordering': ('-id',),
+            },
+        ),
+        migrations.CreateModel(
+            name='BuildSync',
+            fields=[
+                ('organization', models.SlugField(primary_key=True, serialize=False)),
+                ('date_synced', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='build',
+            index=models.Index(fields=['organization', '-date_created'], name='build_orga_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='build',
+            index=models.Index(fields=['date_updated'], name='build_updated_idx'),
+        ),
+    ]
@@ -1,6 +1,67 @@
 # -*- coding: utf-8 -*-
+"""
+Read model of the builds, fed by the cuisson events, cf `boulangerie.apps.builds.readmodel`.
+"""
 from __future__ import unicode_literals
 
 from django.db import models
 
-# Create your models here.
+
+class Build(models.Model):
+    """
+    Build model, one row per build with its latest step:
+        * uid : the build identifier, given by cuisson.
+        * organization : the owner of the build.
+        * step_id, step, fail, tag_uri, context, date_updated : the latest step.
+        * date_created : the date of the first step.
+    """
+    uid = models.CharField(primary_key=True, max_length=32)
+    organization = models.SlugField(null=False, max_length=50, db_index=False)
+    repo = models.CharField(max_length=100)
+    branch = models.CharField(max_length=255)
+    step_id = models.BigIntegerField()
+    step = models.CharField(max_length=50)
+    fail = models.BooleanField(default=False)
+    tag_uri = models.TextField(null=True)
+    context = models.TextField(default='{}')
+    date_created = models.DateTimeField()
+    date_updated = models.DateTimeField()
+
+    class Meta:#pylint:disable=old-style-class,no-init,too-few-public-methods
+        """
+        The builds of an organization, latest first.
+        """
+        ordering = ('-date_created',)
+        indexes = [models.Index(fields=['organization', '-date_created'], name='build_orga_created_idx'),
+                   #The staleness of the read model: the latest step applied.
+                   models.Index(fields=['date_updated'], name='build_updated_idx')]
+
+
+class BuildStep(models.Model):
+    """
+    BuildStep model, the steps of a build:
+        * id : the step identifier, given by cuisson.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    build = models.ForeignKey(Build, related_name='steps', on_delete=models.CASCADE)
+    step = models.CharField(max_length=50)
+    fail = models.BooleanField(default=False)
+    tag_uri = models.TextField(null=True)
+    context = models.TextField(default='{}')
+    date_created = models.DateTimeField()
+
+    class Meta:#pylint:disable=old-style-class,no-init,too-few-public-methods
+        """
+        Latest first, as cuisson does.
+        """
+        ordering = ('-id',)
+
+
+class BuildSync(models.Model):
+    """
+    BuildSync model, the organizations whose builds are all in the read model:
+    backfilled by `boulangerie sync_builds`, or known without builds.
+    Their builds are listed locally, the other ones through cuisson.
+    """
+    organization = models.SlugField(null=False, max_length=50, primary_key=True)
+    date_synced = models.DateTimeField(auto_now=True)
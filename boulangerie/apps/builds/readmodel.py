@@ -0,0 +1,155 @@
+#-*- coding:utf-8 -*-
+"""
+Read model of the builds: the steps published by cuisson are applied to the `Build` and `BuildStep`
+tables, and the builds are served from them in the format of the cuisson RPC methods:
+`{'count', 'previous', 'next', 'results'}`, the results being the JSON encoded steps.
+Cuisson remains the fallback: for the organizations not synchronized yet, cf `BuildSync`,
+and for the builds not applied yet.
+"""
+import json
+from django.db import transaction
+from django.utils import dateparse, timezone
+import boulangerie.metrics
+import boulangerie.results
+from .models import Build, BuildStep, BuildSync
+
+#The fields of a step.
+FIELDS = ('id', 'uid', 'owner', 'repo', 'branch', 'step', 'fail', 'tag_uri', 'date_created')
+
+def parse(step):
+    """
+    Decode a step of cuisson, from an event or a RPC result.
+    :param step: The step, JSON encoded or not.
+    :type step: str, dict
+    :rtype: dict
+    """
+    if not isinstance(step, dict):
+        step = json.loads(step)
+    date = dateparse.parse_datetime(step['date_created'])
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.utc)
+    return dict(step, date_created=date)
+
+def encode(build, step):
+    """
+    Encode a step as cuisson does.
+    :param build: The build of the step.
+    :type build: Build
+    :param step: The step, or the build itself for its latest step.
+    :type step: BuildStep, Build
+    :rtype: str
+    """
+    date = step.date_updated if isinstance(step, Build) else step.date_created
+    return json.dumps({'id': step.step_id if isinstance(step, Build) else step.id,
+                       'uid': build.uid, 'owner': build.organization, 'repo': build.repo, 'branch': build.branch,
+                       'step': step.step, 'fail': step.fail, 'tag_uri': step.tag_uri,
+                       'context': json.loads(step.context),
+                       'date_created': timezone.make_naive(date, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')})
+
+def apply(steps):
+    """
+    Apply the steps of cuisson: idempotent, and in any order. The cached details of their builds are dropped.
+    :param steps: The steps, cf `parse()`.
+    :type steps: list
+    :returns: The steps, parsed.
+    :rtype: list
+    """
+    steps = [parse(step) for step in steps]
+    for step in steps:
+        fields = {'step': step['step'], 'fail': bool(step['fail']), 'tag_uri': step['tag_uri'],
+                  'context': json.dumps(step.get('context') or {})}
+        with transaction.atomic():
+            build, created = Build.objects.select_for_update().get_or_create(
+                uid=step['uid'],
+                defaults=dict(fields, organization=step['owner'], repo=step['repo'], branch=step['branch'],
+                              step_id=step['id'], date_created=step['date_created'],
+                              date_updated=step['date_created']))
+            BuildStep.objects.update_or_create(id=step['id'], defaults=dict(fields, build=build,
+                                                                            date_created=step['date_created']))
+            if created:
+                continue
+            updates = {}
+            if step['id'] >= build.step_id:
+                updates = dict(fields, step_id=step['id'], date_updated=step['date_created'])
+            if step['date_created'] < build.date_created:
+                updates['date_created'] = step['date_created']
+            if updates:
+                Build.objects.filter(uid=build.uid).update(**updates)
+    for organization, uid in set((step['owner'], step['uid']) for step in steps):
+        boulangerie.results.invalidate('cuisson', organization, uid)
+    return steps
+
+def page(organization, offset, limit):
+    """
+    List the builds of a synchronized organization, latest first, with their latest step.
+    :returns: The builds, None if the organization is not synchronized.
+    :rtype: dict
+    """
+    if not is_synchronized(organization):
+        return None
+    builds = Build.objects.filter(organization=organization)
+    return {'count': builds.count(), 'previous': None, 'next': None,
+            'results': [encode(build, build) for build in builds.order_by('-date_created')[offset:offset + limit]]}
+
+def detail(organization, uid):
+    """
+    Retrieve the steps of a build, latest first.
+    :returns: The steps, None if the build is not in the read model.
+    :rtype: dict
+    """
+    steps = list(BuildStep.objects.filter(build__uid=uid, build__organization=organization).select_related('build'))
+    if not steps:
+        return None
+    return {'count': len(steps), 'previous': None, 'next': None,
+            'results': [encode(step.build, step) for step in steps]}
+
+def terminal(result):
+    """
+    Tell if a build is finished: its latest step is the last one, or failed.
+    :param result: The result of `detail()`, or of `cuisson.detail()`.
+    :type result: dict
+    :rtype: bool
+    """
+    latest = result['results'][0]
+    if not isinstance(latest, dict):
+        latest = json.loads(latest)
+    return latest.get('step') == 'done' or bool(latest.get('fail'))
+
+def is_synchronized(organization):
+    """
+    :returns: Whether the builds of the organization are all in the read model.
+    :rtype: bool
+    """
+    return BuildSync.objects.filter(organization=organization).exists()
+
+def synchronized(organization, result=None):
+    """
+    Mark an organization as synchronized: after a backfill, or when cuisson lists no builds,
+    its next builds are applied from the events.
+    :param result: The result of `cuisson.list()`, None after a backfill.
+    :type result: dict
+    :rtype: None
+    """
+    if result is None or not result.get('count'):
+        BuildSync.objects.update_or_create(organization=organization)
+
+def staleness():
+    """
+    The age of the latest step applied, in seconds: a growing value while cuisson is building
+    means the events aren't consumed.
+    :rtype: float
+    """
+    date = Build.objects.order_by('-date_updated').values_list('date_updated', flat=True).first()
+    if date is None:
+        return 0
+    return (timezone.now() - date).total_seconds()
+
+def consume(body, message):
+    """
+    Apply a step event of cuisson, then acknowledge it.
+    :rtype: None
+    """
+    for step in apply([body]):
+        boulangerie.metrics.timing('builds.lag', max(0, (timezone.now() - step['date_created']).total_seconds()))
+    boulangerie.metrics.incr('builds.events')
+    message.ack()
@@ -3,6 +3,7 @@
 Fixtures for the Builds tests.
 """
 #pylint:disable=wildcard-import,unused-wildcard-import,line-too-long
+import json
 import mock
 from boulangerie.apps.accounts.tests.fixtures import *
 
@@ -33,3 +34,17 @@ def detail_nobuild():
     result = {u'count':0, u'previous': None, u'results': []}
     with mock.patch("farine.rpc.Client.__wrap_rpc__", mock.Mock(return_value=result)):
         yield
+
+@pytest.fixture
+def step_factory():
+    """
+    Build a step as cuisson publishes it.
+    """
+    def factory(uid, step_id, step, organization='user1-default', minute=0, fail=False):#pylint:disable=too-many-arguments
+        """
+        The JSON encoded step `step_id` of the build `uid`.
+        """
+        return json.dumps({'tag_uri': None, 'context': {}, 'uid': uid, 'repo': 'toto', 'fail': fail, 'step': step,
+                           'branch': 'master', 'owner': organization,
+                           'date_created': '2018-01-21T17:{0:02d}:00.000000'.format(minute), 'id': step_id})
+    return factory
@@ -0,0 +1,226 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the builds read model.
+"""
+#pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,invalid-name,no-member,unused-argument
+import json
+import farine.settings
+import kombu
+import kombu.transport.memory
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError
+from django.utils.six import StringIO
+from rest_framework.test import APIClient
+import boulangerie.metrics
+from boulangerie.apps.builds import readmodel
+from boulangerie.apps.builds.models import Build, BuildStep, BuildSync
+from .fixtures import *
+
+UID1 = '3b73f69f3fb94f159d8a3230596c2e3b'
+UID2 = 'c7c853961d9942ddb0b8619a8ae55408'
+
+@pytest.fixture
+def cuisson():
+    """
+    Mock cuisson: `list(organization, offset, limit)` and `detail(organization, uid)` serve `builds`,
+    the steps of each build by uid, latest last.
+    """
+    builds = {}
+    def call(organization, *args):#pylint:disable=missing-docstring
+        if len(args) == 1:
+            steps = list(reversed(builds.get(args[0], [])))
+        else:
+            latest = sorted((steps[-1] for steps in builds.values()), key=lambda step: json.loads(step)['date_created'], reverse=True)
+            steps = latest[args[0]:args[0] + args[1]]
+        return {'count': len(steps), 'previous': None, 'next': None, 'results': steps}
+    rpc = mock.Mock(side_effect=call)
+    with mock.patch("farine.rpc.Client.__wrap_rpc__", rpc):
+        yield builds, rpc
+
+def rows(result):
+    """
+    Decode the steps of a result.
+    """
+    return [json.loads(row) for row in result['results']]
+
+def get(path, token):
+    """
+    Query the API.
+    """
+    return APIClient().get(path, HTTP_AUTHORIZATION='JWT {}'.format(token))
+
+def test_apply_idempotent(step_factory):
+    """
+    The steps can be applied twice and in any order.
+    """
+    steps = [step_factory(UID1, 1, 'clone', minute=1), step_factory(UID1, 2, 'build-docker', minute=2),
+             step_factory(UID1, 3, 'done', minute=3)]
+    readmodel.apply(reversed(steps))
+    readmodel.apply(steps)
+    build = Build.objects.get(uid=UID1)
+    assert (build.step_id, build.step, build.organization) == (3, 'done', 'user1-default')
+    assert build.date_created.minute == 1
+    assert build.date_updated.minute == 3
+    assert list(BuildStep.objects.values_list('id', flat=True)) == [3, 2, 1]
+    assert rows(readmodel.detail('user1-default', UID1)) == [json.loads(step) for step in reversed(steps)]
+    assert readmodel.detail('user2-default', UID1) is None
+
+def test_list_local(user1, login, step_factory, cuisson):
+    """
+    The builds of a synchronized organization are listed without calling cuisson.
+    """
+    readmodel.apply([step_factory(UID1, 1, 'clone', minute=1), step_factory(UID2, 2, 'clone', minute=2),
+                     step_factory(UID2, 3, 'done', minute=3)])
+    BuildSync.objects.create(organization='user1-default')
+    token = login(user1)
+    response = get('/api/0.1/builds/user1-default/?offset=0&limit=1', token)
+    assert response.status_code == 200
+    assert response.json()['count'] == 2
+    assert rows(response.json()) == [json.loads(step_factory(UID2, 3, 'done', minute=3))]
+    response = get('/api/0.1/builds/user1-default/{}/'.format(UID1), token)
+    assert rows(response.json()) == [json.loads(step_factory(UID1, 1, 'clone', minute=1))]
+    assert not cuisson[1].called
+
+def test_list_fallback(user1, login, step_factory, cuisson):
+    """
+    The builds of an organization not synchronized are listed by cuisson,
+    an organization without builds is synchronized right away.
+    """
+    builds, rpc = cuisson
+    builds[UID1] = [step_factory(UID1, 1, 'clone')]
+    token = login(user1)
+    assert get('/api/0.1/builds/user1-default/', token).json()['count'] == 1
+    assert rpc.call_count == 1
+    assert not BuildSync.objects.exists()
+    builds.clear()
+    assert get('/api/0.1/builds/user1-default/', token).json()['count'] == 0
+    assert BuildSync.objects.filter(organization='user1-default').exists()
+    get('/api/0.1/builds/user1-default/', token)
+    assert rpc.call_count == 2
+
+def test_detail_fallback(user1, login, step_factory, cuisson):
+    """
+    A build missing from the read model is retrieved from cuisson, then applied.
+    """
+    builds, rpc = cuisson
+    builds[UID1] = [step_factory(UID1, 1, 'clone', minute=1), step_factory(UID1, 2, 'done', minute=2)]
+    token = login(user1)
+    first = get('/api/0.1/builds/user1-default/{}/'.format(UID1), token).json()
+    assert rows(get('/api/0.1/builds/user1-default/{}/'.format(UID1), token).json()) == rows(first)
+    assert rpc.call_count == 1
+    assert Build.objects.get(uid=UID1).step == 'done'
+
+def test_detail_other_organization(user1, user2, login, step_factory, cuisson):
+    """
+    The membership is checked before the read model.
+    """
+    readmodel.apply([step_factory(UID1, 1, 'clone')])
+    assert get('/api/0.1/builds/user1-default/{}/'.format(UID1), login(user2)).status_code == 404
+
+def test_sync_builds(user1, step_factory, cuisson):
+    """
+    The command backfills the builds, then only applies the builds behind.
+    """
+    builds, rpc = cuisson
+    builds[UID1] = [step_factory(UID1, 1, 'clone', minute=1), step_factory(UID1, 2, 'done', minute=2)]
+    builds[UID2] = [step_factory(UID2, 3, 'clone', minute=3)]
+    stdout = StringIO()
+    call_command('sync_builds', 'user1-default', page_size=1, stdout=stdout)
+    assert stdout.getvalue() == 'user1-default: 2 builds applied.\n'
+    assert BuildSync.objects.filter(organization='user1-default').exists()
+    assert BuildStep.objects.count() == 3
+    builds[UID2].append(step_factory(UID2, 4, 'done', minute=4))
+    stdout = StringIO()
+    call_command('sync_builds', 'user1-default', page_size=1, stdout=stdout)
+    assert stdout.getvalue() == 'user1-default: 1 builds applied.\n'
+    assert Build.objects.get(uid=UID2).step == 'done'
+
+def test_sync_builds_full(user1, step_factory, cuisson):
+    """
+    `--full` applies all the builds again: a step missed before the latest one is applied.
+    """
+    builds, _ = cuisson
+    builds[UID1] = [step_factory(UID1, 1, 'clone', minute=1), step_factory(UID1, 2, 'build', minute=2),
+                    step_factory(UID1, 3, 'done', minute=3)]
+    readmodel.apply([builds[UID1][0], builds[UID1][2]])
+    BuildSync.objects.create(organization='user1-default')
+    stdout = StringIO()
+    call_command('sync_builds', 'user1-default', stdout=stdout)
+    assert stdout.getvalue() == 'user1-default: 0 builds applied.\n'
+    assert BuildStep.objects.count() == 2
+    stdout = StringIO()
+    call_command('sync_builds', 'user1-default', full=True, stdout=stdout)
+    assert stdout.getvalue() == 'user1-default: 1 builds applied.\n'
+    assert BuildStep.objects.count() == 3
+
+@pytest.fixture
+def queued(monkeypatch, settings):
+    """
+    Publish build steps on the memory transport, `get(name)` the next message of a queue.
+    """
+    monkeypatch.setattr(kombu.transport.memory.Transport, 'polling_interval', 0.001)
+    monkeypatch.setattr(farine.settings, 'cuisson', dict(farine.settings.cuisson, amqp_uri='memory://'), raising=False)
+    exchange = kombu.Exchange('cuisson', type='direct', durable=True)
+    queue = kombu.Queue(settings.BUILDS['queue'], exchange=exchange, routing_key=settings.BUILDS['routing_key'])
+    def publish(*bodies):#pylint:disable=missing-docstring
+        with kombu.Connection('memory://') as connection:
+            queue(connection.channel()).declare()
+            producer = kombu.Producer(connection.channel(), exchange=exchange)
+            for body in bodies:
+                producer.publish(body, routing_key=settings.BUILDS['routing_key'])
+    def get(name):#pylint:disable=missing-docstring
+        with kombu.Connection('memory://') as connection:
+            message = kombu.Queue(name, routing_key=name)(connection.channel()).get()
+            if message is not None:
+                message.ack()
+            return message
+    yield publish, get
+    for name in (settings.BUILDS['queue'], settings.BUILDS['dead_letter_queue']):
+        while get(name) is not None:
+            pass
+
+def test_consume_builds(queued, step_factory):
+    """
+    The command applies the queued steps.
+    """
+    publish, _ = queued
+    publish(json.loads(step_factory(UID1, 1, 'clone')), json.loads(step_factory(UID1, 2, 'done')))
+    call_command('consume_builds', once=True, interval=0.05)
+    assert Build.objects.get(uid=UID1).step == 'done'
+    assert boulangerie.metrics.snapshot()['counters']['builds.events'] >= 2
+
+def test_consume_builds_dead_letter(queued, settings, step_factory):
+    """
+    A step that can't be applied is moved to the dead letter queue, the next steps are applied.
+    """
+    publish, get = queued
+    publish({'uid': UID1}, json.loads(step_factory(UID1, 1, 'clone')))
+    call_command('consume_builds', once=True, interval=0.05)
+    assert Build.objects.get(uid=UID1).step == 'clone'
+    message = get(settings.BUILDS['dead_letter_queue'])
+    assert message.payload == {'uid': UID1}
+    assert 'KeyError' in message.headers['error']
+    assert get(settings.BUILDS['queue']) is None
+    assert boulangerie.metrics.snapshot()['counters']['builds.dead_lettered'] >= 1
+
+def test_consume_builds_requeue(queued, settings, step_factory):
+    """
+    The command stops when the database is unavailable, the step waits in the queue.
+    """
+    publish, get = queued
+    publish(json.loads(step_factory(UID1, 1, 'clone')))
+    with mock.patch.object(readmodel, 'apply', side_effect=OperationalError('gone')):
+        with pytest.raises(CommandError):
+            call_command('consume_builds', once=True, interval=0.05)
+    assert get(settings.BUILDS['dead_letter_queue']) is None
+    assert json.loads(get(settings.BUILDS['queue']).body)['id'] == 1
+    assert not Build.objects.filter(uid=UID1).exists()
+
+def test_staleness(step_factory):
+    """
+    The staleness is the age of the latest step applied.
+    """
+    assert readmodel.staleness() == 0
+    readmodel.apply([step_factory(UID1, 1, 'clone')])
+    assert readmodel.staleness() > 0
@@ -8,7 +8,8 @@ from rest_framework import status
 from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from boulangerie.apps.organizations.models import Organization
+from boulangerie.apps.organizations.membership import get_resolver
+from . import readmodel
 
 
 OFFSET = 0
@@ -30,13 +31,13 @@ class BuildsViewSet(viewsets.ViewSet):#pylint:disable=too-many-ancestors
         :rtype:bool
         :raises Http404: if the user doesn't belong to the organization.
         """
-        if Organization.objects.has_member(organization, request.user.username):
+        if get_resolver(request).has_member(organization):
             return True
         raise Http404
 
     def list(self, request, organization):
         """
-        List all the organization builds.
+        List all the organization builds, from the read model once the organization is synchronized.
         :param request: The request's context.
         :type request: object
         :param organization: The organization to list the builds.
@@ -44,15 +45,28 @@ class BuildsViewSet(viewsets.ViewSet):#pylint:disable=too-many-ancestors
         :rtype:Response
         :raises Http404: if the user doesn't belong to the organization.
         """
-        import farine.rpc
+        import boulangerie.metrics
+        import boulangerie.results
+        import boulangerie.rpc
         self.ensure_is_member(request, organization)
         offset = int(request.query_params.get('offset', OFFSET))
         limit = int(request.query_params.get('limit', LIMIT))
-        return Response(farine.rpc.Client('cuisson').list(organization, offset, limit))
+        result = readmodel.page(organization, offset, limit)
+        if result is not None:
+            return Response(result)
+        boulangerie.metrics.incr('builds.fallbacks')
+        try:
+            result, stale = boulangerie.results.call('cuisson', 'list', organization, offset, limit)
+        except boulangerie.rpc.Unavailable:
+            return boulangerie.results.unavailable('cuisson')
+        if not stale:
+            readmodel.synchronized(organization, result)
+        return boulangerie.results.response(result, stale)
 
     def retrieve(self, request, organization, pk=None):
         """
-        Retrieve a specific organization build.
+        Retrieve a specific organization build, from the read model once it has been applied:
+        the steps retrieved from cuisson are applied. The finished builds are cached, cf `boulangerie.results`.
         :param request: The request's context.
         :type request: object
         :param organization: The organization to retrieve the build.
@@ -66,6 +80,31 @@ class BuildsViewSet(viewsets.ViewSet):#pylint:disable=too-many-ancestors
         except:
             content = {'uid' : 'not a valid uuid'}
             return Response(content, status=status.HTTP_400_BAD_REQUEST)
-        import farine.rpc
+        import boulangerie.results
+        import boulangerie.rpc
         self.ensure_is_member(request, organization)
-        return Response(farine.rpc.Client('cuisson').detail(organization, uid))
+        try:
+            result, stale = boulangerie.results.cached('cuisson', organization, uid,
+                                                       lambda: self.detail(organization, uid), readmodel.terminal)
+        except boulangerie.rpc.Unavailable:
+            return boulangerie.results.unavailable('cuisson')
+        return boulangerie.results.response(result, stale)
+
+    @staticmethod
+    def detail(organization, uid):
+        """
+        Retrieve the steps of a build, from the read model or from cuisson.
+        :returns: The steps, and whether they were retrieved from cuisson.
+        :rtype: tuple
+        :raises boulangerie.rpc.Unavailable: If cuisson is unavailable.
+        """
+        import boulangerie.metrics
+        import boulangerie.readmodels
+        import boulangerie.results
+        result = readmodel.detail(organization, uid)
+        if result is not None:
+            return result, False
+        boulangerie.metrics.incr('builds.fallbacks')
+        result = boulangerie.results.fetch('cuisson', 'detail', organization, uid)
+        boulangerie.readmodels.apply_detail(readmodel, organization, uid, result)
+        return result, True
@@ -12,8 +12,11 @@ class DeploymentsConfig(AppConfig):
 
     def ready(self):
         """
-        Import the deployments signal handlers.
+        Import the deployments signal handlers, and expose the staleness of the state table.
         """
         import boulangerie.apps.deployments.signals
+        import boulangerie.metrics
+        from boulangerie.apps.deployments import readmodel
+        boulangerie.metrics.probe('deployments.staleness', readmodel.staleness)
         import farine.settings
         farine.settings.load()
@@ -0,0 +1,18 @@
+#-*- coding:utf-8 -*-
+"""
+Consume the deployment events published by defournement into the state table.
+"""
+from boulangerie.apps.deployments import readmodel
+from boulangerie.readmodels import ConsumeCommand
+
+
+class Command(ConsumeCommand):
+    """
+    Apply the deployment events from a durable queue bound to the defournement exchange, cf `ConsumeCommand`.
+    """
+    help = 'Apply the deployment events published by defournement to the state table.'
+    service = 'defournement'
+    readmodel = readmodel
+    settings_name = 'DEPLOYMENTS'
+    metric = 'deployments'
+    noun = 'deployment event'
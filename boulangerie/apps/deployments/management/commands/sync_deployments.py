@@ -0,0 +1,19 @@
+#-*- coding:utf-8 -*-
+"""
+Backfill the state of the deployments from defournement, or catch up after a consumer outage.
+"""
+from boulangerie.apps.deployments import readmodel
+from boulangerie.apps.deployments.models import Deployment
+from boulangerie.readmodels import SyncCommand
+
+
+class Command(SyncCommand):
+    """
+    Apply the events of the deployments missing or behind their latest event, cf `SyncCommand`.
+    """
+    help = 'Backfill the deployments state table from defournement.'
+    service = 'defournement'
+    readmodel = readmodel
+    model = Deployment
+    version = 'event_id'
+    noun = 'deployments'
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Deployment',
+            fields=[
+                ('uid', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('organization', models.SlugField(db_index=False)),
+                ('project', models.CharField(max_length=100)),
+                ('branch', models.CharField(max_length=255)),
+                ('status', models.CharField(max_length=50)),
+                ('event_id', models.BigIntegerField()),
+                ('payload', models.TextField()),
+                ('date_created', models.DateTimeField()),
+                ('date_updated', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ('-date_created',),
+            },
+        ),
+        migrations.CreateModel(
+            name='DeploymentEvent',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('payload', models.TextField()),
+                ('deployment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='deployments.Deployment')),
+            ],
+            options={
+                'ordering': ('-id',),
+            },
+        ),
+        migrations.CreateModel(
+            name='DeploymentSummary',
+            fields=[
+                ('organization', models.SlugField(primary_key=True, serialize=False)),
+                ('running', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('stopped', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('synced', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LatestDeployment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('organization', models.SlugField(db_index=False)),
+                ('project', models.CharField(max_length=100)),
+                ('date_created', models.DateTimeField()),
+                ('deployment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='deployments.Deployment')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='latestdeployment',
+            unique_together=set([('organization', 'project')]),
+        ),
+        migrations.AddIndex(
+            model_name='deployment',
+            index=models.Index(fields=['organization', '-date_created'], name='deployment_orga_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deployment',
+            index=models.Index(fields=['date_updated'], name='deployment_updated_idx'),
+        ),
+    ]
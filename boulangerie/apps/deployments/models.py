@@ -1,6 +1,88 @@
 # -*- coding: utf-8 -*-
+"""
+State of the deployments, fed by the defournement events, cf `boulangerie.apps.deployments.readmodel`.
+"""
 from __future__ import unicode_literals
 
 from django.db import models
 
-# Create your models here.
+#The states counted by `DeploymentSummary`.
+STATES = ('running', 'failed', 'stopped')
+
+
+class Deployment(models.Model):
+    """
+    Deployment model, one row per deployment with its latest event:
+        * uid : the deployment identifier, given by defournement.
+        * organization, project, branch : what is deployed.
+        * status, event_id, payload, date_updated : the latest event, `payload` is served as is.
+        * date_created : the date of the first event.
+    """
+    uid = models.CharField(primary_key=True, max_length=32)
+    organization = models.SlugField(null=False, max_length=50, db_index=False)
+    project = models.CharField(max_length=100)
+    branch = models.CharField(max_length=255)
+    status = models.CharField(max_length=50)
+    event_id = models.BigIntegerField()
+    payload = models.TextField()
+    date_created = models.DateTimeField()
+    date_updated = models.DateTimeField()
+
+    class Meta:#pylint:disable=old-style-class,no-init,too-few-public-methods
+        """
+        The deployments of an organization, latest first.
+        """
+        ordering = ('-date_created',)
+        indexes = [models.Index(fields=['organization', '-date_created'], name='deployment_orga_created_idx'),
+                   #The staleness of the state: the latest event applied.
+                   models.Index(fields=['date_updated'], name='deployment_updated_idx')]
+
+
+class DeploymentEvent(models.Model):
+    """
+    DeploymentEvent model, the events of a deployment:
+        * id : the event identifier, given by defournement.
+        * payload : the event, served as is.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    deployment = models.ForeignKey(Deployment, related_name='events', on_delete=models.CASCADE)
+    payload = models.TextField()
+
+    class Meta:#pylint:disable=old-style-class,no-init,too-few-public-methods
+        """
+        Latest first, as defournement does.
+        """
+        ordering = ('-id',)
+
+
+class DeploymentSummary(models.Model):
+    """
+    DeploymentSummary model, the aggregates of an organization, updated with its deployments:
+        * running, failed, stopped : the deployments by state, cf `STATES`.
+        * total : all the deployments.
+        * synced : all its deployments are in the state table: backfilled by
+          `boulangerie sync_deployments`, or known without deployments.
+          The deployments of the other organizations are listed through defournement.
+    """
+    organization = models.SlugField(null=False, max_length=50, primary_key=True)
+    running = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    stopped = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    synced = models.BooleanField(default=False)
+
+
+class LatestDeployment(models.Model):
+    """
+    LatestDeployment model, the latest deployment of each project.
+    """
+    organization = models.SlugField(null=False, max_length=50, db_index=False)
+    project = models.CharField(max_length=100)
+    deployment = models.ForeignKey(Deployment, related_name='+', on_delete=models.CASCADE)
+    date_created = models.DateTimeField()
+
+    class Meta:#pylint:disable=old-style-class,no-init,too-few-public-methods
+        """
+        One deployment per project.
+        """
+        unique_together = (('organization', 'project'),)
@@ -0,0 +1,174 @@
+#-*- coding:utf-8 -*-
+"""
+State of the deployments: the events published by defournement are applied to the `Deployment` table,
+and to the aggregates of the organization, `DeploymentSummary` and `LatestDeployment`, in the same transaction.
+The deployments are served in the format of the defournement RPC methods:
+`{'count', 'previous', 'next', 'results'}`, the results being the JSON encoded events.
+Defournement remains the fallback for the organizations not synchronized yet and the deployments not applied yet.
+"""
+import json
+from django.db import transaction
+from django.utils import dateparse, timezone
+import boulangerie.metrics
+import boulangerie.results
+from .models import STATES, Deployment, DeploymentEvent, DeploymentSummary, LatestDeployment
+
+#The fields of an event.
+FIELDS = ('id', 'uid', 'owner', 'repo', 'branch', 'status', 'date_created')
+
+def parse(event):
+    """
+    Decode an event of defournement, from the broker or a RPC result.
+    :param event: The event, JSON encoded or not.
+    :type event: str, dict
+    :returns: The event, and its JSON encoding.
+    :rtype: tuple
+    """
+    if isinstance(event, dict):
+        payload = json.dumps(event)
+    else:
+        payload, event = event, json.loads(event)
+    date = dateparse.parse_datetime(event['date_created'])
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.utc)
+    return dict(event, date_created=date), payload
+
+def _count(summary, status, value):
+    if status in STATES:
+        setattr(summary, status, getattr(summary, status) + value)
+
+def apply(events):
+    """
+    Apply the events of defournement: idempotent, and in any order.
+    The summary row of the organization is locked first: its counters follow the states of its deployments.
+    The cached details of the deployments are dropped.
+    :param events: The events, cf `parse()`.
+    :type events: list
+    :returns: The events, parsed.
+    :rtype: list
+    """
+    events = [parse(event) for event in events]
+    for event, payload in events:
+        with transaction.atomic():
+            summary, _ = DeploymentSummary.objects.select_for_update().get_or_create(organization=event['owner'])
+            deployment, created = Deployment.objects.get_or_create(
+                uid=event['uid'],
+                defaults={'organization': event['owner'], 'project': event['repo'], 'branch': event['branch'],
+                          'status': event['status'], 'event_id': event['id'], 'payload': payload,
+                          'date_created': event['date_created'], 'date_updated': event['date_created']})
+            DeploymentEvent.objects.update_or_create(id=event['id'], defaults={'deployment': deployment,
+                                                                               'payload': payload})
+            if created:
+                summary.total += 1
+                _count(summary, event['status'], 1)
+            else:
+                updates = {}
+                if event['id'] >= deployment.event_id:
+                    updates.update(status=event['status'], event_id=event['id'], payload=payload,
+                                   date_updated=event['date_created'])
+                    _count(summary, deployment.status, -1)
+                    _count(summary, event['status'], 1)
+                if event['date_created'] < deployment.date_created:
+                    updates['date_created'] = deployment.date_created = event['date_created']
+                if updates:
+                    Deployment.objects.filter(uid=deployment.uid).update(**updates)
+            summary.save(update_fields=['total'] + list(STATES))
+            latest, created = LatestDeployment.objects.get_or_create(
+                organization=deployment.organization, project=deployment.project,
+                defaults={'deployment': deployment, 'date_created': deployment.date_created})
+            if not created and latest.deployment_id != deployment.uid and latest.date_created < deployment.date_created:
+                LatestDeployment.objects.filter(pk=latest.pk).update(deployment=deployment,
+                                                                     date_created=deployment.date_created)
+    for organization, uid in set((event['owner'], event['uid']) for event, _ in events):
+        boulangerie.results.invalidate('defournement', organization, uid)
+    return events
+
+def page(organization, offset, limit):
+    """
+    List the deployments of a synchronized organization, latest first, with their latest event.
+    :returns: The deployments, None if the organization is not synchronized.
+    :rtype: dict
+    """
+    total = DeploymentSummary.objects.filter(organization=organization, synced=True)\
+                                     .values_list('total', flat=True).first()
+    if total is None:
+        return None
+    payloads = Deployment.objects.filter(organization=organization).order_by('-date_created')\
+                                 .values_list('payload', flat=True)[offset:offset + limit]
+    return {'count': total, 'previous': None, 'next': None, 'results': list(payloads)}
+
+def detail(organization, uid):
+    """
+    Retrieve the events of a deployment, latest first.
+    :returns: The events, None if the deployment is not in the state table.
+    :rtype: dict
+    """
+    payloads = list(DeploymentEvent.objects.filter(deployment__uid=uid, deployment__organization=organization)
+                    .values_list('payload', flat=True))
+    if not payloads:
+        return None
+    return {'count': len(payloads), 'previous': None, 'next': None, 'results': payloads}
+
+def terminal(result):
+    """
+    Tell if a deployment is stopped.
+    :param result: The result of `detail()`, or of `defournement.detail()`.
+    :type result: dict
+    :rtype: bool
+    """
+    latest = result['results'][0]
+    return json.loads(latest).get('status') == 'stopped'
+
+def summary(organization):
+    """
+    The aggregates of a synchronized organization: its deployments by state,
+    and the latest deployment of each project, with its latest event.
+    :returns: The aggregates, None if the organization is not synchronized: they would be incomplete.
+    :rtype: dict
+    """
+    aggregates = DeploymentSummary.objects.filter(organization=organization, synced=True).first()
+    if aggregates is None:
+        return None
+    projects = LatestDeployment.objects.filter(organization=organization)\
+                                       .values_list('project', 'deployment__payload')
+    result = dict((state, getattr(aggregates, state)) for state in STATES)
+    result.update(total=aggregates.total, synced=aggregates.synced, projects=dict(projects))
+    return result
+
+def is_synchronized(organization):
+    """
+    :returns: Whether the deployments of the organization are all in the state table.
+    :rtype: bool
+    """
+    return DeploymentSummary.objects.filter(organization=organization, synced=True).exists()
+
+def synchronized(organization, result=None):
+    """
+    Mark an organization as synchronized: after a backfill, or when defournement lists no deployments,
+    its next deployments are applied from the events.
+    :param result: The result of `defournement.list()`, None after a backfill.
+    :type result: dict
+    :rtype: None
+    """
+    if result is None or not result.get('count'):
+        DeploymentSummary.objects.update_or_create(organization=organization, defaults={'synced': True})
+
+def staleness():
+    """
+    The age of the latest event applied, in seconds.
+    :rtype: float
+    """
+    date = Deployment.objects.order_by('-date_updated').values_list('date_updated', flat=True).first()
+    if date is None:
+        return 0
+    return (timezone.now() - date).total_seconds()
+
+def consume(body, message):
+    """
+    Apply an event of defournement, then acknowledge it.
+    :rtype: None
+    """
+    for event, _ in apply([body]):
+        boulangerie.metrics.timing('deployments.lag', max(0, (timezone.now() - event['date_created']).total_seconds()))
+    boulangerie.metrics.incr('deployments.events')
+    message.ack()
@@ -3,6 +3,7 @@
 Fixtures for the Deployments tests.
 """
 #pylint:disable=wildcard-import,unused-wildcard-import,line-too-long
+import json
 import mock
 from boulangerie.apps.accounts.tests.fixtures import *
 
@@ -48,3 +49,17 @@ def delete_deployment_nok():
     """
     with mock.patch("farine.rpc.Client.__wrap_rpc__", mock.Mock(return_value=False)):
         yield
+
+@pytest.fixture
+def event_factory():
+    """
+    Build an event as defournement publishes it.
+    """
+    def factory(uid, event_id, status, repo='toto', organization='user1-default', minute=0):#pylint:disable=too-many-arguments
+        """
+        The JSON encoded event `event_id` of the deployment `uid`.
+        """
+        return json.dumps({'id': event_id, 'uid': uid, 'owner': organization, 'repo': repo, 'branch': 'master',
+                           'status': status, 'date_created': '2018-01-21T17:{0:02d}:00.000000'.format(minute)},
+                          sort_keys=True)
+    return factory
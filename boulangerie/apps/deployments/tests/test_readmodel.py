@@ -0,0 +1,241 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the deployments state table.
+"""
+#pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,invalid-name,no-member,unused-argument
+import json
+import farine.settings
+import kombu
+import kombu.transport.memory
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+from rest_framework.test import APIClient
+import boulangerie.metrics
+from boulangerie.apps.deployments import readmodel
+from boulangerie.apps.deployments.models import Deployment, DeploymentSummary
+from .fixtures import *
+
+UID1 = '3b73f69f3fb94f159d8a3230596c2e3b'
+UID2 = 'c7c853961d9942ddb0b8619a8ae55408'
+UID3 = '2550873c57cd46e6a164f3776be58cd1'
+
+@pytest.fixture
+def defournement():
+    """
+    Mock defournement: `list(organization, offset, limit)` and `detail(organization, uid)` serve `deployments`,
+    the events of each deployment by uid, latest last.
+    """
+    deployments = {}
+    def call(organization, *args):#pylint:disable=missing-docstring
+        if len(args) == 1:
+            events = list(reversed(deployments.get(args[0], [])))
+        else:
+            latest = sorted((events[-1] for events in deployments.values()), key=lambda event: json.loads(event)['date_created'], reverse=True)
+            events = latest[args[0]:args[0] + args[1]]
+        return {'count': len(events), 'previous': None, 'next': None, 'results': events}
+    rpc = mock.Mock(side_effect=call)
+    with mock.patch("farine.rpc.Client.__wrap_rpc__", rpc):
+        yield deployments, rpc
+
+@pytest.fixture
+def queued(monkeypatch, settings):
+    """
+    Publish deployment events on the memory transport, `get(name)` the next message of a queue.
+    """
+    monkeypatch.setattr(kombu.transport.memory.Transport, 'polling_interval', 0.001)
+    monkeypatch.setattr(farine.settings, 'defournement', dict(farine.settings.defournement, amqp_uri='memory://'), raising=False)
+    exchange = kombu.Exchange('defournement', type='direct', durable=True)
+    queue = kombu.Queue(settings.DEPLOYMENTS['queue'], exchange=exchange, routing_key=settings.DEPLOYMENTS['routing_key'])
+    def publish(*bodies):#pylint:disable=missing-docstring
+        with kombu.Connection('memory://') as connection_:
+            queue(connection_.channel()).declare()
+            producer = kombu.Producer(connection_.channel(), exchange=exchange)
+            for body in bodies:
+                producer.publish(body, routing_key=settings.DEPLOYMENTS['routing_key'])
+    def get(name):#pylint:disable=missing-docstring
+        with kombu.Connection('memory://') as connection_:
+            message = kombu.Queue(name, routing_key=name)(connection_.channel()).get()
+            if message is not None:
+                message.ack()
+            return message
+    yield publish, get
+    for name in (settings.DEPLOYMENTS['queue'], settings.DEPLOYMENTS['dead_letter_queue']):
+        while get(name) is not None:
+            pass
+
+def get(path, token):
+    """
+    Query the API.
+    """
+    return APIClient().get(path, HTTP_AUTHORIZATION='JWT {}'.format(token))
+
+def test_apply_aggregates(event_factory):
+    """
+    The aggregates follow the states of the deployments, whatever the order of the events.
+    """
+    readmodel.apply([event_factory(UID1, 2, 'running', minute=2), event_factory(UID1, 1, 'pending', minute=1)])
+    readmodel.apply([event_factory(UID2, 3, 'running', minute=3), event_factory(UID3, 4, 'failed', repo='tata', minute=4)])
+    assert readmodel.summary('user1-default') is None
+    readmodel.synchronized('user1-default')
+    summary = readmodel.summary('user1-default')
+    assert (summary['running'], summary['failed'], summary['stopped'], summary['total']) == (2, 1, 0, 3)
+    assert json.loads(summary['projects']['toto'])['uid'] == UID2
+    assert json.loads(summary['projects']['tata'])['uid'] == UID3
+    readmodel.apply([event_factory(UID1, 5, 'stopped', minute=5), event_factory(UID1, 5, 'stopped', minute=5)])
+    summary = readmodel.summary('user1-default')
+    assert (summary['running'], summary['failed'], summary['stopped'], summary['total']) == (1, 1, 1, 3)
+    deployment = Deployment.objects.get(uid=UID1)
+    assert (deployment.status, deployment.date_created.minute) == ('stopped', 1)
+    assert readmodel.detail('user1-default', UID1)['results'] == [event_factory(UID1, 5, 'stopped', minute=5),
+                                                                 event_factory(UID1, 2, 'running', minute=2),
+                                                                 event_factory(UID1, 1, 'pending', minute=1)]
+
+def test_list_local(user1, login, event_factory, defournement):
+    """
+    The deployments of a synchronized organization are listed with one indexed query,
+    the count being read from the aggregates.
+    """
+    readmodel.apply([event_factory(UID1, 1, 'running', minute=1), event_factory(UID2, 2, 'failed', minute=2)])
+    readmodel.synchronized('user1-default')
+    token = login(user1)
+    get('/api/0.1/deployments/user1-default/', token)
+    with CaptureQueriesContext(connection) as queries:
+        response = get('/api/0.1/deployments/user1-default/?offset=1&limit=1', token)
+    assert response.json() == {'count': 2, 'previous': None, 'next': None, 'results': [event_factory(UID1, 1, 'running', minute=1)]}
+    assert len([query for query in queries if 'deployments_' in query['sql']]) == 2
+    assert not defournement[1].called
+
+def test_list_summary(user1, login, event_factory, defournement):
+    """
+    `?summary=1` only returns the aggregates, once the organization is synchronized.
+    """
+    deployments, rpc = defournement
+    deployments[UID1] = [event_factory(UID1, 1, 'running')]
+    readmodel.apply(deployments[UID1])
+    token = login(user1)
+    response = get('/api/0.1/deployments/user1-default/?summary=1', token)
+    assert response.status_code == 503
+    assert rpc.call_count == 1
+    readmodel.synchronized('user1-default')
+    response = get('/api/0.1/deployments/user1-default/?summary=1', token)
+    assert response.json() == {'running': 1, 'failed': 0, 'stopped': 0, 'total': 1, 'synced': True,
+                               'projects': {'toto': event_factory(UID1, 1, 'running')}}
+    assert rpc.call_count == 1
+
+def test_list_summary_empty(user1, login, defournement):
+    """
+    An organization without deployments is synchronized by its summary.
+    """
+    response = get('/api/0.1/deployments/user1-default/?summary=1', login(user1))
+    assert response.json() == {'running': 0, 'failed': 0, 'stopped': 0, 'total': 0, 'synced': True, 'projects': {}}
+    assert DeploymentSummary.objects.get(organization='user1-default').synced
+
+def test_list_fallback(user1, login, event_factory, defournement):
+    """
+    The deployments of an organization not synchronized are listed by defournement,
+    an organization without deployments is synchronized right away.
+    """
+    deployments, rpc = defournement
+    deployments[UID1] = [event_factory(UID1, 1, 'running')]
+    token = login(user1)
+    assert get('/api/0.1/deployments/user1-default/', token).json()['count'] == 1
+    assert not DeploymentSummary.objects.filter(synced=True).exists()
+    deployments.clear()
+    assert get('/api/0.1/deployments/user1-default/', token).json()['count'] == 0
+    get('/api/0.1/deployments/user1-default/', token)
+    assert rpc.call_count == 2
+
+def test_detail(user1, user2, login, event_factory, defournement):
+    """
+    A deployment is retrieved from the state table once applied, after the membership check.
+    """
+    deployments, rpc = defournement
+    deployments[UID1] = [event_factory(UID1, 1, 'running')]
+    token = login(user1)
+    assert get('/api/0.1/deployments/user1-default/{}/'.format(UID1), token).json()['results'] == [event_factory(UID1, 1, 'running')]
+    assert rpc.call_count == 1
+    readmodel.apply(deployments[UID1])
+    assert get('/api/0.1/deployments/user1-default/{}/'.format(UID1), token).json()['results'] == [event_factory(UID1, 1, 'running')]
+    assert rpc.call_count == 1
+    assert get('/api/0.1/deployments/user1-default/{}/'.format(UID1), login(user2)).status_code == 404
+
+def test_detail_fallback(user1, login, event_factory, defournement):
+    """
+    A deployment missing from the state table is retrieved from defournement, then applied,
+    unless its events are incomplete or belong to another deployment.
+    """
+    deployments, _ = defournement
+    deployments[UID1] = [event_factory(UID1, 1, 'running', minute=1), event_factory(UID1, 2, 'stopped', minute=2)]
+    deployments[UID2] = [json.dumps({'id': 3, 'uid': UID2, 'owner': 'user1-default'})]
+    deployments[UID3] = [event_factory(UID1, 4, 'running', organization='user2-default')]
+    token = login(user1)
+    for uid in (UID1, UID2, UID3):
+        assert get('/api/0.1/deployments/user1-default/{}/'.format(uid), token).status_code == 200
+    assert Deployment.objects.get(uid=UID1).status == 'stopped'
+    assert list(Deployment.objects.values_list('uid', flat=True)) == [UID1]
+    assert boulangerie.metrics.snapshot()['counters']['readmodels.incomplete'] >= 2
+
+def test_sync_deployments(user1, event_factory, defournement):
+    """
+    The command backfills the deployments, then only applies the deployments behind.
+    """
+    deployments, _ = defournement
+    deployments[UID1] = [event_factory(UID1, 1, 'running', minute=1), event_factory(UID1, 2, 'stopped', minute=2)]
+    deployments[UID2] = [event_factory(UID2, 3, 'running', minute=3)]
+    stdout = StringIO()
+    call_command('sync_deployments', 'user1-default', page_size=1, stdout=stdout)
+    assert stdout.getvalue() == 'user1-default: 2 deployments applied.\n'
+    assert DeploymentSummary.objects.get(organization='user1-default').synced
+    deployments[UID2].append(event_factory(UID2, 4, 'failed', minute=4))
+    stdout = StringIO()
+    call_command('sync_deployments', 'user1-default', page_size=1, stdout=stdout)
+    assert stdout.getvalue() == 'user1-default: 1 deployments applied.\n'
+    summary = readmodel.summary('user1-default')
+    assert (summary['running'], summary['failed'], summary['stopped']) == (0, 1, 1)
+
+def test_sync_deployments_full(user1, event_factory, defournement):
+    """
+    `--full` applies all the deployments again: an event missed before the latest one is applied,
+    the counters don't drift.
+    """
+    deployments, _ = defournement
+    deployments[UID1] = [event_factory(UID1, 1, 'running', minute=1), event_factory(UID1, 2, 'failed', minute=2),
+                         event_factory(UID1, 3, 'stopped', minute=3)]
+    deployments[UID2] = [event_factory(UID2, 4, 'running', minute=4)]
+    readmodel.apply([deployments[UID1][0], deployments[UID1][2]] + deployments[UID2])
+    readmodel.synchronized('user1-default')
+    stdout = StringIO()
+    call_command('sync_deployments', 'user1-default', full=True, stdout=stdout)
+    assert stdout.getvalue() == 'user1-default: 2 deployments applied.\n'
+    assert Deployment.objects.get(uid=UID1).events.count() == 3
+    summary = readmodel.summary('user1-default')
+    assert (summary['total'], summary['running'], summary['failed'], summary['stopped']) == (2, 1, 0, 1)
+
+def test_consume_deployments(queued, settings, event_factory):
+    """
+    The command applies the queued events, an event that can't be applied is moved to the dead letter queue.
+    """
+    publish, get = queued
+    publish(json.loads(event_factory(UID1, 1, 'running')), {'uid': UID1}, json.loads(event_factory(UID1, 2, 'stopped')))
+    call_command('consume_deployments', once=True, interval=0.05)
+    assert Deployment.objects.get(uid=UID1).status == 'stopped'
+    message = get(settings.DEPLOYMENTS['dead_letter_queue'])
+    assert message.payload == {'uid': UID1}
+    assert 'KeyError' in message.headers['error']
+    counters = boulangerie.metrics.snapshot()['counters']
+    assert counters['deployments.events'] >= 2 and counters['deployments.dead_lettered'] >= 1
+
+def test_consume_deployments_requeue(queued, settings, event_factory):
+    """
+    The command stops when the database is unavailable, the event waits in the queue.
+    """
+    publish, get = queued
+    publish(json.loads(event_factory(UID1, 1, 'running')))
+    with mock.patch.object(readmodel, 'apply', side_effect=OperationalError('gone')):
+        with pytest.raises(CommandError):
+            call_command('consume_deployments', once=True, interval=0.05)
+    assert json.loads(get(settings.DEPLOYMENTS['queue']).body)['id'] == 1
+    assert not Deployment.objects.filter(uid=UID1).exists()
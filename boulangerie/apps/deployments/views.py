@@ -8,7 +8,8 @@ from rest_framework import status
 from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from boulangerie.apps.organizations.models import Organization
+from boulangerie.apps.organizations.membership import get_resolver
+from . import readmodel
 
 OFFSET = 0
 LIMIT = 10
@@ -29,13 +30,14 @@ class DeploymentsViewSet(viewsets.ViewSet):#pylint:disable=too-many-ancestors
         :rtype:bool
         :raises Http404: if the user doesn't belong to the organization.
         """
-        if Organization.objects.has_member(organization, request.user.username):
+        if get_resolver(request).has_member(organization):
             return True
         raise Http404
 
     def list(self, request, organization):
         """
-        List all the organization deployments.
+        List all the organization deployments, from the state table once the organization is synchronized.
+        With `?summary=1`, only the aggregates: the deployments by state and the latest one of each project.
         :param request: The request's context.
         :type request: object
         :param organization: The organization to list the deployments.
@@ -44,14 +46,52 @@ class DeploymentsViewSet(viewsets.ViewSet):#pylint:disable=too-many-ancestors
         :raises Http404: if the user doesn't belong to the organization.
         """
         self.ensure_is_member(request, organization)
+        if request.query_params.get('summary') == '1':
+            return self.summary(organization)
         offset = int(request.query_params.get('offset', OFFSET))
         limit = int(request.query_params.get('limit', LIMIT))
-        import farine.rpc
-        return Response(farine.rpc.Client('defournement').list(organization, offset, limit))
+        result = readmodel.page(organization, offset, limit)
+        if result is not None:
+            return Response(result)
+        import boulangerie.metrics
+        import boulangerie.results
+        import boulangerie.rpc
+        boulangerie.metrics.incr('deployments.fallbacks')
+        try:
+            result, stale = boulangerie.results.call('defournement', 'list', organization, offset, limit)
+        except boulangerie.rpc.Unavailable:
+            return boulangerie.results.unavailable('defournement')
+        if not stale:
+            readmodel.synchronized(organization, result)
+        return boulangerie.results.response(result, stale)
+
+    @staticmethod
+    def summary(organization):
+        """
+        The aggregates of the organization, once synchronized: an organization without deployments
+        is synchronized right away, the others wait for `boulangerie sync_deployments`.
+        :rtype: Response
+        """
+        import boulangerie.results
+        import boulangerie.rpc
+        result = readmodel.summary(organization)
+        if result is None:
+            try:
+                deployments, stale = boulangerie.results.call('defournement', 'list', organization, 0, 1)
+            except boulangerie.rpc.Unavailable:
+                return boulangerie.results.unavailable('defournement')
+            if not stale:
+                readmodel.synchronized(organization, deployments)
+            result = readmodel.summary(organization)
+        if result is None:
+            return Response({'error': 'the deployments of {0} are not synchronized yet'.format(organization)},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(result)
 
     def retrieve(self, request, organization, pk=None):
         """
-        Retrieve a specific organization deployment.
+        Retrieve a specific organization deployment, from the state table once it has been applied.
+        The stopped deployments are cached, cf `boulangerie.results`.
         :param request: The request's context.
         :type request: object
         :param organization: The organization to retrieve the deployment.
@@ -65,9 +105,34 @@ class DeploymentsViewSet(viewsets.ViewSet):#pylint:disable=too-many-ancestors
         except:
             content = {'uid' : 'not a valid uuid'}
             return Response(content, status=status.HTTP_400_BAD_REQUEST)
+        import boulangerie.results
+        import boulangerie.rpc
         self.ensure_is_member(request, organization)
-        import farine.rpc
-        return Response(farine.rpc.Client('defournement').detail(organization, uid))
+        try:
+            result, stale = boulangerie.results.cached('defournement', organization, uid,
+                                                       lambda: self.detail(organization, uid), readmodel.terminal)
+        except boulangerie.rpc.Unavailable:
+            return boulangerie.results.unavailable('defournement')
+        return boulangerie.results.response(result, stale)
+
+    @staticmethod
+    def detail(organization, uid):
+        """
+        Retrieve the events of a deployment, from the state table or from defournement, then applied.
+        :returns: The events, and whether they were retrieved from defournement.
+        :rtype: tuple
+        :raises boulangerie.rpc.Unavailable: If defournement is unavailable.
+        """
+        import boulangerie.metrics
+        import boulangerie.readmodels
+        import boulangerie.results
+        result = readmodel.detail(organization, uid)
+        if result is not None:
+            return result, False
+        boulangerie.metrics.incr('deployments.fallbacks')
+        result = boulangerie.results.fetch('defournement', 'detail', organization, uid)
+        boulangerie.readmodels.apply_detail(readmodel, organization, uid, result)
+        return result, True
 
     def destroy(self, request, organization, pk=None):
         """
@@ -86,8 +151,14 @@ class DeploymentsViewSet(viewsets.ViewSet):#pylint:disable=too-many-ancestors
             content = {'uid' : 'not a valid uuid'}
             return Response(content, status=status.HTTP_400_BAD_REQUEST)
         self.ensure_is_member(request, organization)
-        import farine.rpc
-        result = farine.rpc.Client('defournement').delete(organization, uid)
+        import boulangerie.results
+        import boulangerie.rpc
+        try:
+            with boulangerie.rpc.client('defournement') as rpc:
+                result = rpc.delete(organization, uid)
+        except boulangerie.rpc.Unavailable:
+            return boulangerie.results.unavailable('defournement')
+        boulangerie.results.invalidate('defournement', organization, uid)
         if not result:
             return Response({'error':'error while destroying the deployment'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -6,6 +6,9 @@ class KeysConfig(AppConfig):
 
     def ready(self):
         """
-        Import the key signal handlers.
+        Import the key signal handlers, and expose the keypair pool depth.
         """
         import boulangerie.apps.keys.signals
+        import boulangerie.metrics
+        from boulangerie.apps.keys import pool
+        boulangerie.metrics.probe('keypool.depth', pool.depth)
@@ -0,0 +1,142 @@
+#-*- coding:utf-8 -*-
+"""
+Resolution of the git accesses: is the account of a SSH key a member of the organization
+of a repository, and with which role.
+The decisions are kept in the `authorization` cache, under the version of the key digest
+and the version of the organization: the key, member and project receivers bump them.
+The versions are stored in the cache itself: they reach the other workers if it is shared,
+otherwise the decisions of the other workers expire after the timeout of the cache, a few seconds.
+"""
+import binascii
+import time
+import uuid
+from django.core.cache import caches
+from django.db import connection, transaction
+import boulangerie.metrics
+from .fingerprints import decode
+
+def _version_key(kind, name):
+    return u'version:{0}:{1}'.format(kind, name)
+
+def _digest_name(column, digest):
+    return u'{0}:{1}'.format(column, binascii.hexlify(bytes(digest)).decode('ascii'))
+
+def _versions(cache, keys):
+    """
+    Retrieve the versions, a missing one is created:
+    as an evicted version never comes back, neither do the entries stored under it.
+    :rtype: list
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+def invalidate(keys=(), organizations=()):
+    """
+    Drop the cached decisions of the keys and of the organizations,
+    right now and once the transaction is committed:
+    a concurrent request could cache the decision of the previous rows meanwhile.
+    :param keys: The created or deleted keys, with their digests.
+    :type keys: list
+    :param organizations: The organizations whose members or projects changed.
+    :type organizations: list
+    :rtype: None
+    """
+    names = [_version_key('key', _digest_name(column, getattr(key, column)))
+             for key in keys for column in ('md5', 'sha256')]
+    names += [_version_key('organization', organization) for organization in organizations]
+    if not names:
+        return
+    def bump():#pylint:disable=missing-docstring
+        caches['authorization'].set_many(dict((name, uuid.uuid4().hex) for name in names), None)
+        boulangerie.metrics.incr('authorization_cache.invalidations')
+    bump()
+    transaction.on_commit(bump)
+
+def split_repo(repo):
+    """
+    Split a repository name into its organization and its project, cf the `create-repo` event.
+    :returns: The organization and the project, None if the name is invalid.
+    :rtype: tuple
+    """
+    organization, _, project = repo.partition('.')
+    if not organization or not project:
+        return None
+    return organization, project
+
+def resolve(column, digest, organization, project):
+    """
+    Resolve the access from the database, with one query:
+    the key, its member row and the project are joined on their unique indexes.
+    :param column: The digest column: md5 or sha256.
+    :type column: str
+    :param digest: The digest of the key.
+    :type digest: bytes
+    :returns: The account of the key, its role, None if it has no access.
+    :rtype: tuple
+    """
+    from boulangerie.apps.organizations.models import Member
+    from boulangerie.apps.projects.models import Project
+    from .models import SSHKey
+    quote = connection.ops.quote_name
+    sql = ('SELECT k.{owner}, m.{is_admin}, m.{is_owner}, p.{project_id} FROM {keys} k '
+           'LEFT JOIN {members} m ON m.{account} = k.{owner} AND m.{organization} = %s '
+           'LEFT JOIN {projects} p ON p.{project_owner} = m.{organization} AND p.{project_name} = %s '
+           'WHERE k.{digest} = %s').format(
+               keys=quote(SSHKey._meta.db_table),#pylint:disable=protected-access
+               members=quote(Member._meta.db_table),#pylint:disable=protected-access
+               projects=quote(Project._meta.db_table),#pylint:disable=protected-access
+               owner=quote('owner'), digest=quote(column),
+               account=quote('account'), organization=quote('organization_id'),
+               is_admin=quote('is_admin'), is_owner=quote('is_owner'),
+               project_id=quote('id'), project_owner=quote('owner'), project_name=quote('name'))
+    with connection.cursor() as cursor:
+        digest = SSHKey._meta.get_field(column).get_db_prep_value(digest, connection)#pylint:disable=protected-access
+        cursor.execute(sql, [organization, project, digest])
+        row = cursor.fetchone()
+    if row is None:
+        return None, None
+    account, is_admin, is_owner, project_id = row
+    if project_id is None:
+        return account, None
+    from boulangerie.apps.accounts.tokens import get_role
+    return account, get_role(is_admin, is_owner)
+
+def authorize(fingerprint, repo):
+    """
+    Decide if the key can access the repository.
+    :param fingerprint: The fingerprint of the SSH key, MD5 or SHA256, cf `boulangerie.apps.keys.fingerprints`.
+    :type fingerprint: str
+    :param repo: The repository: `<organization>.<project>`.
+    :type repo: str
+    :returns: The decision: allow, account and role.
+    :rtype: dict
+    """
+    decision = {'allow': False, 'account': None, 'role': None}
+    names = split_repo(repo)
+    if names is None:
+        return decision
+    try:
+        column, digest = decode(fingerprint)
+    except ValueError:
+        return decision
+    organization, project = names
+    cache = caches['authorization']
+    name = _digest_name(column, digest)
+    versions = _versions(cache, [_version_key('key', name), _version_key('organization', organization)])
+    key = u'authorization:{0}:{1}:{2}:{3}'.format(name, repo, *versions)
+    value = cache.get(key)
+    if value is None:
+        boulangerie.metrics.incr('authorization_cache.misses')
+        start = time.time()
+        value = resolve(column, digest, organization, project)
+        boulangerie.metrics.timing('authorization.resolve', time.time() - start)
+        cache.set(key, value)
+    else:
+        boulangerie.metrics.incr('authorization_cache.hits')
+    account, role = value
+    decision.update(allow=role is not None, account=account, role=role)
+    return decision
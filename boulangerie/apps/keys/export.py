@@ -0,0 +1,122 @@
+#-*- coding:utf-8 -*-
+"""
+Export of the authorized keys for the git and SSH gateways:
+a full snapshot, then the deltas since its sequence number.
+Both stream one entry per account, its public keys and its organizations:
+a gateway replaces the entries of the account, a replayed entry is harmless.
+The accounts to resend are journaled by the key and member receivers, cf `KeyChange`,
+and the journal is pruned after `settings.KEYS_EXPORT['retention']` seconds, cf `prune()`:
+the deltas since a pruned sequence are refused, the gateway takes a new snapshot.
+"""
+import collections
+import datetime
+import itertools
+import operator
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import exceptions, status
+from .models import KeyChange, SSHKey
+
+BATCH_SIZE = 500
+
+class SnapshotRequired(exceptions.APIException):
+    """
+    Raised when the deltas since a sequence were pruned from the journal.
+    """
+    status_code = status.HTTP_410_GONE
+    default_detail = 'The sequence is too old, take a new snapshot.'
+
+def journal(*usernames):
+    """
+    Record that the keys or the organizations of the accounts changed, within the current transaction.
+    :rtype: None
+    """
+    KeyChange.objects.bulk_create([KeyChange(account=username) for username in usernames])
+
+def sequence():
+    """
+    The sequence the deltas can resume from: the last entry older than the `settle` delay,
+    the entries after it are resent.
+    :rtype: int
+    """
+    limit = timezone.now() - datetime.timedelta(seconds=settings.KEYS_EXPORT['settle'])
+    return KeyChange.objects.filter(date_created__lte=limit).order_by('-sequence')\
+                            .values_list('sequence', flat=True).first() or 0
+
+def _batches(iterable):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, BATCH_SIZE))
+        if not batch:
+            return
+        yield batch
+
+def _entries(usernames, keys):
+    """
+    The entries of a batch of accounts, with one query for their organizations.
+    :param keys: The public keys, by account.
+    :type keys: dict
+    :rtype: generator
+    """
+    from boulangerie.apps.organizations.models import Member
+    organizations = collections.defaultdict(list)
+    members = Member.objects.filter(account__in=usernames).order_by('organization')
+    for account, organization in members.values_list('account', 'organization'):
+        organizations[account].append(organization)
+    for username in usernames:
+        yield {'account': username, 'keys': keys.get(username, []), 'organizations': organizations[username]}
+
+def snapshot():
+    """
+    Stream the entries of all the accounts having a key, the keys are read with a server-side cursor.
+    The first item is the sequence to resume from: `{'sequence': <int>}`.
+    :rtype: generator
+    """
+    yield {'sequence': sequence()}
+    rows = SSHKey.objects.order_by('owner', 'pk').values_list('owner', 'public').iterator()
+    accounts = ((owner, [public for _, public in keys])
+                for owner, keys in itertools.groupby(rows, key=operator.itemgetter(0)))
+    for batch in _batches(accounts):
+        for entry in _entries([owner for owner, _ in batch], dict(batch)):
+            yield entry
+
+def prune():
+    """
+    Delete the journal entries older than the retention.
+    The newest of them is kept: the deltas since a sequence before it are incomplete, cf `deltas()`.
+    :returns: The number of entries deleted.
+    :rtype: int
+    """
+    limit = timezone.now() - datetime.timedelta(seconds=settings.KEYS_EXPORT['retention'])
+    newest = KeyChange.objects.filter(date_created__lt=limit).order_by('-sequence')\
+                              .values_list('sequence', flat=True).first()
+    if newest is None:
+        return 0
+    deleted, _ = KeyChange.objects.filter(sequence__lt=newest).delete()
+    return deleted
+
+def deltas(since):
+    """
+    Stream the entries of the accounts changed after the sequence `since`,
+    an account without keys anymore has an empty list.
+    The first item is the sequence to resume from: `{'sequence': <int>}`.
+    :param since: The sequence of the previous snapshot or deltas.
+    :type since: int
+    :raises SnapshotRequired: The entries after `since` may have been pruned.
+    :rtype: generator
+    """
+    oldest = KeyChange.objects.order_by('sequence').values_list('sequence', flat=True).first()
+    if oldest is not None and since < oldest - 1:
+        raise SnapshotRequired()
+    return _deltas(since)
+
+def _deltas(since):
+    yield {'sequence': max(sequence(), since)}
+    changes = KeyChange.objects.filter(sequence__gt=since).order_by('account')\
+                               .values_list('account', flat=True).distinct().iterator()
+    for usernames in _batches(changes):
+        keys = collections.defaultdict(list)
+        for owner, public in SSHKey.objects.filter(owner__in=usernames).order_by('pk').values_list('owner', 'public'):
+            keys[owner].append(public)
+        for entry in _entries(usernames, keys):
+            yield entry
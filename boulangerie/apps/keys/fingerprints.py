@@ -0,0 +1,61 @@
+#-*- coding:utf-8 -*-
+"""
+The binary digests of the SSH keys: the MD5 and SHA256 of the decoded key,
+as in the `MD5:<hex pairs>` and `SHA256:<base64>` fingerprints of OpenSSH.
+The keys are unique and looked up on these fixed-width columns, the text fingerprint is kept for display.
+"""
+import base64
+import binascii
+import hashlib
+import sshpubkeys
+
+def digests(public):
+    """
+    Compute the digests of a public key.
+    A key which can't be parsed, ie an old row, is hashed as a whole.
+    :param public: The public key.
+    :type public: str
+    :returns: The MD5 and SHA256 digests.
+    :rtype: tuple
+    """
+    ssh = sshpubkeys.SSHKey()
+    try:
+        ssh.parse(public)
+    except (sshpubkeys.InvalidKeyException, NotImplementedError):
+        data = public.encode('utf-8')
+        return hashlib.md5(data).digest(), hashlib.sha256(data).digest()
+    return decode(ssh.hash_md5())[1], decode(ssh.hash_sha256())[1]
+
+def decode(fingerprint):
+    """
+    Decode a text fingerprint: `MD5:<hex pairs>`, `<hex pairs>` or `SHA256:<base64>`.
+    :returns: The column of the digest, md5 or sha256, and the digest.
+    :rtype: tuple
+    :raises ValueError: If the fingerprint is invalid.
+    """
+    if fingerprint.startswith('SHA256:'):
+        value = fingerprint[len('SHA256:'):]
+        try:
+            digest = base64.b64decode(value + '=' * (-len(value) % 4))
+        except (TypeError, binascii.Error):
+            raise ValueError('Invalid fingerprint.')
+        column = 'sha256'
+    else:
+        if fingerprint.startswith('MD5:'):
+            fingerprint = fingerprint[len('MD5:'):]
+        try:
+            digest = binascii.unhexlify(fingerprint.replace(':', ''))
+        except (TypeError, binascii.Error):
+            raise ValueError('Invalid fingerprint.')
+        column = 'md5'
+    if len(digest) != {'md5': 16, 'sha256': 32}[column]:
+        raise ValueError('Invalid fingerprint.')
+    return column, digest
+
+def encode_md5(digest):
+    """
+    The text fingerprint of a MD5 digest, as `sshpubkeys.SSHKey.hash_md5`.
+    :rtype: str
+    """
+    value = binascii.hexlify(bytes(digest)).decode('ascii')
+    return 'MD5:' + ':'.join(value[index:index + 2] for index in range(0, len(value), 2))
@@ -0,0 +1,36 @@
+#-*- coding:utf-8 -*-
+"""
+Export the authorized keys.
+"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from boulangerie.apps.keys import export
+
+
+class Command(BaseCommand):
+    """
+    Write the snapshot of the authorized keys, or the deltas since a sequence, as JSON lines.
+    """
+    help = 'Export the authorized keys for the git and SSH gateways.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=int, default=None,
+                            help='Only the accounts changed after this sequence.')
+        parser.add_argument('--output', default=None,
+                            help='The file to write, the standard output by default.')
+
+    def handle(self, *args, **options):
+        if options['since'] is None:
+            entries = export.snapshot()
+        else:
+            try:
+                entries = export.deltas(options['since'])
+            except export.SnapshotRequired as error:
+                raise CommandError(error.detail)
+        output = open(options['output'], 'w') if options['output'] else self.stdout
+        try:
+            for entry in entries:
+                output.write(json.dumps(entry) + '\n')
+        finally:
+            if options['output']:
+                output.close()
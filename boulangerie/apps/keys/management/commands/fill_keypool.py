@@ -0,0 +1,34 @@
+#-*- coding:utf-8 -*-
+"""
+Fill the pool of pre-generated keypairs.
+"""
+import time
+from django.core.management.base import BaseCommand
+import boulangerie.metrics
+from boulangerie.apps.keys import pool
+
+
+class Command(BaseCommand):
+    """
+    Keep the keypair pool full, forever or just once.
+    """
+    help = 'Generate the keypairs taken by the registrations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=None,
+                            help='Number of keypairs to keep, [keypool] size by default.')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait when the pool is full.')
+        parser.add_argument('--once', action='store_true',
+                            help='Fill the pool then exit.')
+
+    def handle(self, *args, **options):
+        while True:
+            generated = pool.fill(options['size'])
+            if generated:
+                rate = boulangerie.metrics.snapshot()['gauges'].get('keypool.refill_rate', 0.0)
+                self.stdout.write('{0} keypairs generated ({1:.2f}/s), {2} in the pool.'.format(
+                    generated, rate, pool.depth()))
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,16 @@
+#-*- coding:utf-8 -*-
+"""
+Prune the journal of the authorized keys.
+"""
+from django.core.management.base import BaseCommand
+from boulangerie.apps.keys import export
+
+
+class Command(BaseCommand):
+    """
+    Delete the journal entries older than `settings.KEYS_EXPORT['retention']`, cf `export.prune()`.
+    """
+    help = 'Delete the old entries of the authorized keys journal.'
+
+    def handle(self, *args, **options):
+        self.stdout.write('{0} journal entries deleted.'.format(export.prune()))
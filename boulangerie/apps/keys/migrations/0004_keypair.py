@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('keys', '0003_sshkey_owner_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeyPair',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('public', models.TextField()),
+                ('fingerprint', models.TextField(max_length=500, unique=True)),
+                ('private', models.TextField()),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
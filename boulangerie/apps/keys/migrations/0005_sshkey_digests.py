@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('keys', '0004_keypair'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sshkey',
+            name='md5',
+            field=models.BinaryField(max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='sshkey',
+            name='sha256',
+            field=models.BinaryField(max_length=32, null=True),
+        ),
+    ]
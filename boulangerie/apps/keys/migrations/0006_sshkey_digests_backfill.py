@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+def backfill(apps, schema_editor):
+    """
+    Compute the digests of the existing keys, by batches of `BATCH_SIZE` keys:
+    one transaction per batch, the table is not locked for the whole backfill.
+    """
+    from boulangerie.apps.keys.fingerprints import digests
+    SSHKey = apps.get_model('keys', 'SSHKey')
+    keys = SSHKey.objects.using(schema_editor.connection.alias)
+    last = 0
+    while True:
+        batch = list(keys.filter(pk__gt=last, sha256__isnull=True).order_by('pk').values_list('pk', 'public')[:BATCH_SIZE])
+        if not batch:
+            break
+        with transaction.atomic(using=schema_editor.connection.alias):
+            for pk, public in batch:
+                md5, sha256 = digests(public)
+                keys.filter(pk=pk).update(md5=md5, sha256=sha256)
+        last = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('keys', '0005_sshkey_digests'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
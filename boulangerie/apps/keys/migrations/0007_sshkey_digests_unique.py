@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('keys', '0006_sshkey_digests_backfill'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sshkey',
+            name='md5',
+            field=models.BinaryField(max_length=16, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='sshkey',
+            name='sha256',
+            field=models.BinaryField(max_length=32, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='sshkey',
+            name='fingerprint',
+            field=models.TextField(max_length=500),
+        ),
+    ]
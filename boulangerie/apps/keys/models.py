@@ -10,11 +10,14 @@ class SSHKey(models.Model):
         * name : unique for an account(user/organization), slugified.
         * deletable : always true except for the default one
         * owner : the key owner
+        * md5, sha256 : the digests of the key, cf `boulangerie.apps.keys.fingerprints`
     """
     name = models.SlugField(null=False, max_length=50)
     owner = models.SlugField(null=False, max_length=50)
     public = models.TextField()
-    fingerprint = models.TextField(max_length=500, unique=True)
+    fingerprint = models.TextField(max_length=500)
+    md5 = models.BinaryField(max_length=16, unique=True)
+    sha256 = models.BinaryField(max_length=32, unique=True)
     date_created = models.DateTimeField(auto_now_add=True)
     date_modified = models.DateTimeField(auto_now=True)
 
@@ -24,6 +27,8 @@ class SSHKey(models.Model):
         """
         ordering = ('-date_created',)
         unique_together = (('name', 'owner',))
+        #The keys of an owner, sorted.
+        indexes = [models.Index(fields=['owner', '-date_created'], name='sshkey_owner_created_idx')]
 
     #Global permissions:
     @staticmethod
@@ -49,11 +54,7 @@ class SSHKey(models.Model):
         Any authenticated user can create if they don't reach their quota
         """
         from boulangerie.apps.quotas.models import Quota
-        current = SSHKey.objects.filter(owner=request.user.username).count()
-        quota = Quota.objects.get(owner=request.user.username, key='max_keys')
-        if current >= quota.value:
-            return False
-        return True
+        return Quota.objects.available(request.user.username, 'max_keys')
 
     #Object permissions:
     def has_object_read_permission(self, request):
@@ -67,3 +68,23 @@ class SSHKey(models.Model):
         But they can only write theirs SSH keys.
         """
         return self.owner == request.user.username
+
+class KeyPair(models.Model):
+    """
+    KeyPair model, a pre-generated keypair waiting for a registration, cf `boulangerie.apps.keys.pool`:
+        * private : the private key, encrypted.
+    """
+    public = models.TextField()
+    fingerprint = models.TextField(max_length=500, unique=True)
+    private = models.TextField()
+    date_created = models.DateTimeField(auto_now_add=True)
+
+class KeyChange(models.Model):
+    """
+    KeyChange model, the journal of the authorized keys, cf `boulangerie.apps.keys.export`:
+        * sequence : increasing number of the change.
+        * account : the account whose keys or organizations changed.
+    """
+    sequence = models.BigAutoField(primary_key=True)
+    account = models.SlugField(null=False, max_length=50, db_index=False)
+    date_created = models.DateTimeField(auto_now_add=True)
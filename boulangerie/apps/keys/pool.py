@@ -0,0 +1,124 @@
+#-*- coding:utf-8 -*-
+"""
+Pool of pre-generated RSA keypairs: generating a 4096 bits key takes seconds of CPU,
+`boulangerie fill_keypool` does it ahead of the registrations.
+The private keys are encrypted at rest, with AES-CTR and an HMAC-SHA256 (encrypt-then-MAC),
+both derived from `settings.KEYPOOL['secret']`.
+"""
+import base64
+import collections
+import hashlib
+import hmac
+import os
+import time
+import sshpubkeys
+from Crypto.Cipher import AES
+from Crypto.PublicKey import RSA
+from Crypto.Util import Counter
+from django.conf import settings
+from django.db import transaction
+from django.utils.encoding import force_bytes, force_text
+import boulangerie.metrics
+from .models import KeyPair
+
+Keypair = collections.namedtuple('Keypair', ['public', 'private', 'fingerprint'])
+
+NONCE_SIZE = 8
+MAC_SIZE = 32
+
+def _secrets():
+    """
+    The encryption and the authentication keys.
+    """
+    secret = force_bytes(settings.KEYPOOL['secret'])
+    return hashlib.sha256(b'keypool-encryption' + secret).digest(), hashlib.sha256(b'keypool-mac' + secret).digest()
+
+def seal(private):
+    """
+    Encrypt a private key.
+    :param private: The private key, PEM encoded.
+    :type private: str
+    :rtype: str
+    """
+    encryption, mac = _secrets()
+    nonce = os.urandom(NONCE_SIZE)
+    cipher = AES.new(encryption, AES.MODE_CTR, counter=Counter.new(64, prefix=nonce))
+    body = nonce + cipher.encrypt(force_bytes(private))
+    return force_text(base64.b64encode(body + hmac.new(mac, body, hashlib.sha256).digest()))
+
+def unseal(sealed):
+    """
+    Decrypt a private key.
+    :param sealed: The output of `seal()`.
+    :type sealed: str
+    :rtype: str
+    :raises ValueError: if the key was tampered with, or encrypted with another secret.
+    """
+    encryption, mac = _secrets()
+    raw = base64.b64decode(force_bytes(sealed))
+    body, digest = raw[:-MAC_SIZE], raw[-MAC_SIZE:]
+    if not hmac.compare_digest(digest, hmac.new(mac, body, hashlib.sha256).digest()):
+        raise ValueError('Invalid keypair signature.')
+    cipher = AES.new(encryption, AES.MODE_CTR, counter=Counter.new(64, prefix=body[:NONCE_SIZE]))
+    return force_text(cipher.decrypt(body[NONCE_SIZE:]))
+
+def generate(bits=None):
+    """
+    Generate a keypair.
+    :param bits: The key size, `settings.KEYPOOL['bits']` by default.
+    :type bits: None, int
+    :rtype: Keypair
+    """
+    key = RSA.generate(bits or settings.KEYPOOL['bits'])
+    public = key.exportKey('OpenSSH')
+    return Keypair(public=public, private=key.exportKey('PEM'),
+                   fingerprint=sshpubkeys.SSHKey(public).hash_md5())
+
+def depth():
+    """
+    The number of keypairs in the pool.
+    :rtype: int
+    """
+    return KeyPair.objects.count()
+
+def take():
+    """
+    Take a keypair out of the pool, or generate it inline if the pool is empty.
+    The concurrent registrations skip the keypairs locked by each other.
+    :rtype: Keypair
+    """
+    with transaction.atomic():
+        pair = KeyPair.objects.select_for_update(skip_locked=True).order_by('pk').first()
+        if pair is not None:
+            pair.delete()
+    if pair is None:
+        boulangerie.metrics.incr('keypool.misses')
+        return generate()
+    boulangerie.metrics.incr('keypool.taken')
+    return Keypair(public=pair.public, private=unseal(pair.private), fingerprint=pair.fingerprint)
+
+def fill(size=None, bits=None, batch_size=10):
+    """
+    Generate the keypairs missing from the pool.
+    :param size: The pool size, `settings.KEYPOOL['size']` by default.
+    :type size: None, int
+    :param bits: The key size, `settings.KEYPOOL['bits']` by default.
+    :type bits: None, int
+    :param batch_size: Number of keypairs inserted at once.
+    :type batch_size: int
+    :returns: The number of keypairs generated.
+    :rtype: int
+    """
+    missing = (settings.KEYPOOL['size'] if size is None else size) - depth()
+    generated = 0
+    while generated < missing:
+        start = time.time()
+        pairs = [generate(bits) for _ in range(min(batch_size, missing - generated))]
+        KeyPair.objects.bulk_create([KeyPair(public=pair.public, fingerprint=pair.fingerprint, private=seal(pair.private))
+                                     for pair in pairs])
+        elapsed = time.time() - start
+        generated += len(pairs)
+        boulangerie.metrics.incr('keypool.generated', len(pairs))
+        boulangerie.metrics.timing('keypool.refill', elapsed)
+        boulangerie.metrics.gauge('keypool.refill_rate', len(pairs) / elapsed if elapsed else 0.0)
+    return generated
@@ -6,6 +6,7 @@ Serializers for the keys.
 import sshpubkeys
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
+from .fingerprints import decode
 from .models import SSHKey
 
 
@@ -18,12 +19,12 @@ class SSHKeySerializer(serializers.ModelSerializer):
     def validate_public(self, data):
         """
         Validate the public key,
-        and generate the fingerprint.
+        and generate the fingerprint and the digests.
         :param data: The public key to validate.
         :type data: str
         :returns: The validated public key
         :rtype: str
-        :raises serializers.ValidationError: If the public key is invalid.
+        :raises serializers.ValidationError: If the public key is invalid or already exists.
         """
         try:
             ssh = sshpubkeys.SSHKey(data)
@@ -33,8 +34,16 @@ class SSHKeySerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Invalid key")
         fingerprint = ssh.hash_md5()
         self.initial_data['fingerprint'] = fingerprint
+        md5, sha256 = decode(fingerprint)[1], decode(ssh.hash_sha256())[1]
+        if SSHKey.objects.filter(sha256=sha256).exists():#pylint:disable=no-member
+            raise serializers.ValidationError("This key already exists.")
+        self.digests = {'md5': md5, 'sha256': sha256}#pylint:disable=attribute-defined-outside-init
         return data
 
+    def create(self, validated_data):
+        validated_data.update(self.digests)
+        return super(SSHKeySerializer, self).create(validated_data)
+
     def validate_name(self, value):
         return value.lower()
 
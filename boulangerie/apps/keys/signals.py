@@ -5,13 +5,14 @@ Signal handler for keys.
 import boulangerie.broker
 from django.dispatch import receiver
 from django.db.models.signals import post_delete, post_save
+from . import authorization, export
 from .models import SSHKey
 
 @receiver(post_save, sender=SSHKey)
 def create_key(sender, instance, **kwargs):#pylint:disable=unused-argument
     """
     When creating a key,
-    we need to send a message to our broker.
+    we need to send a message to our broker, and to journal it for the export.
     :param sender: The signal sender model class.
     :type sender: boulangerie.apps.projects.models.SSHKey
     :param instance: The signal sender instance.
@@ -27,13 +28,14 @@ def create_key(sender, instance, **kwargs):#pylint:disable=unused-argument
         if hasattr(instance, 'organization_creation'):
             payload['organization_creation'] = instance.organization_creation
             payload['organization'] = '{0}-default'.format(instance.owner)
-        boulangerie.broker.send(payload, 'create-key', 'git')
+        boulangerie.broker.send(payload, 'create-key', 'git', aggregate=instance.owner)
+        export.journal(instance.owner)
 
 @receiver(post_delete, sender=SSHKey)
 def delete_key(sender, instance, **kwargs):#pylint:disable=unused-argument
     """
     When deleting a key,
-    we need to send a message to our broker.
+    we need to send a message to our broker, and to journal it for the export.
     :param sender: The signal sender.
     :type sender: boulangerie.apps.projects.models.SSHKey
     :param instance: The signal sender instance.
@@ -43,4 +45,21 @@ def delete_key(sender, instance, **kwargs):#pylint:disable=unused-argument
     :rtype:None
     """
     payload = {'key': instance.public, 'user': instance.owner}
-    boulangerie.broker.send(payload, 'delete-key', 'git')
+    boulangerie.broker.send(payload, 'delete-key', 'git', aggregate=instance.owner)
+    export.journal(instance.owner)
+
+@receiver(post_save, sender=SSHKey)
+@receiver(post_delete, sender=SSHKey)
+def invalidate_key(sender, instance, **kwargs):#pylint:disable=unused-argument
+    """
+    When creating or deleting a key,
+    we need to drop the cached git accesses of its digests.
+    :param sender: The signal sender.
+    :type sender: boulangerie.apps.keys.models.SSHKey
+    :param instance: The signal sender instance.
+    :type instance: boulangerie.apps.keys.models.SSHKey
+    :param kwargs: Context.
+    :type kwargs: django.db.models.base.ModelBase
+    :rtype:None
+    """
+    authorization.invalidate(keys=[instance])
@@ -0,0 +1,157 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the git accesses resolution.
+"""
+#pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,invalid-name,no-member
+import time
+import sshpubkeys
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+import boulangerie.metrics
+from boulangerie.apps.keys.models import SSHKey
+from boulangerie.apps.organizations.tests.fixtures import member_factory
+from boulangerie.apps.projects.models import Project
+from boulangerie.apps.projects.tests.fixtures import project_factory
+from .fixtures import *
+
+@pytest.fixture
+def authorize(admin1, login):
+    """
+    Query the resolution endpoint as an admin.
+    """
+    token = login(admin1)
+    def query(fingerprint, repo):
+        """
+        Takes the fingerprint and the repository, returns the decision.
+        """
+        client = APIClient()
+        response = client.get('/api/0.1/keys/authorize/', {'fingerprint': fingerprint, 'repo': repo}, HTTP_AUTHORIZATION='JWT {}'.format(token))
+        assert response.status_code == 200
+        return response.json()
+    return query
+
+@pytest.fixture
+def repo(user1, login, key_factory, project_factory, pubkey1):
+    """
+    A project of user1, with a key of user1.
+    Returns the fingerprint and the repository.
+    """
+    token = login(user1)
+    key_factory('my_key', token, pubkey1)
+    project_factory('app', token, 'user1-default')
+    return SSHKey.objects.get(owner='user1', name='my_key').fingerprint, 'user1-default.app'
+
+def key_queries(context):
+    """
+    The queries on the keys table.
+    """
+    return [query for query in context.captured_queries if 'keys_sshkey' in query['sql']]
+
+def test_authorize_owner(repo, authorize):
+    """
+    The owner of the organization can access the repository.
+    """
+    fingerprint, name = repo
+    assert authorize(fingerprint, name) == {'allow': True, 'account': 'user1', 'role': 'owner'}
+
+def test_authorize_denied(repo, authorize, user2, login, key_factory, pubkey2):
+    """
+    The keys of the other accounts, the unknown keys and repositories are denied.
+    """
+    fingerprint, name = repo
+    key_factory('my_key', login(user2), pubkey2)
+    other = SSHKey.objects.get(owner='user2').fingerprint
+    assert authorize(other, name) == {'allow': False, 'account': 'user2', 'role': None}
+    assert authorize('MD5:' + ':'.join(['00'] * 16), name) == {'allow': False, 'account': None, 'role': None}
+    assert authorize('00:00', name) == {'allow': False, 'account': None, 'role': None}
+    assert authorize(fingerprint, 'user1-default.unknown') == {'allow': False, 'account': 'user1', 'role': None}
+    assert authorize(fingerprint, 'user1-default')['allow'] is False
+
+def test_authorize_sha256(repo, authorize, pubkey1):
+    """
+    The keys are resolved from their SHA256 fingerprint too.
+    """
+    _, name = repo
+    fingerprint = sshpubkeys.SSHKey(pubkey1).hash_sha256()
+    assert authorize(fingerprint, name) == {'allow': True, 'account': 'user1', 'role': 'owner'}
+
+def test_authorize_admins_only(repo, user1, login):
+    """
+    The endpoint is restricted to the admins.
+    """
+    fingerprint, name = repo
+    client = APIClient()
+    response = client.get('/api/0.1/keys/authorize/', {'fingerprint': fingerprint, 'repo': name}, HTTP_AUTHORIZATION='JWT {}'.format(login(user1)))
+    assert response.status_code == 403
+
+def test_authorize_parameters(authorize, admin1, login):
+    """
+    The fingerprint and the repository are required.
+    """
+    client = APIClient()
+    response = client.get('/api/0.1/keys/authorize/', {'repo': 'user1-default.app'}, HTTP_AUTHORIZATION='JWT {}'.format(login(admin1)))
+    assert response.status_code == 400
+
+def test_authorize_cached(repo, authorize):
+    """
+    The decision is cached: the keys are not read anymore.
+    """
+    fingerprint, name = repo
+    authorize(fingerprint, name)
+    with CaptureQueriesContext(connection) as context:
+        assert authorize(fingerprint, name)['allow']
+    assert not key_queries(context)
+
+def test_authorize_no_account(repo, authorize):
+    """
+    The admin flag is read from the cached status: the git server is authorized without loading its account.
+    """
+    fingerprint, name = repo
+    authorize(fingerprint, name)
+    boulangerie.metrics.reset()
+    with CaptureQueriesContext(connection) as context:
+        assert authorize(fingerprint, name)['allow']
+    assert not [query for query in context.captured_queries if 'accounts_account' in query['sql']]
+    assert boulangerie.metrics.snapshot()['counters'].get('principal.loads', 0) == 0
+
+def test_authorize_invalidated(repo, authorize, user1, user2, login, key_factory, member_factory, pubkey2):
+    """
+    The cached decisions follow the keys, the members and the projects.
+    """
+    fingerprint, name = repo
+    key_factory('my_key', login(user2), pubkey2)
+    other = SSHKey.objects.get(owner='user2').fingerprint
+    assert authorize(other, name) == {'allow': False, 'account': 'user2', 'role': None}
+    member_factory('user1-default', user2, login(user1), is_admin=True)
+    assert authorize(other, name) == {'allow': True, 'account': 'user2', 'role': 'admin'}
+    SSHKey.objects.get(owner='user2').delete()
+    assert authorize(other, name)['allow'] is False
+    assert authorize(fingerprint, name)['allow'] is True
+    Project.objects.get(owner='user1-default', name='app').delete()
+    assert authorize(fingerprint, name)['allow'] is False
+
+@pytest.mark.parametrize('shared', [True, False])
+def test_authorize_workers(shared, tmpdir, monkeypatch, repo, authorize):
+    """
+    A key deleted on a worker is denied by the others:
+    right away with a shared cache, once the decision expires with a cache per worker.
+    """
+    from django.core.cache.backends.filebased import FileBasedCache
+    import django.core.cache.backends.locmem
+    from boulangerie.apps.keys import authorization
+    from boulangerie.cache import LRUCache
+    if shared:
+        workers = [{'authorization': FileBasedCache(str(tmpdir), {})} for _ in range(2)]
+    else:
+        workers = [{'authorization': LRUCache('authorization-worker{0}'.format(index), {'TIMEOUT': 5})} for index in range(2)]
+    fingerprint, name = repo
+    monkeypatch.setattr(authorization, 'caches', workers[1])
+    assert authorize(fingerprint, name)['allow']
+    monkeypatch.setattr(authorization, 'caches', workers[0])
+    SSHKey.objects.get(owner='user1').delete()
+    monkeypatch.setattr(authorization, 'caches', workers[1])
+    assert authorize(fingerprint, name)['allow'] is not shared
+    now = time.time()
+    monkeypatch.setattr(django.core.cache.backends.locmem.time, 'time', lambda: now + 6)
+    assert authorize(fingerprint, name)['allow'] is False
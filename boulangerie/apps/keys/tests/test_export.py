@@ -0,0 +1,126 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the authorized keys export.
+"""
+#pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,invalid-name,no-member
+import datetime
+import json
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+from django.utils.six import StringIO
+from rest_framework.test import APIClient
+from boulangerie.apps.keys import export as export_
+from boulangerie.apps.keys.models import KeyChange, SSHKey
+from boulangerie.apps.organizations.tests.fixtures import member_factory, orga_factory
+from .fixtures import *
+
+@pytest.fixture
+def export(admin1, login, settings):
+    """
+    Query the export endpoint as an admin, the journal entries settled right away.
+    """
+    settings.KEYS_EXPORT = dict(settings.KEYS_EXPORT, settle=0)
+    token = login(admin1)
+    def query(since=None):
+        """
+        Returns the sequence and the entries, by account.
+        """
+        client = APIClient()
+        params = {} if since is None else {'since': since}
+        response = client.get('/api/0.1/keys/export/', params, HTTP_AUTHORIZATION='JWT {}'.format(token))
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        return lines[0]['sequence'], dict((entry['account'], entry) for entry in lines[1:])
+    return query
+
+def test_snapshot(user1, user2, login, key_factory, export, pubkey1, pubkey2):
+    """
+    The snapshot carries the accounts having a key, with their keys and organizations.
+    """
+    key_factory('key1', login(user1), pubkey1)
+    key_factory('key2', login(user1), pubkey2)
+    sequence, entries = export()
+    assert sequence == KeyChange.objects.latest('sequence').sequence
+    assert sorted(entries) == ['user1']
+    assert sorted(entries['user1']['keys']) == sorted([pubkey1, pubkey2])
+    assert entries['user1']['organizations'] == ['user1-default']
+
+def test_deltas(user1, user2, login, key_factory, orga_factory, member_factory, export, pubkey1, pubkey2):
+    """
+    The deltas carry the accounts whose keys or organizations changed since the sequence.
+    """
+    key_factory('key1', login(user1), pubkey1)
+    key_factory('key2', login(user2), pubkey2)
+    sequence, _ = export()
+    assert export(sequence) == (sequence, {})
+    orga_factory('my_orga', login(user1))
+    member_factory('my_orga', user2, login(user1))
+    sequence, entries = export(sequence)
+    assert sorted(entries) == ['user1', 'user2']
+    assert entries['user2'] == {'account': 'user2', 'keys': [pubkey2], 'organizations': ['my_orga', 'user2-default']}
+    SSHKey.objects.get(owner='user2').delete()
+    _, entries = export(sequence)
+    assert entries == {'user2': {'account': 'user2', 'keys': [], 'organizations': ['my_orga', 'user2-default']}}
+
+def test_deltas_settle(user1, login, key_factory, export, settings, pubkey1):
+    """
+    The sequence doesn't move past the recent entries: they are sent again.
+    """
+    sequence, _ = export()
+    settings.KEYS_EXPORT = dict(settings.KEYS_EXPORT, settle=60)
+    key_factory('key1', login(user1), pubkey1)
+    assert export(sequence)[0] == sequence
+    assert sorted(export(sequence)[1]) == ['user1']
+
+def test_export_admins_only(user1, login):
+    """
+    The export is restricted to the admins.
+    """
+    client = APIClient()
+    response = client.get('/api/0.1/keys/export/', HTTP_AUTHORIZATION='JWT {}'.format(login(user1)))
+    assert response.status_code == 403
+
+def test_export_invalid_sequence(admin1, login):
+    """
+    The sequence must be an integer.
+    """
+    client = APIClient()
+    response = client.get('/api/0.1/keys/export/', {'since': 'toto'}, HTTP_AUTHORIZATION='JWT {}'.format(login(admin1)))
+    assert response.status_code == 400
+
+def test_export_command(user1, login, key_factory, settings, pubkey1):
+    """
+    The command writes the same JSON lines.
+    """
+    settings.KEYS_EXPORT = dict(settings.KEYS_EXPORT, settle=0)
+    key_factory('key1', login(user1), pubkey1)
+    stdout = StringIO()
+    call_command('export_keys', stdout=stdout)
+    lines = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert lines[0] == {'sequence': KeyChange.objects.latest('sequence').sequence}
+    assert lines[1] == {'account': 'user1', 'keys': [pubkey1], 'organizations': ['user1-default']}
+    stdout = StringIO()
+    call_command('export_keys', since=lines[0]['sequence'], stdout=stdout)
+    assert stdout.getvalue().splitlines() == [json.dumps(lines[0])]
+
+def test_prune(user1, user2, admin1, login, key_factory, export, pubkey1, pubkey2):
+    """
+    The entries older than the retention are pruned, but the newest of them:
+    the deltas since a pruned sequence are refused, the gateway takes a new snapshot.
+    """
+    key_factory('key1', login(user1), pubkey1)
+    key_factory('key2', login(user2), pubkey2)
+    KeyChange.objects.update(date_created=timezone.now() - datetime.timedelta(days=8))
+    newest = KeyChange.objects.latest('sequence').sequence
+    count = KeyChange.objects.count()
+    export_.journal('user1')
+    stdout = StringIO()
+    call_command('prune_keys_journal', stdout=stdout)
+    assert stdout.getvalue() == '{0} journal entries deleted.\n'.format(count - 1)
+    assert KeyChange.objects.count() == 2
+    assert sorted(export(newest - 1)[1]) == ['user1', 'user2']
+    response = APIClient().get('/api/0.1/keys/export/', {'since': newest - 2}, HTTP_AUTHORIZATION='JWT {}'.format(login(admin1)))
+    assert response.status_code == 410
+    with pytest.raises(CommandError):
+        call_command('export_keys', since=newest - 2, stdout=StringIO())
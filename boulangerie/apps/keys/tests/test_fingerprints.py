@@ -0,0 +1,47 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the key digests.
+"""
+#pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,invalid-name,no-member
+import sshpubkeys
+from rest_framework.test import APIClient
+from boulangerie.apps.keys.fingerprints import decode, digests, encode_md5
+from boulangerie.apps.keys.models import SSHKey
+from .fixtures import *
+
+def test_digests(pubkey1):
+    """
+    The digests match the text fingerprints of the key.
+    """
+    ssh = sshpubkeys.SSHKey(pubkey1)
+    md5, sha256 = digests(pubkey1)
+    assert len(md5) == 16 and len(sha256) == 32
+    assert decode(ssh.hash_md5()) == ('md5', md5)
+    assert decode(ssh.hash_md5()[len('MD5:'):]) == ('md5', md5)
+    assert decode(ssh.hash_sha256()) == ('sha256', sha256)
+    assert encode_md5(md5) == ssh.hash_md5()
+
+def test_digests_invalid_key():
+    """
+    A key which can't be parsed is hashed as a whole.
+    """
+    assert digests('ssh-rsa AAAA one') != digests('ssh-rsa AAAA two')
+
+def test_decode_invalid():
+    """
+    The fingerprints of the wrong length or encoding are rejected.
+    """
+    for fingerprint in ('MD5:00:11', 'SHA256:AAAA', 'MD5:zz', 'toto'):
+        with pytest.raises(ValueError):
+            decode(fingerprint)
+
+def test_creation_digests(user1, login, pubkey1):
+    """
+    The digests of a created key are stored.
+    """
+    client = APIClient()
+    response = client.post('/api/0.1/keys/', {'name': 'my_key', 'public': pubkey1}, format='json', HTTP_AUTHORIZATION='JWT {}'.format(login(user1)))
+    assert response.status_code == 201
+    key = SSHKey.objects.get(owner='user1', name='my_key')
+    assert (bytes(key.md5), bytes(key.sha256)) == digests(pubkey1)
+    assert SSHKey.objects.filter(sha256=digests(pubkey1)[1]).exists()
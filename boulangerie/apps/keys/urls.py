@@ -3,9 +3,14 @@
 Urls for keys.
 """
 #pylint:disable=invalid-name
+from django.conf.urls import url
 from rest_framework import routers
-from .views import SSHKeysViewSet
+from .views import SSHKeysViewSet, authorize, export_keys
 
 router = routers.SimpleRouter()
 router.register(r'keys', SSHKeysViewSet, 'Keys')
-urlpatterns = router.urls
+#Before the router, which would take `authorize` for a key name.
+urlpatterns = [
+    url(r'^keys/authorize/$', authorize),
+    url(r'^keys/export/$', export_keys),
+] + router.urls
@@ -1,10 +1,15 @@
 """
 Views for the Keys.
 """
+import json
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets
 from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from dry_rest_permissions.generics import DRYPermissions#pylint:disable=import-error
+from . import authorization, export
 from .serializers import SSHKeySerializer
 from .models import SSHKey
 
@@ -33,3 +38,33 @@ class SSHKeysViewSet(viewsets.ModelViewSet):#pylint:disable=too-many-ancestors
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+@api_view(['GET'])
+@permission_classes((IsAdminUser,))
+def authorize(request):
+    """
+    Resolve the access of a SSH key to a repository, for the git server, admins only:
+    `?fingerprint=<fingerprint>&repo=<organization>.<project>`.
+    """
+    fingerprint = request.query_params.get('fingerprint')
+    repo = request.query_params.get('repo')
+    if not fingerprint or not repo:
+        return Response({'detail': 'The fingerprint and the repo are required.'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(authorization.authorize(fingerprint, repo))
+
+@api_view(['GET'])
+@permission_classes((IsAdminUser,))
+def export_keys(request):
+    """
+    Stream the authorized keys for the gateways, as JSON lines, admins only:
+    the snapshot, or the deltas with `?since=<sequence>`, cf `boulangerie.apps.keys.export`.
+    """
+    since = request.query_params.get('since')
+    if since is None:
+        entries = export.snapshot()
+    else:
+        try:
+            entries = export.deltas(int(since))
+        except ValueError:
+            return Response({'detail': 'The sequence must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+    return StreamingHttpResponse((json.dumps(entry) + '\n' for entry in entries), content_type='application/x-ndjson')
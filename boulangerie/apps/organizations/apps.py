@@ -9,6 +9,7 @@ class OrganizationsConfig(AppConfig):
 
     def ready(self):
         """
-        Import the organizations signal handlers.
+        Import the organizations signal handlers, and the checks of the membership cache.
         """
         import boulangerie.apps.organizations.signals
+        import boulangerie.checks
@@ -0,0 +1,92 @@
+#-*- coding:utf-8 -*-
+"""
+Request-scoped membership resolver:
+the role flags of an (organization, account) pair are loaded once,
+from the token claims, the membership cache or with one query,
+then memoized for the rest of the request.
+"""
+from boulangerie.apps.accounts.tokens import get_claims
+from .models import Membership, NOT_MEMBER, Organization
+
+#The flags granted by each role claim.
+ROLES = {
+    'owner': Membership(is_member=True, is_admin=True, is_owner=True),
+    'admin': Membership(is_member=True, is_admin=True, is_owner=False),
+    'member': Membership(is_member=True, is_admin=False, is_owner=False),
+}
+
+class MembershipResolver(object):
+    """
+    Resolve the memberships of the accounts, for a single request.
+    """
+
+    def __init__(self, account, claims=None):
+        """
+        :param account: The account of the request user.
+        :type account: str
+        :param claims: The current organization claims of the request user, if any.
+        :type claims: None, dict
+        :rtype: None
+        """
+        self.account = account
+        self.claims = claims
+        self.memberships = {}
+
+    def get(self, organization, account=None):
+        """
+        Retrieve the membership of the `account` in the `organization`.
+        :param organization: The organization name.
+        :type organization: str
+        :param account: The account, the request user by default.
+        :type account: None, str
+        :rtype: Membership
+        """
+        account = account or self.account
+        key = (organization, account)
+        if key not in self.memberships:
+            if self.claims is not None and account == self.account:
+                self.memberships[key] = ROLES.get(self.claims.get(organization), NOT_MEMBER)
+            else:
+                self.memberships[key] = Organization.objects.membership(organization, account)
+        return self.memberships[key]
+
+    def has_member(self, organization, account=None, is_admin=None, is_owner=None):
+        """
+        Check if the account is in the organization,
+        same semantic as `Organization.objects.has_member`.
+        :rtype: bool
+        """
+        membership = self.get(organization, account)
+        if not membership.is_member:
+            return False
+        if is_owner is not None:
+            return membership.is_owner == is_owner
+        if is_admin is not None:
+            return membership.is_admin == is_admin
+        return True
+
+    def forget(self, organization, account=None):
+        """
+        Drop the memoized membership, ie: after updating it within the request.
+        :rtype: None
+        """
+        self.memberships.pop((organization, account or self.account), None)
+        if account in (None, self.account):
+            self.claims = None
+
+def get_resolver(request):
+    """
+    Retrieve the resolver of the `request`, created on first use.
+    It is stored on the Django request, shared by the DRF request wrapping it,
+    the permissions and the views.
+    :param request: The request.
+    :type request: rest_framework.request.Request, django.http.HttpRequest
+    :rtype: MembershipResolver
+    """
+    account = request.user.username
+    http_request = getattr(request, '_request', request)
+    resolver = getattr(http_request, 'membership_resolver', None)
+    if resolver is None or resolver.account != account:
+        resolver = MembershipResolver(account, get_claims(request))
+        http_request.membership_resolver = resolver
+    return resolver
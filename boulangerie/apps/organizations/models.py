@@ -5,41 +5,95 @@ Pretty naive.
 """
 from __future__ import unicode_literals
 
-from django.db import models
-from django.contrib.contenttypes.models import ContentType
+import collections
+from django.core.cache import caches
+from django.db import models, transaction
 from dry_rest_permissions.generics import authenticated_users #pylint:disable=import-error
+import boulangerie.metrics
 
+Membership = collections.namedtuple('Membership', ['is_member', 'is_admin', 'is_owner'])
+
+NOT_MEMBER = Membership(is_member=False, is_admin=False, is_owner=False)
 
 class OrganizationManager(models.Manager):
     """
     Manager for organization.
+    The memberships are kept in the `membership` cache,
+    invalidated by the `Member` and `Organization` signals.
     """
 
+    @staticmethod
+    def _cached(key, load):
+        """
+        Retrieve `key` from the membership cache, `load()` it on a miss.
+        """
+        cache = caches['membership']
+        value = cache.get(key)
+        if value is None:
+            boulangerie.metrics.incr('membership_cache.misses')
+            value = load()
+            cache.set(key, value)
+        else:
+            boulangerie.metrics.incr('membership_cache.hits')
+        return value
+
+    def membership(self, organization, account):
+        """
+        Retrieve the role flags of the account in the organization.
+        :rtype: Membership
+        """
+        if not organization or not account:
+            return NOT_MEMBER
+        def load():
+            flags = Member.objects.filter(account=account, organization=organization)\
+                                  .values_list('is_admin', 'is_owner').first()
+            return (True,) + tuple(flags) if flags else tuple(NOT_MEMBER)
+        return Membership(*self._cached(u'membership:{0}:{1}'.format(organization, account), load))
+
+    def memberships(self, account):
+        """
+        Retrieve the role flags of the account in all its organizations.
+        :returns: The (organization, is_admin, is_owner) of the account.
+        :rtype: list
+        """
+        def load():
+            return list(Member.objects.filter(account=account)\
+                                      .values_list('organization', 'is_admin', 'is_owner'))
+        return self._cached(u'memberships:{0}'.format(account), load)
+
+    def invalidate(self, organization, account):
+        """
+        Drop the cached memberships of the account, right now and once the transaction is committed:
+        a concurrent request could cache the former state in the meantime.
+        """
+        keys = [u'membership:{0}:{1}'.format(organization, account), u'memberships:{0}'.format(account)]
+        def delete():
+            caches['membership'].delete_many(keys)
+            boulangerie.metrics.incr('membership_cache.invalidations')
+        delete()
+        transaction.on_commit(delete)
+
     def by_member(self, account, is_admin=None, is_owner=None):
         """
         Retrieve the organizations that an account belongs to.
         """
-        if is_owner is not None:
-            accounts = Member.objects.filter(account=account, is_owner=is_owner).values('organization')
-        elif is_admin is not None:
-            accounts = Member.objects.filter(account=account, is_admin=is_admin).values('organization')
-        else:
-            accounts = Member.objects.filter(account=account).values('organization')
-        return self.get_queryset().filter(name__in=accounts)
+        names = [name for name, admin, owner in self.memberships(account)
+                 if (is_owner is None or owner == is_owner) and
+                 (is_owner is not None or is_admin is None or admin == is_admin)]
+        return self.get_queryset().filter(name__in=names)
 
     def has_member(self, organization, account, is_admin=None, is_owner=None):
         """
         Check if the account is in the organization.
         """
-        if not organization or not account:
+        membership = self.membership(organization, account)
+        if not membership.is_member:
             return False
         if is_owner is not None:
-            exist = Member.objects.filter(account=account, organization=organization, is_owner=is_owner).first()
-        elif is_admin is not None:
-            exist = Member.objects.filter(account=account, organization=organization, is_admin=is_admin).first()
-        else:
-            exist = Member.objects.filter(account=account, organization=organization).first()
-        return bool(exist)
+            return membership.is_owner == is_owner
+        if is_admin is not None:
+            return membership.is_admin == is_admin
+        return True
 
 class Organization(models.Model):
     """
@@ -60,15 +114,23 @@ class Organization(models.Model):
         """
         ordering = ('-date_created',)
 
+    def delete(self, *args, **kwargs):#pylint:disable=arguments-differ
+        """
+        Delete the members with a single statement, without their `delete-member` events:
+        the `delete-organization` event carries the list of the members instead.
+        """
+        members = Member.objects.filter(organization=self.name).order_by('account')
+        flags = list(members.values_list('account', 'is_owner'))
+        self.members = [account for account, _ in flags]
+        self.owners = [account for account, is_owner in flags if is_owner]
+        members._raw_delete(members.db)#pylint:disable=protected-access
+        return super(Organization, self).delete(*args, **kwargs)
+
     def has_member(self, account, is_owner=None):
         """
         Check if the account is in the organization.
         """
-        if is_owner is not None:
-            exist = Member.objects.filter(account=account, organization=self.name, is_owner=is_owner).first()
-        else:
-            exist = Member.objects.filter(account=account, organization=self.name).first()
-        return bool(exist)
+        return Organization.objects.has_member(self.name, account, is_owner=is_owner)
 
     def stats(self):
         """
@@ -104,25 +166,22 @@ class Organization(models.Model):
         Any authenticated user can create if they don't reach their quota.
         """
         from boulangerie.apps.quotas.models import Quota
-        owner_type = ContentType.objects.get(app_label='accounts', model='account')
-        current = Organization.objects.by_member(request.user.username, is_owner=True).count()
-        quota = Quota.objects.get(owner=request.user.username, key='max_organizations')
-        if current >= quota.value:
-            return False
-        return True
+        return Quota.objects.available(request.user.username, 'max_organizations')
 
     #Object permissions:
     def has_object_read_permission(self, request):
         """
         But they can only read the organizations they are members.
         """
-        return self.has_member(request.user.username)
+        from .membership import get_resolver
+        return get_resolver(request).has_member(self.name)
 
     def has_object_write_permission(self, request):
         """
         But they can only write the organizations they are owners.
         """
-        return self.has_member(request.user.username, is_owner=True)
+        from .membership import get_resolver
+        return get_resolver(request).has_member(self.name, is_owner=True)
 
 class Member(models.Model):
     """
@@ -142,6 +201,8 @@ class Member(models.Model):
         """
         unique_together = (('organization', 'account',))
         ordering = ('-date_created',)
+        #The memberships of an account, by `by_member` and the members listing.
+        indexes = [models.Index(fields=['account', '-date_created'], name='member_account_created_idx')]
 
     #Global permissions:
     @staticmethod
@@ -173,19 +234,22 @@ class Member(models.Model):
         """
         But they can only read members from their organizations.
         """
-        return self.organization.has_member(request.user.username)
+        from .membership import get_resolver
+        return get_resolver(request).has_member(self.organization_id)
 
     def has_object_write_permission(self, request):
         """
         But they can only update a member if they are admin.
         """
-        return self.organization.has_member(request.user.username, is_admin=True)
+        from .membership import get_resolver
+        return get_resolver(request).has_member(self.organization_id, is_admin=True)
 
     def has_object_destroy_permission(self, request):
         """
         But they can only delete a member if they are admin/owner.
         """
-        return self.organization.has_member(request.user.username, is_admin=True)
+        from .membership import get_resolver
+        return get_resolver(request).has_member(self.organization_id, is_admin=True)
 
 class Invitation(models.Model):
     """
@@ -244,4 +308,5 @@ class Invitation(models.Model):
         """
         But they can only accept/refuse theirs invitations.
         """
-        return self.account == request.user.username or bool(Organization.objects.has_member(request.user.username, admin=True).first())
+        from .membership import get_resolver
+        return self.account == request.user.username or get_resolver(request).has_member(self.organization_id, is_admin=True)
@@ -7,6 +7,7 @@ from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator, UniqueTogetherValidator
 from boulangerie.apps.accounts.models import Account
+from boulangerie.apps.quotas.models import Quota, QuotaExceeded
 from .models import Invitation, Member, Organization
 
 
@@ -44,8 +45,10 @@ class OrganizationSerializer(serializers.ModelSerializer):
         return value
 
     def create(self, validated_data):
-        orga = Organization.objects.create(**validated_data)
         account = self.context['request'].user.username
+        if not Quota.objects.reserve(account, 'max_organizations'):
+            raise QuotaExceeded()
+        orga = Organization.objects.create(**validated_data)
         Member.objects.create(account=account, organization=orga, is_owner=True, is_admin=True)
         return orga
 
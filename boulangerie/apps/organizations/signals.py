@@ -3,16 +3,16 @@
 Signal handler for organizations.
 """
 import boulangerie.broker
-import signal_disabler
 from django.dispatch import receiver
 from django.db.models.signals import post_delete, post_save
 from boulangerie.apps.accounts.models import Account
+from boulangerie.apps.keys import authorization, export
 from .models import Member, Organization
 
 @receiver(post_save, sender=Account)
 def default_organization(sender, **kwargs):#pylint:disable=unused-argument
     """
-    When creating an account,
+    When creating an account outside of the registration (ie: createsuperuser),
     create the default organization.
     :param sender: The signal sender.
     :type sender: boulangerie.apps.accounts.models.Account
@@ -21,16 +21,14 @@ def default_organization(sender, **kwargs):#pylint:disable=unused-argument
     :rtype:None
     """
     if kwargs.get('created'):
-        account = kwargs['instance'].username
-        orga = Organization.objects.create(name='{}-default'.format(account), description='default', deletable=False)
-        with signal_disabler.disable():
-            Member.objects.create(account=account, organization=orga, is_owner=True, is_admin=True)#pylint:disable=no-member
+        from boulangerie.apps.accounts.provisioning import provision
+        provision([kwargs['instance'].username])
 
 @receiver(post_save, sender=Member)
 def create_member(sender, instance, **kwargs):#pylint:disable=unused-argument
     """
     When adding a member to an organization
-    we need to send a message to our broker.
+    we need to send a message to our broker, and to journal it for the keys export.
     :param sender: The signal sender model class.
     :type sender: boulangerie.apps.projects.models.Member
     :param instance: The signal sender instance.
@@ -41,13 +39,14 @@ def create_member(sender, instance, **kwargs):#pylint:disable=unused-argument
     """
     if kwargs.get('created'):
         payload = {'organization': instance.organization.name, 'account': instance.account}
-        boulangerie.broker.send(payload, 'create-member', 'git')
+        boulangerie.broker.send(payload, 'create-member', 'git', aggregate=instance.organization.name)
+        export.journal(instance.account)
 
 @receiver(post_delete, sender=Member)
 def delete_member(sender, instance, **kwargs):#pylint:disable=unused-argument
     """
     When deleting a member from an organization,
-    we need to send a message to our broker.
+    we need to send a message to our broker, and to journal it for the keys export.
     :param sender: The signal sender.
     :type sender: boulangerie.apps.projects.models.Member
     :param instance: The signal sender instance.
@@ -57,13 +56,32 @@ def delete_member(sender, instance, **kwargs):#pylint:disable=unused-argument
     :rtype:None
     """
     payload = {'organization': instance.organization.name, 'account': instance.account}
-    boulangerie.broker.send(payload, 'delete-member', 'git')
+    boulangerie.broker.send(payload, 'delete-member', 'git', aggregate=instance.organization.name)
+    export.journal(instance.account)
+
+@receiver(post_save, sender=Member)
+@receiver(post_delete, sender=Member)
+def invalidate_member(sender, instance, **kwargs):#pylint:disable=unused-argument
+    """
+    When adding, updating or deleting a member,
+    we need to drop its cached membership, its token claims and its git accesses.
+    :param sender: The signal sender.
+    :type sender: boulangerie.apps.organizations.models.Member
+    :param instance: The signal sender instance.
+    :type instance: boulangerie.apps.organizations.models.Member
+    :param kwargs: Context.
+    :type kwargs: django.db.models.base.ModelBase
+    :rtype:None
+    """
+    Organization.objects.invalidate(instance.organization_id, instance.account)
+    Account.objects.bump_membership_version(instance.account)
+    authorization.invalidate(organizations=[instance.organization_id])
 
 @receiver(post_delete, sender=Organization)
 def delete_organization(sender, instance, **kwargs):#pylint:disable=unused-argument
     """
-    When deleting a member from an organization,
-    we need to send a message to our broker.
+    When deleting an organization,
+    we need to send a message to our broker, with its members, and to journal them for the keys export.
     :param sender: The signal sender.
     :type sender: boulangerie.apps.projects.models.Organization
     :param instance: The signal sender instance.
@@ -73,4 +91,11 @@ def delete_organization(sender, instance, **kwargs):#pylint:disable=unused-argum
     :rtype:None
     """
     payload = {'organization': instance.name}
-    boulangerie.broker.send(payload, 'delete-organization', 'git')
+    if hasattr(instance, 'members'):
+        payload['members'] = instance.members
+        for account in instance.members:
+            Organization.objects.invalidate(instance.name, account)
+        Account.objects.bump_membership_version(*instance.members)
+        export.journal(*instance.members)
+    authorization.invalidate(organizations=[instance.name])
+    boulangerie.broker.send(payload, 'delete-organization', 'git', aggregate=instance.name)
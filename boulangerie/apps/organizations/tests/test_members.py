@@ -329,9 +329,9 @@ def test_created_send_broker_message(broker_git_create_member, orga_factory, log
     token1 = login(user1)
     orga_factory('my_orga', token1)
     member_factory('my_orga', user2, token1)
-    #
-    msg = json.loads(next(queue.consume()).body)
-    assert msg == {'organization': 'my_orga', 'account': 'user2'}
+    #The owner's membership is published first, with the organization.
+    messages = [json.loads(message.body) for message in queue.consume()]
+    assert [msg for msg in messages if msg['account'] == 'user2'] == [{'organization': 'my_orga', 'account': 'user2'}]
 
 def test_member_broker_message(broker_git_delete_member, user1, login, orga_factory, user2, member_factory):
     """
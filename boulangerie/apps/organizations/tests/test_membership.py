@@ -0,0 +1,110 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the request-scoped membership resolver.
+"""
+#pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,invalid-name,no-member,unused-import
+import pytest
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+import boulangerie.metrics
+from boulangerie.apps.organizations.membership import MembershipResolver, NOT_MEMBER
+from boulangerie.apps.organizations.models import Member, Organization
+from boulangerie.apps.projects.tests.fixtures import project_factory
+from boulangerie.apps.vpcs.tests.fixtures import vpc_factory
+from .fixtures import *
+
+def member_queries(queries):
+    """
+    Count the membership lookups of the request user.
+    """
+    return len([query for query in queries if '"organizations_member"."account" = \'user1\'' in query['sql']])
+
+def test_resolver_memoize(user1, user2):
+    """
+    The flags of a pair are loaded once.
+    """
+    resolver = MembershipResolver('user1')
+    with CaptureQueriesContext(connection) as context:
+        assert resolver.has_member('user1-default')
+        assert resolver.has_member('user1-default', is_admin=True)
+        assert resolver.has_member('user1-default', is_owner=True)
+        assert not resolver.has_member('user1-default', is_owner=False)
+    assert len(context.captured_queries) == 1
+    assert resolver.get('user2-default') == NOT_MEMBER
+    assert resolver.has_member('user2-default', 'user2', is_owner=True)
+    assert len(resolver.memberships) == 3
+
+@pytest.mark.parametrize('method,uri', [
+    ('get', '/api/0.1/projects/user1-default/'),
+    ('get', '/api/0.1/projects/user1-default/my_project/'),
+    ('delete', '/api/0.1/projects/user1-default/my_project/'),
+    ('get', '/api/0.1/vpcs/user1-default/'),
+    ('get', '/api/0.1/vpcs/user1-default/my_vpc/'),
+    ('get', '/api/0.1/members/user1-default/'),
+    ('get', '/api/0.1/quotas/?organization=user1-default'),
+])
+def test_one_member_query(method, uri, user1, login, project_factory, vpc_factory):
+    """
+    Whatever the number of permission checks, the membership is queried once per request.
+    """
+    token = login(user1)
+    project_factory('my_project', token, 'user1-default')
+    vpc_factory('my_vpc', token, 'user1-default')
+    caches['membership'].clear()
+    client = APIClient()
+    with CaptureQueriesContext(connection) as context:
+        response = getattr(client, method)(uri, HTTP_AUTHORIZATION='JWT {}'.format(token))
+    assert response.status_code < 400
+    assert member_queries(context.captured_queries) == 1
+
+def test_shared_cache(user1, login, project_factory):
+    """
+    The next requests hit the membership cache.
+    """
+    token = login(user1)
+    project_factory('my_project', token, 'user1-default')
+    client = APIClient()
+    boulangerie.metrics.reset()
+    with CaptureQueriesContext(connection) as context:
+        response = client.get('/api/0.1/projects/user1-default/', HTTP_AUTHORIZATION='JWT {}'.format(token))
+    assert response.status_code == 200
+    assert member_queries(context.captured_queries) == 0
+    assert boulangerie.metrics.snapshot()['counters']['membership_cache.hits'] >= 1
+
+def test_cache_invalidation(user1, user2):
+    """
+    Adding, updating and deleting a member invalidates its cached membership,
+    as well as deleting its organization.
+    """
+    orga = Organization.objects.create(name='my_orga')
+    assert not Organization.objects.has_member('my_orga', 'user2')
+    assert list(Organization.objects.by_member('user2')) == [Organization.objects.get(name='user2-default')]
+    member = Member.objects.create(organization=orga, account='user2')
+    assert Organization.objects.has_member('my_orga', 'user2', is_admin=False)
+    assert Organization.objects.by_member('user2').count() == 2
+    member.is_admin = True
+    member.save()
+    assert Organization.objects.has_member('my_orga', 'user2', is_admin=True)
+    assert Organization.objects.by_member('user2', is_admin=True).count() == 2
+    orga.delete()
+    assert not Organization.objects.has_member('my_orga', 'user2')
+    assert Organization.objects.by_member('user2').count() == 1
+
+def test_shared_invalidation(tmpdir, user1, user2, monkeypatch):
+    """
+    With a shared backend, the invalidation made by a worker reaches the others:
+    each worker has its instance of the cache, on the same directory.
+    """
+    from django.core.cache.backends.filebased import FileBasedCache
+    import boulangerie.apps.organizations.models
+    workers = [{'membership': FileBasedCache(str(tmpdir), {})} for _ in range(2)]
+    Member.objects.create(account='user2', organization_id='user1-default')
+    monkeypatch.setattr(boulangerie.apps.organizations.models, 'caches', workers[1])
+    assert Organization.objects.has_member('user1-default', 'user2')
+    monkeypatch.setattr(boulangerie.apps.organizations.models, 'caches', workers[0])
+    Member.objects.filter(account='user2', organization_id='user1-default').delete()
+    Organization.objects.invalidate('user1-default', 'user2')
+    monkeypatch.setattr(boulangerie.apps.organizations.models, 'caches', workers[1])
+    assert not Organization.objects.has_member('user1-default', 'user2')
@@ -5,6 +5,7 @@ Unit tests for organizations.
 #pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,invalid-name,no-member,unused-import
 import json
 from rest_framework.test import APIClient
+from boulangerie.apps.organizations.models import Member
 from .fixtures import *
 
 def test_creation_no_authenticated():
@@ -329,4 +330,25 @@ def test_deleted_send_broker_message(broker_git_delete_orga, user1, login, orga_
     client.delete('/api/0.1/organizations/my_orga/', HTTP_AUTHORIZATION='JWT {}'.format(token1))
     #
     msg = json.loads(next(queue.consume()).body)
-    assert msg == {'organization': 'my_orga'}
+    assert msg == {'organization': 'my_orga', 'members': ['user1']}
+
+def test_deleted_aggregate_members(broker_git_delete_orga, broker_git_delete_member,
+                                   user1, user2, user3, login, orga_factory, member_factory):
+    """
+    When deleting an organization, the members are deleted at once:
+    a single message is send to the broker, with all the members.
+    """
+    queue, _ = broker_git_delete_orga
+    queue_member, _ = broker_git_delete_member
+    client = APIClient()
+    token1 = login(user1)
+    orga_factory('my_orga', token1)
+    member_factory('my_orga', user2, token1)
+    member_factory('my_orga', user3, token1)
+    response = client.delete('/api/0.1/organizations/my_orga/', HTTP_AUTHORIZATION='JWT {}'.format(token1))
+    assert response.status_code == 204
+    assert not Member.objects.filter(organization='my_orga').exists()
+    #
+    msg = json.loads(next(queue.consume()).body)
+    assert msg == {'organization': 'my_orga', 'members': ['user1', 'user2', 'user3']}
+    assert len(queue_member) == 0
@@ -7,6 +7,7 @@ from rest_framework.decorators import detail_route
 from rest_framework.response import Response
 from dry_rest_permissions.generics import DRYPermissions#pylint:disable=import-error
 from .serializers import InvitationSerializer, MemberSerializer, OrganizationSerializer
+from .membership import get_resolver
 from .models import Invitation, Organization, Member
 from boulangerie.apps.accounts.models import Account
 
@@ -30,8 +31,8 @@ class OrganizationsViewSet(viewsets.ModelViewSet):#pylint:disable=too-many-ances
         """
         Override the destroy method, as we can delete an organization only if we are owner.
         """
-        member = Member.objects.filter(organization=name, account=request.user.username).first()
-        if not member:
+        member = get_resolver(request).get(name)
+        if not member.is_member:
             return Response(status=status.HTTP_404_NOT_FOUND)
         if not member.is_owner:
             return Response(status=status.HTTP_403_FORBIDDEN)
@@ -63,7 +64,7 @@ class InvitationsViewSet(mixins.CreateModelMixin,
         Override the GET detail method (aka : /invitations/<organization>/):
         we must list the organization invitations.
         """
-        is_member = Organization.objects.has_member(kwargs.get('organization'), request.user.username)
+        is_member = get_resolver(request).has_member(kwargs.get('organization'))
         if not is_member:
             return Response(status=status.HTTP_404_NOT_FOUND)
         queryset = Invitation.objects.filter(organization=kwargs.get('organization'))
@@ -80,7 +81,7 @@ class InvitationsViewSet(mixins.CreateModelMixin,
         Override the destroy method, as we can delete an invitation if we are admin or the invited one.
         """
         #Check if the client is admin of the organization or invited.
-        is_admin = Organization.objects.has_member(organization, request.user.username, is_admin=True)
+        is_admin = get_resolver(request).has_member(organization, is_admin=True)
         invitation = Invitation.objects.filter(organization=organization, account=account).first()
         if invitation and (is_admin or account == request.user.username):
             invitation.delete()
@@ -100,6 +101,7 @@ class InvitationsViewSet(mixins.CreateModelMixin,
             return Response(status=status.HTTP_404_NOT_FOUND)
         invitation.delete()
         Member.objects.create(organization=organization, account=account)
+        get_resolver(request).forget(organization.name)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def create(self, request, *args, **kwargs):
@@ -109,12 +111,12 @@ class InvitationsViewSet(mixins.CreateModelMixin,
         serializer = InvitationSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         #1. Check that the organization and the account exists.
-        orga = Organization.objects.has_member(self.request.data.get('organization'), self.request.user.username, is_admin=True)
+        orga = get_resolver(request).has_member(self.request.data.get('organization'), is_admin=True)
         account = Account.objects.filter(username=self.request.data.get('account')).first()
         if not orga or not account:
             return Response(serializer.data, status=status.HTTP_404_NOT_FOUND)
         #2. Check that the account is not already a member of the organization
-        is_member = Organization.objects.has_member(self.request.data['organization'], self.request.data['account'])
+        is_member = get_resolver(request).has_member(self.request.data['organization'], self.request.data['account'])
         if is_member:
             return Response(serializer.data, status=status.HTTP_409_CONFLICT)
         #3. Create
@@ -142,7 +144,7 @@ class MembersViewSet(mixins.RetrieveModelMixin,
         Override the GET detail method (aka : /members/<organization>/):
         we must list the organization members.
         """
-        is_member = Organization.objects.has_member(kwargs.get('organization'), request.user.username)
+        is_member = get_resolver(request).has_member(kwargs.get('organization'))
         if not is_member:
             return Response(status=status.HTTP_403_FORBIDDEN)
         queryset = Member.objects.filter(organization=kwargs.get('organization'))
@@ -159,22 +161,24 @@ class MembersViewSet(mixins.RetrieveModelMixin,
         Override the destroy method, as we can delete a member if we are admin.
         """
         #Check if the client is admin of the organization or invited.
-        member = Member.objects.filter(organization=organization, account=request.user.username).first()
+        member = get_resolver(request).get(organization)
         target = Member.objects.filter(organization=organization, account=account).first()
         #1. Member check
-        if not member:
+        if not member.is_member:
             return Response(status=status.HTTP_404_NOT_FOUND)
         #2. target check (cannot remove the owner)
         if target.is_owner:
             return Response(status=status.HTTP_403_FORBIDDEN)
         #3. If we try to remove ourselves
-        if member == target:
+        if target.account == request.user.username:
             target.delete()
+            get_resolver(request).forget(organization)
             return Response(status=status.HTTP_204_NO_CONTENT)
         #4. If we try to remove someone else but we are not admin
         if not member.is_admin:
             return Response(status=status.HTTP_403_FORBIDDEN)
         target.delete()
+        get_resolver(request).forget(organization, account)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def partial_update(self, request, organization=None):
@@ -182,9 +186,9 @@ class MembersViewSet(mixins.RetrieveModelMixin,
         Method overrided : When we do a PATCH, we update the member permissions.
         """
         account = request.data.get('account')
-        member = Member.objects.filter(organization=organization, account=request.user.username).first()
+        member = get_resolver(request).get(organization)
         exist = Member.objects.filter(organization=organization, account=account).first()
-        if not member or not exist:
+        if not member.is_member or not exist:
             return Response(status=status.HTTP_404_NOT_FOUND)
         elif not member.is_admin:
             return Response(status=status.HTTP_403_FORBIDDEN)
@@ -193,4 +197,5 @@ class MembersViewSet(mixins.RetrieveModelMixin,
         serializer = MemberSerializer(exist, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        get_resolver(request).forget(organization, account)
         return Response(status=status.HTTP_204_NO_CONTENT)
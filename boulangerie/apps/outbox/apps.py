@@ -0,0 +1,11 @@
+"""
+Outbox app settings.
+"""
+from django.apps import AppConfig
+
+
+class OutboxConfig(AppConfig):
+    """
+    Transactional outbox for the broker events.
+    """
+    name = 'boulangerie.apps.outbox'
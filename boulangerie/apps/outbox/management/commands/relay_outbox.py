@@ -0,0 +1,32 @@
+#-*- coding:utf-8 -*-
+"""
+Relay the outbox events to the broker.
+"""
+import time
+from django.core.management.base import BaseCommand
+from boulangerie.apps.outbox.models import Event
+
+
+class Command(BaseCommand):
+    """
+    Drain the outbox by batches, forever or just once.
+    """
+    help = 'Publish the outbox events to the broker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of events published per transaction.')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait when the outbox is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the outbox then exit.')
+
+    def handle(self, *args, **options):
+        while True:
+            published, postponed = Event.objects.relay(options['batch_size'])
+            if published:
+                self.stdout.write('{0} events published, {1} postponed.'.format(published, postponed))
+            if published < options['batch_size']:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
@@ -0,0 +1,103 @@
+"""
+Models for the outbox: the broker events waiting to be published.
+"""
+import json
+import logging
+from django.db import connection, models, transaction
+
+LOGGER = logging.getLogger(__name__)
+
+
+class EventManager(models.Manager):
+    """
+    Manager for the outbox events.
+    """
+
+    def push(self, payload, routing_key, exchange, aggregate=None):
+        """
+        Store an event. As it's written with the caller's transaction,
+        it will be published only if the transaction is committed.
+        :param payload: the data to send.
+        :type payload: dict
+        :param routing_key: The routing key used to forward the payload.
+        :type routing_key: str
+        :param exchange: The exchange to send the payload.
+        :type exchange: str
+        :param aggregate: The entity the event belongs to (ie: organization, account).
+        :type aggregate: None, str
+        :rtype: Event
+        """
+        return self.create(payload=json.dumps(payload),
+                           routing_key=routing_key,
+                           exchange=exchange,
+                           aggregate=aggregate or '')
+
+    def claim(self, batch_size):
+        """
+        Lock the oldest events, skipping the ones locked by the other relays, when the database supports it.
+        Must be called within a transaction.
+        :param batch_size: The maximum number of events.
+        :type batch_size: int
+        :rtype: list
+        """
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        return list(self.get_queryset().select_for_update(skip_locked=skip_locked).order_by('id')[:batch_size])
+
+    def relay(self, batch_size=100):
+        """
+        Publish the oldest events, then delete them.
+        Concurrent relays claim distinct events. The events of an aggregate are published by id:
+        when an event can't be published, or an older one is claimed by another relay,
+        the following events of the same aggregate wait for the next relay, the other aggregates
+        are not blocked. The ids follow the insertions, not the commits: only the events of an
+        aggregate written by successive transactions are published in the order they were written.
+        :param batch_size: The maximum number of events to publish.
+        :type batch_size: int
+        :returns: The number of events published and the number of events postponed.
+        :rtype: tuple
+        """
+        import boulangerie.broker
+        with transaction.atomic():
+            events = self.claim(batch_size)
+            first = {}
+            for event in reversed(events):
+                first[event.aggregate] = event.pk
+            claimed = [event.pk for event in events]
+            older = self.get_queryset().filter(aggregate__in=list(first), pk__lt=max(claimed or [0]))\
+                                       .exclude(pk__in=claimed).values_list('aggregate', 'pk')
+            blocked = set(aggregate for aggregate, pk in older if pk < first[aggregate])
+            published = []
+            for event in events:
+                if event.aggregate in blocked:
+                    continue
+                try:
+                    boulangerie.broker.publish(json.loads(event.payload), event.routing_key, event.exchange)
+                except Exception:#pylint:disable=broad-except
+                    LOGGER.exception('Cannot publish the event %s, aggregate %s postponed.', event.pk, event.aggregate)
+                    blocked.add(event.aggregate)
+                    continue
+                published.append(event.pk)
+            self.get_queryset().filter(pk__in=published).delete()
+        return len(published), len(events) - len(published)
+
+
+class Event(models.Model):
+    """
+    Event model:
+        * exchange, routing_key : where to publish.
+        * aggregate : the entity the event belongs to, events are ordered by aggregate.
+        * payload : the JSON encoded data.
+    """
+    exchange = models.SlugField(null=False, max_length=50)
+    routing_key = models.SlugField(null=False, max_length=50)
+    aggregate = models.CharField(null=False, blank=True, max_length=100)
+    payload = models.TextField()
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    objects = EventManager()
+
+    class Meta:#pylint:disable=old-style-class,no-init,too-few-public-methods
+        """
+        Sorted by insertion order.
+        """
+        ordering = ('id',)
@@ -0,0 +1,13 @@
+#-*- coding:utf-8 -*-
+"""
+Fixtures for the outbox tests.
+"""
+#pylint:disable=wildcard-import,unused-wildcard-import,line-too-long
+from boulangerie.apps.accounts.tests.fixtures import *
+
+@pytest.fixture
+def outbox(settings):
+    """
+    Enable the outbox.
+    """
+    settings.BROKER = dict(settings.BROKER, outbox=True)
@@ -0,0 +1,86 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the outbox.
+"""
+#pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,invalid-name,no-member,unused-import
+import json
+import pytest
+from django.core.management import call_command
+from django.db import transaction
+from rest_framework.test import APIClient
+import boulangerie.broker
+from boulangerie.apps.outbox.models import Event
+from boulangerie.apps.projects.models import Project
+from .fixtures import *
+
+def test_event_stored(outbox, broker_git_create_repo, user1, login):
+    """
+    When the outbox is enabled, creating a project stores the event:
+    nothing is published until the relay runs.
+    """
+    queue, _ = broker_git_create_repo
+    client = APIClient()
+    token = login(user1)
+    response = client.post('/api/0.1/projects/user1-default/', {'name': 'project1'}, format='json', HTTP_AUTHORIZATION='JWT {}'.format(token))
+    assert response.status_code == 201
+    event = Event.objects.get(routing_key='create-repo')
+    assert event.exchange == 'git'
+    assert event.aggregate == 'user1-default'
+    assert json.loads(event.payload) == {'repo': 'user1-default.project1', 'organization': 'user1-default'}
+    assert len(queue) == 0
+
+def test_event_rollback(outbox, user1):
+    """
+    When the transaction is rolled back, the event is discarded too.
+    """
+    with pytest.raises(ValueError):
+        with transaction.atomic():
+            Project.objects.create(name='project1', owner='user1-default', uri='uri')
+            raise ValueError()
+    assert not Event.objects.filter(routing_key='create-repo').exists()
+
+def test_relay(outbox, broker_git_create_repo, user1):
+    """
+    The relay command publishes the events and empties the outbox.
+    """
+    queue, _ = broker_git_create_repo
+    Project.objects.create(name='project1', owner='user1-default', uri='uri')
+    Project.objects.create(name='project2', owner='user1-default', uri='uri')
+    call_command('relay_outbox', once=True, batch_size=1)
+    assert not Event.objects.exists()
+    assert json.loads(next(queue.consume()).body)['repo'] == 'user1-default.project1'
+    assert json.loads(next(queue.consume()).body)['repo'] == 'user1-default.project2'
+
+def test_relay_ordering_per_aggregate(outbox, monkeypatch):
+    """
+    When an event cannot be published, the next events of its aggregate wait,
+    the other aggregates are published.
+    """
+    published = []
+    def publish(payload, routing_key, exchange):
+        if payload == {'fail': True}:
+            raise IOError()
+        published.append(payload)
+    monkeypatch.setattr(boulangerie.broker, 'publish', publish)
+    Event.objects.push({'fail': True}, 'create-repo', 'git', 'orga1')
+    Event.objects.push({'orga1': 2}, 'create-repo', 'git', 'orga1')
+    Event.objects.push({'orga2': 1}, 'create-repo', 'git', 'orga2')
+    assert Event.objects.relay() == (1, 2)
+    assert published == [{'orga2': 1}]
+    assert list(Event.objects.values_list('aggregate', flat=True)) == ['orga1', 'orga1']
+
+def test_relay_claimed_by_another(outbox, monkeypatch):
+    """
+    When an older event of an aggregate is claimed by another relay, its next events wait,
+    the other aggregates are published.
+    """
+    published = []
+    monkeypatch.setattr(boulangerie.broker, 'publish', lambda payload, routing_key, exchange: published.append(payload))
+    Event.objects.push({'orga1': 1}, 'create-repo', 'git', 'orga1')
+    Event.objects.push({'orga1': 2}, 'create-repo', 'git', 'orga1')
+    Event.objects.push({'orga2': 1}, 'create-repo', 'git', 'orga2')
+    claimed = list(Event.objects.order_by('id'))[1:]
+    monkeypatch.setattr(Event.objects, 'claim', lambda batch_size: claimed)
+    assert Event.objects.relay() == (1, 1)
+    assert published == [{'orga2': 1}]
+    assert list(Event.objects.values_list('aggregate', flat=True)) == ['orga1', 'orga1']
@@ -5,6 +5,7 @@ Signal handler for projects.
 import boulangerie.broker
 from django.dispatch import receiver
 from django.db.models.signals import post_delete, post_save
+from boulangerie.apps.keys import authorization
 from .models import Project
 
 @receiver(post_save, sender=Project)
@@ -23,7 +24,7 @@ def create_repo(sender, instance, **kwargs):#pylint:disable=unused-argument
     if kwargs.get('created'):
         payload = {'repo':'{0}.{1}'.format(instance.owner, instance.name),
                    'organization':instance.owner}
-        boulangerie.broker.send(payload, 'create-repo', 'git')
+        boulangerie.broker.send(payload, 'create-repo', 'git', aggregate=instance.owner)
 
 @receiver(post_delete, sender=Project)
 def delete_repo(sender, instance, **kwargs):#pylint:disable=unused-argument
@@ -39,4 +40,20 @@ def delete_repo(sender, instance, **kwargs):#pylint:disable=unused-argument
     :rtype:None
     """
     payload = {'repo':'{0}.{1}'.format(instance.owner, instance.name)}
-    boulangerie.broker.send(payload, 'delete-repo', 'git')
+    boulangerie.broker.send(payload, 'delete-repo', 'git', aggregate=instance.owner)
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_repo(sender, instance, **kwargs):#pylint:disable=unused-argument
+    """
+    When creating or deleting a project,
+    we need to drop the cached git accesses of its organization.
+    :param sender: The signal sender.
+    :type sender: boulangerie.apps.projects.models.Project
+    :param instance: The signal sender instance.
+    :type instance: boulangerie.apps.projects.models.Project
+    :param kwargs: Context.
+    :type kwargs: django.db.models.base.ModelBase
+    :rtype:None
+    """
+    authorization.invalidate(organizations=[instance.owner])
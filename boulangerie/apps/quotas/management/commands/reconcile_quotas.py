@@ -0,0 +1,18 @@
+#-*- coding:utf-8 -*-
+"""
+Rebuild the quotas usage.
+"""
+from django.core.management.base import BaseCommand
+from boulangerie.apps.quotas.models import Quota
+
+
+class Command(BaseCommand):
+    """
+    Count the keys, organizations, projects and VPCs of each owner,
+    and fix the usage of their quotas.
+    """
+    help = 'Rebuild the quotas usage from the source tables.'
+
+    def handle(self, *args, **options):
+        fixed = Quota.objects.reconcile()
+        self.stdout.write('{0} quotas fixed.'.format(fixed))
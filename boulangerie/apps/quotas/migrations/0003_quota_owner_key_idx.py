@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotas', '0002_auto_20170913_0854'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quota',
+            index=models.Index(fields=['owner', 'key'], name='quota_owner_key_idx'),
+        ),
+    ]
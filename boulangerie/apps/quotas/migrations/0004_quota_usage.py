@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+#The rows counted by each quota: (app_label, model_name, owner field, filters).
+USAGES = {
+    'max_keys': ('keys', 'SSHKey', 'owner', {}),
+    'max_organizations': ('organizations', 'Member', 'account', {'is_owner': True}),
+    'max_projects': ('projects', 'Project', 'owner', {}),
+    'max_vpcs': ('vpcs', 'VPC', 'owner', {}),
+}
+
+def fill_usage(apps, schema_editor):#pylint:disable=unused-argument
+    """
+    Count the existing resources.
+    """
+    Quota = apps.get_model('quotas', 'Quota')
+    for key, (app_label, model_name, field, filters) in USAGES.items():
+        queryset = apps.get_model(app_label, model_name).objects.filter(**filters).order_by()
+        for owner, usage in queryset.values(field).annotate(usage=Count('pk')).values_list(field, 'usage'):
+            Quota.objects.filter(key=key, owner=owner).update(usage=usage)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('keys', '0003_sshkey_owner_created_idx'),
+        ('organizations', '0003_member_account_created_idx'),
+        ('projects', '0003_project_owner_created_idx'),
+        ('quotas', '0003_quota_owner_key_idx'),
+        ('vpcs', '0003_vpc_owner_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quota',
+            name='usage',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import decimal
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def sparse_quotas(apps, schema_editor):#pylint:disable=unused-argument
+    """
+    Move the usages to their own table,
+    and drop the quotas equal to the defaults: only the overrides remain.
+    """
+    Quota = apps.get_model('quotas', 'Quota')
+    Usage = apps.get_model('quotas', 'Usage')
+    Usage.objects.bulk_create([Usage(owner=owner, key=key, usage=usage)
+                               for owner, key, usage in Quota.objects.values_list('owner', 'key', 'usage')],
+                              batch_size=1000)
+    for key, value in settings.QUOTAS.items():
+        Quota.objects.filter(key=key, value=decimal.Decimal(value)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotas', '0004_quota_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Plan',
+            fields=[
+                ('name', models.SlugField(primary_key=True, serialize=False)),
+                ('description', models.CharField(blank=True, max_length=200)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlanQuota',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.SlugField()),
+                ('value', models.DecimalField(decimal_places=5, max_digits=15)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quotas', to='quotas.Plan')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Subscription',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.SlugField(unique=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscriptions', to='quotas.Plan')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Usage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.SlugField()),
+                ('key', models.SlugField()),
+                ('usage', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='planquota',
+            unique_together=set([('plan', 'key')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='usage',
+            unique_together=set([('owner', 'key')]),
+        ),
+        migrations.RunPython(sparse_quotas, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='quota',
+            name='usage',
+        ),
+    ]
@@ -1,13 +1,184 @@
 """
 Models for the quotas.
 """
-from django.db import models
+import decimal
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F
 from dry_rest_permissions.generics import authenticated_users #pylint:disable=import-error
+from rest_framework.exceptions import PermissionDenied
+import boulangerie.metrics
 
+#The rows counted by each quota: (app_label, model_name, owner field, filters).
+USAGES = {
+    'max_keys': ('keys', 'SSHKey', 'owner', {}),
+    'max_organizations': ('organizations', 'Member', 'account', {'is_owner': True}),
+    'max_projects': ('projects', 'Project', 'owner', {}),
+    'max_vpcs': ('vpcs', 'VPC', 'owner', {}),
+}
+
+#The quotas of the accounts, and of the organizations.
+ACCOUNT_QUOTAS = ('max_keys', 'max_organizations')
+ORGANIZATION_QUOTAS = ('max_projects', 'max_vpcs')
+
+class QuotaExceeded(PermissionDenied):
+    """
+    Raised when creating a resource beyond its quota.
+    """
+    default_detail = 'Quota exceeded.'
+
+def count_usage(key, owner=None):
+    """
+    Count the rows of the source table of the quota `key`.
+    :param key: The quota key.
+    :type key: str
+    :param owner: Only this owner, all of them if None.
+    :type owner: None, str
+    :returns: The usage by owner.
+    :rtype: dict
+    """
+    app_label, model_name, field, filters = USAGES[key]
+    queryset = apps.get_model(app_label, model_name).objects.filter(**filters)
+    if owner is not None:
+        queryset = queryset.filter(**{field: owner})
+    return dict(queryset.order_by().values(field).annotate(usage=Count('pk')).values_list(field, 'usage'))
+
+class QuotaManager(models.Manager):
+    """
+    The quotas of an owner come from its plan, `settings.QUOTAS_PLAN` unless subscribed to another,
+    and from its own `Quota` rows, which only exist as overrides.
+    The values are resolved once, kept in the `quotas` cache, and invalidated by the signals.
+    The usage of each quota is maintained in `Usage`:
+    it is checked and updated in a single statement, so concurrent creations cannot exceed it.
+    """
+
+    def limits(self, owner):
+        """
+        Resolve the quotas of the owner: the defaults, its plan, then its overrides.
+        :param owner: The quota owner.
+        :type owner: str
+        :returns: The value of each quota key.
+        :rtype: dict
+        """
+        cache = caches['quotas']
+        key = u'quotas:{0}'.format(owner)
+        values = cache.get(key)
+        if values is not None:
+            boulangerie.metrics.incr('quota_cache.hits')
+            return values
+        boulangerie.metrics.incr('quota_cache.misses')
+        plan = Subscription.objects.filter(owner=owner).values_list('plan', flat=True).first()
+        values = {k: decimal.Decimal(v) for k, v in settings.QUOTAS.items()}
+        values.update(PlanQuota.objects.filter(plan=plan or settings.QUOTAS_PLAN).values_list('key', 'value'))
+        values.update(self.filter(owner=owner).values_list('key', 'value'))
+        cache.set(key, values)
+        return values
+
+    def invalidate(self, owner=None):
+        """
+        Drop the cached quotas of the owner, of everyone if None,
+        right now and once the transaction is committed.
+        """
+        def delete():
+            if owner is None:
+                caches['quotas'].clear()
+            else:
+                caches['quotas'].delete(u'quotas:{0}'.format(owner))
+            boulangerie.metrics.incr('quota_cache.invalidations')
+        delete()
+        transaction.on_commit(delete)
+
+    def effective(self, owner, keys, since):
+        """
+        The quotas of the owner, as `Quota` carrying their usage: its overrides,
+        and unsaved ones for the quotas of its plan. These are dated as the rows once created
+        with the owner: created `since`, modified when its subscription changed, if later.
+        :param owner: The quota owner.
+        :type owner: str
+        :param keys: The quota keys, ie: `ACCOUNT_QUOTAS`.
+        :type keys: tuple
+        :param since: The creation date of the owner.
+        :type since: datetime.datetime
+        :rtype: list
+        """
+        limits = self.limits(owner)
+        usages = dict(Usage.objects.filter(owner=owner, key__in=keys).values_list('key', 'usage'))
+        overrides = {quota.key: quota for quota in self.filter(owner=owner, key__in=keys)}
+        subscribed = Subscription.objects.filter(owner=owner).values_list('date_modified', flat=True).first()
+        modified = max(since, subscribed) if subscribed else since
+        quotas = []
+        for key in sorted(keys):
+            quota = overrides.get(key) or self.model(owner=owner, key=key, value=limits[key],
+                                                     date_created=since, date_modified=modified)
+            quota.usage = usages[key] if key in usages else count_usage(key, owner).get(owner, 0)
+            quotas.append(quota)
+        return quotas
+
+    def available(self, owner, key):
+        """
+        Check if the owner can still create a resource.
+        :rtype: bool
+        """
+        usage = Usage.objects.filter(owner=owner, key=key).values_list('usage', flat=True).first()
+        if usage is None:
+            usage = count_usage(key, owner).get(owner, 0)
+        return usage < self.limits(owner)[key]
+
+    def reserve(self, owner, key, amount=1):
+        """
+        Increment the usage, if it doesn't exceed the value.
+        The usage row is created by the first reservation, from the existing resources.
+        :param owner: The quota owner.
+        :type owner: str
+        :param key: The quota key.
+        :type key: str
+        :param amount: The number of resources to create.
+        :type amount: int
+        :returns: False if the quota is exceeded.
+        :rtype: bool
+        """
+        usages = Usage.objects.filter(owner=owner, key=key, usage__lte=self.limits(owner)[key] - amount)
+        if usages.update(usage=F('usage') + amount):
+            return True
+        if Usage.objects.filter(owner=owner, key=key).exists():
+            return False
+        try:
+            with transaction.atomic():
+                Usage.objects.create(owner=owner, key=key, usage=count_usage(key, owner).get(owner, 0))
+        except IntegrityError:
+            pass#Created concurrently.
+        return bool(usages.update(usage=F('usage') + amount))
+
+    def release(self, owner, key, amount=1):#pylint:disable=no-self-use
+        """
+        Decrement the usage.
+        :rtype: None
+        """
+        Usage.objects.filter(owner=owner, key=key, usage__gte=amount).update(usage=F('usage') - amount)
+
+    def reconcile(self):#pylint:disable=no-self-use
+        """
+        Rebuild the usages from the source tables.
+        The usages are locked first: the creations reserving concurrently wait for the rebuild.
+        :returns: The number of usages fixed.
+        :rtype: int
+        """
+        fixed = 0
+        with transaction.atomic():
+            for key in sorted(USAGES):
+                rows = list(Usage.objects.select_for_update().filter(key=key).values_list('pk', 'owner', 'usage'))
+                usages = count_usage(key)
+                for pk, owner, usage in rows:
+                    if usage != usages.get(owner, 0):
+                        Usage.objects.filter(pk=pk).update(usage=usages.get(owner, 0))
+                        fixed += 1
+        return fixed
 
 class Quota(models.Model):
     """
-    Quota model:
+    Quota model, an override of the plan of the owner:
         * key : Type of the quota (ex: max_projects)
         * value : Quota's threshold.
     """
@@ -17,12 +188,16 @@ class Quota(models.Model):
     date_modified = models.DateTimeField(auto_now=True)
     owner = models.SlugField()
 
+    objects = QuotaManager()
+
     class Meta:#pylint:disable=old-style-class,no-init,too-few-public-methods
         """
         We declare the key and the owner as unique, together.
         """
         unique_together = (('key', 'owner',))
         ordering = ('key',)
+        #The quotas of an owner, sorted.
+        indexes = [models.Index(fields=['owner', 'key'], name='quota_owner_key_idx')]
 
     #Global permissions:
     @staticmethod
@@ -47,3 +222,50 @@ class Quota(models.Model):
         But they can only read theirs quotas.
         """
         return True
+
+class Plan(models.Model):
+    """
+    Plan model: the quotas shared by its subscribers.
+        * name : Name of the plan (ex: default)
+    """
+    name = models.SlugField(max_length=50, primary_key=True)
+    description = models.CharField(max_length=200, blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_modified = models.DateTimeField(auto_now=True)
+
+class PlanQuota(models.Model):
+    """
+    PlanQuota model: a quota of a plan, missing ones fall back to `settings.QUOTAS`.
+    """
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE, related_name='quotas')
+    key = models.SlugField(max_length=50)
+    value = models.DecimalField(max_digits=15, decimal_places=5)
+
+    class Meta:#pylint:disable=old-style-class,no-init,too-few-public-methods
+        """
+        We declare the plan and the key as unique, together.
+        """
+        unique_together = (('plan', 'key',))
+
+class Subscription(models.Model):
+    """
+    Subscription model: the owners without one are on `settings.QUOTAS_PLAN`.
+    """
+    owner = models.SlugField(unique=True)
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE, related_name='subscriptions')
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_modified = models.DateTimeField(auto_now=True)
+
+class Usage(models.Model):
+    """
+    Usage model: the number of resources of the owner counted by a quota, cf `USAGES`.
+    """
+    owner = models.SlugField()
+    key = models.SlugField(max_length=50)
+    usage = models.PositiveIntegerField(default=0)
+
+    class Meta:#pylint:disable=old-style-class,no-init,too-few-public-methods
+        """
+        We declare the owner and the key as unique, together.
+        """
+        unique_together = (('owner', 'key',))
@@ -11,10 +11,13 @@ class QuotaSerializer(serializers.ModelSerializer):
     """
     Quota serializer:
     * owner is hidden
+    * usage is maintained apart, cf `Usage`
     """
+    usage = serializers.IntegerField(read_only=True)
+
     class Meta:#pylint:disable=old-style-class,no-init,too-few-public-methods, missing-docstring
         model = Quota
-        fields = ('key', 'value', 'owner',
+        fields = ('key', 'value', 'usage', 'owner',
                   'date_created', 'date_modified')
         lookup_field = 'key'
         extra_kwargs = {
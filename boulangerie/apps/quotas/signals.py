@@ -2,50 +2,106 @@
 """
 Signal handler for Quotas.
 """
-from django.conf import settings
-from django.contrib.contenttypes.models import ContentType
 from django.dispatch import receiver
-from django.db.models.signals import post_save
-from boulangerie.apps.accounts.models import Account
-from boulangerie.apps.organizations.models import Organization
-from .models import Quota
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from boulangerie.apps.keys.models import SSHKey
+from boulangerie.apps.organizations.models import Member, Organization
+from boulangerie.apps.projects.models import Project
+from boulangerie.apps.vpcs.models import VPC
+from .models import PlanQuota, Quota, QuotaExceeded, Subscription
 
-@receiver(post_save, sender=Account)
-def default_quotas_account(sender, **kwargs):#pylint:disable=unused-argument
+#The quota of each resource, owned by the resource owner.
+QUOTA_KEYS = {
+    SSHKey: 'max_keys',
+    Project: 'max_projects',
+    VPC: 'max_vpcs',
+}
+
+@receiver(post_save, sender=Quota)
+@receiver(post_delete, sender=Quota)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_owner(sender, instance, **kwargs):#pylint:disable=unused-argument
+    """
+    When an override or a subscription changes,
+    drop the cached quotas of its owner.
+    :param sender: The signal sender.
+    :type sender: django.db.models.base.ModelBase
+    :param instance: The signal sender instance.
+    :type instance: Quota, Subscription
+    :param kwargs: Context.
+    :type kwargs: django.db.models.base.ModelBase
+    :rtype:None
+    """
+    Quota.objects.invalidate(instance.owner)
+
+@receiver(post_save, sender=PlanQuota)
+@receiver(post_delete, sender=PlanQuota)
+def invalidate_plan(sender, instance, **kwargs):#pylint:disable=unused-argument
+    """
+    When a quota of a plan changes,
+    drop all the cached quotas: the subscribers are not listed.
+    :param sender: The signal sender.
+    :type sender: boulangerie.apps.quotas.models.PlanQuota
+    :param instance: The signal sender instance.
+    :type instance: boulangerie.apps.quotas.models.PlanQuota
+    :param kwargs: Context.
+    :type kwargs: django.db.models.base.ModelBase
+    :rtype:None
+    """
+    Quota.objects.invalidate()
+
+@receiver(pre_save, sender=SSHKey)
+@receiver(pre_save, sender=Project)
+@receiver(pre_save, sender=VPC)
+def reserve_quota(sender, instance, **kwargs):#pylint:disable=unused-argument
+    """
+    Before creating a resource,
+    reserve it on the owner quota: the creation fails if it is exceeded.
+    :param sender: The signal sender.
+    :type sender: django.db.models.base.ModelBase
+    :param instance: The signal sender instance.
+    :type instance: SSHKey, Project, VPC
+    :param kwargs: Context.
+    :type kwargs: django.db.models.base.ModelBase
+    :rtype:None
+    :raises QuotaExceeded: if the quota is exceeded.
+    """
+    if instance._state.adding and not Quota.objects.reserve(instance.owner, QUOTA_KEYS[sender]):#pylint:disable=protected-access
+        raise QuotaExceeded()
+
+@receiver(post_delete, sender=SSHKey)
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=VPC)
+def release_quota(sender, instance, **kwargs):#pylint:disable=unused-argument
     """
-    When creating an account,
-    create the quotas.
+    When deleting a resource,
+    release it from the owner quota.
     :param sender: The signal sender.
-    :type sender: boulangerie.apps.accounts.models.Account
+    :type sender: django.db.models.base.ModelBase
+    :param instance: The signal sender instance.
+    :type instance: SSHKey, Project, VPC
     :param kwargs: Context.
     :type kwargs: django.db.models.base.ModelBase
     :rtype:None
     """
-    if kwargs.get('created'):
-        owner = kwargs['instance'].username
-        Quota.objects.create(key='max_keys',#pylint:disable=no-member
-                             value=settings.QUOTAS['max_keys'],
-                             owner=owner)
-        Quota.objects.create(key='max_organizations',#pylint:disable=no-member
-                             value=settings.QUOTAS['max_organizations'],
-                             owner=owner)
+    Quota.objects.release(instance.owner, QUOTA_KEYS[sender])
 
-@receiver(post_save, sender=Organization)
-def default_quotas_organization(sender, **kwargs):#pylint:disable=unused-argument
+@receiver(pre_delete, sender=Organization)
+def release_quota_organization(sender, instance, **kwargs):#pylint:disable=unused-argument
     """
-    When creating an organization,
-    create the quotas.
+    When deleting an organization,
+    release it from its owners quota.
     :param sender: The signal sender.
     :type sender: boulangerie.apps.organizations.models.Organization
+    :param instance: The signal sender instance.
+    :type instance: boulangerie.apps.organizations.models.Organization
     :param kwargs: Context.
     :type kwargs: django.db.models.base.ModelBase
     :rtype:None
     """
-    if kwargs.get('created'):
-        owner = kwargs['instance'].name
-        Quota.objects.create(key='max_projects',#pylint:disable=no-member
-                             value=settings.QUOTAS['max_projects'],
-                             owner=owner)
-        Quota.objects.create(key='max_vpcs',#pylint:disable=no-member
-                             value=settings.QUOTAS['max_vpcs'],
-                             owner=owner)
+    owners = getattr(instance, 'owners', None)
+    if owners is None:
+        owners = Member.objects.filter(organization=instance.name, is_owner=True).values_list('account', flat=True)
+    for owner in owners:
+        Quota.objects.release(owner, 'max_organizations')
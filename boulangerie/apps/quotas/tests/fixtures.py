@@ -12,14 +12,12 @@ from boulangerie.apps.quotas.models import Quota
 @pytest.fixture
 def quota_factory():
     """
-    Quota factory: Update current quotas.
+    Quota factory: Override the quotas of the plan.
     """
     def factory(account, key, value):
         """
         Takes 3 parameters:
         the users, its quota, and its new threshold.
         """
-        current = Quota.objects.get(owner=account, key=key)#pylint:disable=no-member
-        current.value = value
-        current.save()
+        Quota.objects.update_or_create(owner=account, key=key, defaults={'value': value})#pylint:disable=no-member
     return factory
@@ -4,8 +4,14 @@ Unit tests for Quotas.
 """
 #pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,invalid-name,no-member,unused-import
 import decimal
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.dateparse import parse_datetime
 from rest_framework.test import APIClient
+from boulangerie.apps.accounts.models import Account
+from boulangerie.apps.organizations.models import Organization
 from boulangerie.apps.projects.tests.fixtures import project_factory
+from boulangerie.apps.quotas.models import Plan, PlanQuota, Subscription, Usage
 from .fixtures import *
 
 def test_list_no_authenticated():
@@ -180,3 +186,115 @@ def test_no_delete_method(user1, login):
     assert response.status_code == 403
     response = client.delete('/api/0.1/quotas/max_keys/', format='json', HTTP_AUTHORIZATION='JWT {}'.format(token))
     assert response.status_code == 404
+
+def test_usage(user1, login, pubkey1):
+    """
+    The usage follows the creations and deletions.
+    """
+    client = APIClient()
+    token = login(user1)
+    usage = lambda owner, key: Usage.objects.get(owner=owner, key=key).usage
+    response = client.post('/api/0.1/keys/', {'name': 'my_key', 'public':pubkey1}, format='json', HTTP_AUTHORIZATION='JWT {}'.format(token))
+    assert response.status_code == 201
+    response = client.post('/api/0.1/organizations/', {'name': 'my_orga'}, format='json', HTTP_AUTHORIZATION='JWT {}'.format(token))
+    assert response.status_code == 201
+    assert usage('user1', 'max_keys') == 1
+    assert usage('user1', 'max_organizations') == 2
+    assert usage('my_orga', 'max_vpcs') == 1
+    response = client.delete('/api/0.1/keys/my_key/', HTTP_AUTHORIZATION='JWT {}'.format(token))
+    assert response.status_code == 204
+    response = client.delete('/api/0.1/organizations/my_orga/', HTTP_AUTHORIZATION='JWT {}'.format(token))
+    assert response.status_code == 204
+    assert usage('user1', 'max_keys') == 0
+    assert usage('user1', 'max_organizations') == 1
+
+def test_reserve(user1, quota_factory):
+    """
+    A reservation beyond the quota fails, whatever the permission checks said.
+    """
+    quota_factory('user1-default', 'max_projects', 2)
+    assert Quota.objects.reserve('user1-default', 'max_projects')
+    assert Quota.objects.reserve('user1-default', 'max_projects')
+    assert not Quota.objects.reserve('user1-default', 'max_projects')
+    Quota.objects.release('user1-default', 'max_projects')
+    assert Quota.objects.reserve('user1-default', 'max_projects')
+
+def test_reserve_on_save(user1, quota_factory):
+    """
+    The creation fails when the quota is exceeded.
+    """
+    from boulangerie.apps.quotas.models import QuotaExceeded
+    from boulangerie.apps.projects.models import Project
+    quota_factory('user1-default', 'max_projects', 1)
+    Project.objects.create(name='project1', owner='user1-default')
+    with pytest.raises(QuotaExceeded):
+        Project.objects.create(name='project2', owner='user1-default')
+    assert Project.objects.filter(owner='user1-default').count() == 1
+
+def test_reconcile(user1, login, project_factory):
+    """
+    The command rebuilds the usages from the source tables.
+    """
+    from django.core.management import call_command
+    token = login(user1)
+    project_factory('my_project', token, 'user1-default')
+    Usage.objects.filter(owner='user1-default', key='max_projects').update(usage=42)
+    call_command('reconcile_quotas')
+    assert Usage.objects.get(owner='user1-default', key='max_projects').usage == 1
+    assert Quota.objects.reconcile() == 0
+
+def test_registration_no_quota(user1):
+    """
+    The registration doesn't create any quota: the owners start on the default plan.
+    """
+    assert not Quota.objects.filter(owner__in=['user1', 'user1-default']).exists()
+    assert Quota.objects.limits('user1')['max_keys'] == 1000
+
+def test_plan(user1, login, quota_factory):
+    """
+    The quotas resolve from the plan of the owner, then its overrides.
+    """
+    client = APIClient()
+    token = login(user1)
+    small = Plan.objects.create(name='small')
+    PlanQuota.objects.create(plan=small, key='max_keys', value=5)
+    PlanQuota.objects.create(plan=small, key='max_organizations', value=3)
+    Subscription.objects.create(owner='user1', plan=small)
+    quota_factory('user1', 'max_organizations', 7)
+    response = client.get('/api/0.1/quotas/', HTTP_AUTHORIZATION='JWT {}'.format(token))
+    assert response.status_code == 200
+    quotas = {i['key']:(decimal.Decimal(i['value']), i['usage']) for i in response.json()['results']}
+    assert quotas == {'max_keys': (5, 0), 'max_organizations': (7, 1)}
+    #The plans changes are seen by their subscribers.
+    PlanQuota.objects.filter(plan=small, key='max_keys').update(value=6)
+    PlanQuota.objects.get(plan=small, key='max_keys').save()
+    assert Quota.objects.limits('user1')['max_keys'] == 6
+    assert Quota.objects.limits('user2')['max_keys'] == 1000
+
+def test_list_dates(user1, login, quota_factory):
+    """
+    The quotas of the plan are dated from the owner and its subscription, the overrides from their row.
+    """
+    client = APIClient()
+    token = login(user1)
+    account = Account.objects.get(username='user1')
+    organization = Organization.objects.get(name='user1-default')
+    response = client.get('/api/0.1/quotas/', {'organization':'user1-default'}, HTTP_AUTHORIZATION='JWT {}'.format(token))
+    for quota in response.json()['results']:
+        assert parse_datetime(quota['date_created']) == parse_datetime(quota['date_modified']) == organization.date_created
+    subscription = Subscription.objects.create(owner='user1', plan=Plan.objects.create(name='small'))
+    quota_factory('user1', 'max_keys', 7)
+    override = Quota.objects.get(owner='user1', key='max_keys')
+    response = client.get('/api/0.1/quotas/', HTTP_AUTHORIZATION='JWT {}'.format(token))
+    quotas = {i['key']:(parse_datetime(i['date_created']), parse_datetime(i['date_modified'])) for i in response.json()['results']}
+    assert quotas == {'max_keys': (override.date_created, override.date_modified),
+                      'max_organizations': (account.date_created, subscription.date_modified)}
+
+def test_plan_cached(user1):
+    """
+    The quotas are resolved once, then read from the cache.
+    """
+    Quota.objects.limits('user1')
+    with CaptureQueriesContext(connection) as context:
+        assert Quota.objects.limits('user1')['max_keys'] == 1000
+    assert not context.captured_queries
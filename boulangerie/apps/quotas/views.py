@@ -4,9 +4,10 @@ Views for the Quotas.
 from rest_framework import mixins, status, viewsets
 from rest_framework.response import Response
 from dry_rest_permissions.generics import DRYPermissions#pylint:disable=import-error
+from boulangerie.apps.organizations.membership import get_resolver
 from boulangerie.apps.organizations.models import Organization
 from .serializers import QuotaSerializer
-from .models import Quota
+from .models import ACCOUNT_QUOTAS, ORGANIZATION_QUOTAS, Quota
 
 class QuotasViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):#pylint:disable=too-many-ancestors
     """
@@ -21,15 +22,17 @@ class QuotasViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):#pylint:disa
     def list(self, request):
         organization = request.query_params.get('organization')
         if not organization:
-            queryset = Quota.objects.filter(owner=self.request.user.username).all()
+            queryset = Quota.objects.effective(self.request.user.username, ACCOUNT_QUOTAS,
+                                               self.request.user.date_created)
             page = self.paginate_queryset(queryset)
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
         #Organization
-        is_member = Organization.objects.has_member(organization, self.request.user.username)
+        is_member = get_resolver(self.request).has_member(organization)
         if not is_member:
             return Response(status=status.HTTP_403_FORBIDDEN)
-        queryset = Quota.objects.filter(owner=organization).all()
+        since = Organization.objects.filter(name=organization).values_list('date_created', flat=True).first()
+        queryset = Quota.objects.effective(organization, ORGANIZATION_QUOTAS, since)
         page = self.paginate_queryset(queryset)
         serializer = self.get_serializer(page, many=True)
         return self.get_paginated_response(serializer.data)
@@ -3,7 +3,7 @@ Models for the VPC, aka network.
 """
 from django.db import models
 from dry_rest_permissions.generics import authenticated_users #pylint:disable=import-error
-from boulangerie.apps.organizations.models import Organization
+from boulangerie.apps.organizations.membership import get_resolver
 
 
 class VPC(models.Model):
@@ -25,6 +25,8 @@ class VPC(models.Model):
         """
         ordering = ('date_created',)
         unique_together = (('name', 'owner',))
+        #The VPCs of an organization, sorted.
+        indexes = [models.Index(fields=['owner', 'date_created'], name='vpc_owner_created_idx')]
 
     #Global permissions:
     @staticmethod
@@ -34,7 +36,7 @@ class VPC(models.Model):
         Any authenticated user can read(retrieve(), list()) a `VPC`.
         """
         organization = request.parser_context['kwargs']['organization']
-        is_member = Organization.objects.has_member(organization, request.user.username)
+        is_member = get_resolver(request).has_member(organization)
         if not is_member:
             return False
         return True
@@ -55,22 +57,17 @@ class VPC(models.Model):
         """
         from boulangerie.apps.quotas.models import Quota
         organization = request.parser_context['kwargs']['organization']
-        is_admin = Organization.objects.has_member(organization, request.user.username, is_admin=True)
+        is_admin = get_resolver(request).has_member(organization, is_admin=True)
         if not is_admin:
             return False
-        #
-        current = VPC.objects.filter(owner=organization).count()
-        quota = Quota.objects.get(owner=organization, key='max_vpcs')
-        if current >= quota.value:
-            return False
-        return True
+        return Quota.objects.available(organization, 'max_vpcs')
 
     #Object permissions:
     def has_object_read_permission(self, request):
         """
         But they can only read theirs VPCS, except if you're admin
         """
-        return Organization.objects.has_member(self.owner, request.user.username)
+        return get_resolver(request).has_member(self.owner)
 
     def has_object_write_permission(self, request):
         """
@@ -82,4 +79,4 @@ class VPC(models.Model):
         """
         They can only delete deletable VPCs.
         """
-        return Organization.objects.has_member(self.owner, request.user.username, is_admin=True) and self.deletable
+        return get_resolver(request).has_member(self.owner, is_admin=True) and self.deletable
@@ -38,7 +38,7 @@ def create_vpc(sender, instance, **kwargs):#pylint:disable=unused-argument
     """
     if kwargs.get('created'):
         payload = {'namespace':'{0}-{1}'.format(instance.owner, instance.name)}
-        boulangerie.broker.send(payload, 'create', 'namespace')
+        boulangerie.broker.send(payload, 'create', 'namespace', aggregate=instance.owner)
 
 @receiver(post_delete, sender=VPC)
 def delete_vpc(sender, instance, **kwargs):#pylint:disable=unused-argument
@@ -54,4 +54,4 @@ def delete_vpc(sender, instance, **kwargs):#pylint:disable=unused-argument
     :rtype:None
     """
     payload = {'namespace':'{0}-{1}'.format(instance.owner, instance.name)}
-    boulangerie.broker.send(payload, 'delete', 'namespace')
+    boulangerie.broker.send(payload, 'delete', 'namespace', aggregate=instance.owner)
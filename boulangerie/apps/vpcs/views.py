@@ -6,7 +6,7 @@ from rest_framework import viewsets
 from rest_framework import status
 from rest_framework.response import Response
 from dry_rest_permissions.generics import DRYPermissions#pylint:disable=import-error
-from boulangerie.apps.organizations.models import Organization
+from boulangerie.apps.organizations.membership import get_resolver
 from .serializers import VPCSerializer
 from .models import VPC
 
@@ -24,7 +24,7 @@ class VPCsViewSet(viewsets.ModelViewSet):#pylint:disable=too-many-ancestors
 
     def get_queryset(self):
         organization = self.kwargs['organization']
-        is_member = Organization.objects.has_member(organization, self.request.user.username)
+        is_member = get_resolver(self.request).has_member(organization)
         if is_member:
             return VPC.objects.filter(owner=organization).all()#pylint:disable=no-member
         raise Http404
@@ -3,32 +3,658 @@
 Declare all the queues/exchanges
 that the API has to be aware.
 And some utils to send message to them.
+
+The backend is chosen from the scheme of `settings.BROKER['uri']`:
+ | *memory://*: in-process queues, for the tests and the local load tests.
+ | *file:///path/to/events.jsonl*: append-only JSON lines.
+ | anything else (ie: *amqp://*): RabbitMQ.
 """
+import atexit
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
 import kombu
-import kombu.common
-import kombu.pools
 from django.conf import settings
+from django.db import connection, transaction
+import boulangerie.metrics
+
+LOGGER = logging.getLogger(__name__)
 
 EXCHANGES = {
     'git': kombu.Exchange('git', type='direct'),
     'namespace' : kombu.Exchange('namespace', type='direct'),
     }
 
-def send(payload, routing_key, exchange):
+#Events cancelling each other within a batch:
+#(exchange, creation routing key) -> (deletion routing key, fields identifying the object).
+CANCELLATIONS = {
+    ('git', 'create-key'): ('delete-key', ('key', 'user')),
+    ('git', 'create-member'): ('delete-member', ('organization', 'account')),
+    ('git', 'create-repo'): ('delete-repo', ('repo',)),
+    ('namespace', 'create'): ('delete', ('namespace',)),
+}
+
+#Number of reconnections tried before giving up on a message.
+MAX_RETRIES = 3
+
+class Publisher(object):
+    """
+    Long-lived publisher, one per process:
+    the connection and the producer are kept alive across requests,
+    each exchange is declared once per connection,
+    and the connection is re-established transparently on failure.
+    """
+
+    def __init__(self, uri, confirm=False):
+        """
+        :param uri: The broker URI.
+        :type uri: str
+        :param confirm: Wait for the broker to confirm each message.
+        :type confirm: bool
+        :rtype: None
+        """
+        self.uri = uri
+        self.confirm = confirm
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.connection = None
+        self.producer = None
+        self.declared = set()
+
+    def _get_producer(self):
+        """
+        Retrieve the producer, lazily.
+        :rtype: kombu.Producer
+        """
+        if self.connection is None:
+            options = {'confirm_publish': True} if self.confirm else {}
+            self.connection = kombu.Connection(self.uri, transport_options=options)
+        if self.producer is None:
+            self.producer = kombu.Producer(self.connection)
+        return self.producer
+
+    def _on_error(self, exc, interval):#pylint:disable=unused-argument
+        """
+        Called by `kombu.Connection.ensure` when the connection is lost:
+        the exchanges have to be declared again on the new channel.
+        """
+        self.declared.clear()
+
+    def _publish(self, payload, routing_key, exchange):
+        """
+        Declare the exchange if needed, then publish.
+        """
+        if exchange.name not in self.declared:
+            exchange(self.producer.channel).declare()
+            self.declared.add(exchange.name)
+        self.producer.publish(payload, exchange=exchange, routing_key=routing_key)
+
+    def publish(self, payload, routing_key, exchange):
+        """
+        Publish the `payload` to the `exchange` using the `routing_key`.
+        :param payload: the data to send.
+        :type payload: dict
+        :param routing_key: The routing key used to forward the payload.
+        :type routing_key: str
+        :param exchange: The exchange to send the payload.
+        :type exchange: kombu.Exchange
+        :rtype: None
+        """
+        self.publish_many([(payload, routing_key, exchange)])
+
+    def publish_many(self, messages):
+        """
+        Publish several messages on the same channel.
+        :param messages: The (payload, routing_key, exchange) to publish, in order.
+        :type messages: list
+        :rtype: None
+        """
+        with self.lock:
+            producer = self._get_producer()
+            publish = self.connection.ensure(producer, self._publish,
+                                             errback=self._on_error,
+                                             max_retries=MAX_RETRIES)
+            for payload, routing_key, exchange in messages:
+                publish(payload, routing_key, exchange)
+
+    def close(self):
+        """
+        Release the connection to the broker.
+        :rtype: None
+        """
+        with self.lock:
+            if self.connection is not None:
+                self.connection.release()
+            self.connection = None
+            self.producer = None
+            self.declared.clear()
+
+#A message routed by the memory backend, or read from the file backend.
+Message = collections.namedtuple('Message', ['exchange', 'routing_key', 'body'])
+
+def _exchange_name(exchange):
+    """
+    :param exchange: The exchange.
+    :type exchange: kombu.Exchange, str
+    :rtype: str
+    """
+    return getattr(exchange, 'name', exchange)
+
+class MemoryBackend(object):
+    """
+    In-process broker, with the semantics of a direct exchange:
+    a message is routed to the queues bound to its exchange with its routing key,
+    and dropped if there is none.
+    The queues are shared by all the instances of the process.
+    """
+    lock = threading.Lock()
+    bindings = collections.defaultdict(list)
+    queues = {}
+
+    def __init__(self, uri, confirm=False):#pylint:disable=unused-argument
+        self.uri = uri
+        self.pid = os.getpid()
+
+    @classmethod
+    def bind(cls, name, exchange, routing_key):
+        """
+        Declare the queue `name`, and bind it to the `exchange` with the `routing_key`.
+        :rtype: None
+        """
+        with cls.lock:
+            cls.queues.setdefault(name, collections.deque())
+            if name not in cls.bindings[(exchange, routing_key)]:
+                cls.bindings[(exchange, routing_key)].append(name)
+
+    @classmethod
+    def get(cls, name):
+        """
+        Pop the oldest message of the queue `name`.
+        :returns: The message, None if the queue is empty.
+        :rtype: Message, None
+        """
+        with cls.lock:
+            messages = cls.queues.get(name)
+            return messages.popleft() if messages else None
+
+    @classmethod
+    def size(cls, name):
+        """
+        :returns: The number of messages waiting in the queue `name`.
+        :rtype: int
+        """
+        with cls.lock:
+            return len(cls.queues.get(name, ()))
+
+    @classmethod
+    def reset(cls):
+        """
+        Delete all the queues and bindings.
+        :rtype: None
+        """
+        with cls.lock:
+            cls.bindings.clear()
+            cls.queues.clear()
+
+    def publish_many(self, messages):
+        """
+        Route the messages to the bound queues.
+        The payloads are serialized, as they would be on the wire.
+        :param messages: The (payload, routing_key, exchange) to publish, in order.
+        :type messages: list
+        :rtype: None
+        """
+        with self.lock:
+            for payload, routing_key, exchange in messages:
+                message = Message(_exchange_name(exchange), routing_key, json.dumps(payload))
+                for name in self.bindings.get((message.exchange, routing_key), ()):
+                    self.queues[name].append(message)
+
+    def close(self):
+        """
+        Nothing to release.
+        :rtype: None
+        """
+
+class FileBackend(object):
+    """
+    Append-only broker: one JSON line per message, with its exchange and routing key.
+    Each batch is written at once, so concurrent workers don't interleave their lines.
+    """
+
+    def __init__(self, uri, confirm=False):#pylint:disable=unused-argument
+        self.uri = uri
+        self.path = uri.split('://', 1)[1]
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+    def publish_many(self, messages):
+        """
+        Append the messages to the file.
+        :param messages: The (payload, routing_key, exchange) to publish, in order.
+        :type messages: list
+        :rtype: None
+        """
+        lines = ''.join(json.dumps({'exchange': _exchange_name(exchange),
+                                    'routing_key': routing_key,
+                                    'payload': payload}) + '\n'
+                        for payload, routing_key, exchange in messages)
+        with self.lock:
+            with open(self.path, 'a') as stream:
+                stream.write(lines)
+
+    @staticmethod
+    def read(uri, exchange=None, routing_key=None):
+        """
+        Read the messages of the file, in order.
+        :param uri: The file URI.
+        :type uri: str
+        :param exchange: Only the messages sent to this exchange.
+        :type exchange: None, str
+        :param routing_key: Only the messages sent with this routing key.
+        :type routing_key: None, str
+        :rtype: generator
+        """
+        with open(uri.split('://', 1)[1]) as stream:
+            for line in stream:
+                data = json.loads(line)
+                if exchange not in (None, data['exchange']):
+                    continue
+                if routing_key not in (None, data['routing_key']):
+                    continue
+                yield Message(data['exchange'], data['routing_key'], json.dumps(data['payload']))
+
+    def close(self):
+        """
+        Nothing to release, the file is opened for each batch.
+        :rtype: None
+        """
+
+#The backends by URI scheme, RabbitMQ otherwise.
+BACKENDS = {
+    'memory': MemoryBackend,
+    'file': FileBackend,
+}
+
+def create_backend(uri, confirm=False):
+    """
+    Create the backend matching the `uri`.
+    :param uri: The broker URI.
+    :type uri: str
+    :param confirm: Wait for the broker to confirm each message, when supported.
+    :type confirm: bool
+    :rtype: Publisher, MemoryBackend, FileBackend
+    """
+    backend = BACKENDS.get(uri.split('://', 1)[0], Publisher)
+    return backend(uri, confirm=confirm)
+
+def spill(messages):
+    """
+    Store the events in the outbox, `boulangerie relay_outbox` publishes them:
+    the events which can't be published now aren't lost.
+    :param messages: The (payload, routing_key, exchange) to store, in order.
+    :type messages: list
+    :rtype: None
+    """
+    from boulangerie.apps.outbox.models import Event
+    try:
+        with transaction.atomic():
+            for payload, routing_key, exchange in messages:
+                Event.objects.push(payload, routing_key, _exchange_name(exchange))
+    except Exception:#pylint:disable=broad-except
+        boulangerie.metrics.incr('broker.dropped', len(messages))
+        LOGGER.exception('Cannot store %s events in the outbox, dropped.', len(messages))
+    else:
+        boulangerie.metrics.incr('broker.spilled', len(messages))
+
+class AsyncPublisher(object):
+    """
+    Publish from a background thread, through a queue bounded by its number of events:
+    the request threads only wait for room in the queue, at most `timeout` seconds,
+    before spilling the events to the outbox. So do the batches the thread can't publish.
+    """
+
+    def __init__(self, uri, size, timeout):
+        """
+        :param uri: The broker URI.
+        :type uri: str
+        :param size: The maximum number of events waiting in the queue.
+        :type size: int
+        :param timeout: Seconds to wait for room in the queue.
+        :type timeout: float
+        :rtype: None
+        """
+        self.pid = os.getpid()
+        self.size = size
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.batches = collections.deque()
+        #The events enqueued and not published yet.
+        self.pending = 0
+        #The background thread owns its connection, with publisher confirms.
+        self.publisher = create_backend(uri, confirm=True)
+        self.thread = threading.Thread(target=self._run, name='broker-publisher')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        """
+        Drain the queue, until the `None` sentinel.
+        """
+        while True:
+            with self.condition:
+                while not self.batches:
+                    self.condition.wait()
+                messages = self.batches.popleft()
+            if messages is None:
+                return
+            try:
+                self.publisher.publish_many(messages)
+            except Exception:#pylint:disable=broad-except
+                boulangerie.metrics.incr('broker.publish_errors')
+                LOGGER.exception('Cannot publish %s events, spilled to the outbox.', len(messages))
+                spill(messages)
+                connection.close()
+            finally:
+                with self.condition:
+                    self.pending -= len(messages)
+                    self.condition.notify_all()
+
+    def depth(self):
+        """
+        :returns: The number of events waiting to be published.
+        :rtype: int
+        """
+        return self.pending
+
+    def _enqueue(self, messages):
+        """
+        Wait for room in the queue, at most `timeout` seconds.
+        A batch larger than the queue waits for the queue to be empty.
+        :returns: Whether the messages were enqueued.
+        :rtype: bool
+        """
+        deadline = time.time() + self.timeout
+        with self.condition:
+            while self.pending and self.pending + len(messages) > self.size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            self.batches.append(messages)
+            self.pending += len(messages)
+            self.condition.notify_all()
+            return True
+
+    def publish_many(self, messages):
+        """
+        Enqueue the messages, or spill them to the outbox if the queue stays full.
+        :param messages: The (payload, routing_key, exchange) to publish, in order.
+        :type messages: list
+        :rtype: None
+        """
+        start = time.time()
+        enqueued = self._enqueue(messages)
+        boulangerie.metrics.timing('broker.enqueue_wait', time.time() - start)
+        if not enqueued:
+            boulangerie.metrics.incr('broker.enqueue_timeouts')
+            spill(messages)
+
+    def close(self):
+        """
+        Publish the pending messages, then stop the thread.
+        :rtype: None
+        """
+        if self.pid != os.getpid() or not self.thread.is_alive():
+            return
+        with self.condition:
+            self.batches.append(None)
+            self.condition.notify_all()
+        self.thread.join()
+        self.publisher.close()
+
+_PUBLISHER = None
+_ASYNC_PUBLISHER = None
+_PUBLISHER_LOCK = threading.Lock()
+
+def get_publisher():
+    """
+    Retrieve the process-wide publisher.
+    A new one is created after a fork (ie: in each gunicorn worker),
+    the connection inherited from the parent is never reused.
+    :rtype: Publisher, MemoryBackend, FileBackend
+    """
+    global _PUBLISHER#pylint:disable=global-statement
+    with _PUBLISHER_LOCK:
+        if _PUBLISHER is None or _PUBLISHER.pid != os.getpid() or \
+           _PUBLISHER.uri != settings.BROKER['uri']:
+            _PUBLISHER = create_backend(settings.BROKER['uri'])
+        return _PUBLISHER
+
+def get_async_publisher():
+    """
+    Retrieve the process-wide background publisher, started on first use.
+    As threads don't survive a fork, a new one is started in each worker.
+    :rtype: AsyncPublisher
+    """
+    global _ASYNC_PUBLISHER#pylint:disable=global-statement
+    with _PUBLISHER_LOCK:
+        if _ASYNC_PUBLISHER is None or _ASYNC_PUBLISHER.pid != os.getpid():
+            _ASYNC_PUBLISHER = AsyncPublisher(settings.BROKER['uri'],
+                                              settings.BROKER.get('queue_size', 1000),
+                                              settings.BROKER.get('enqueue_timeout', 0.1))
+            boulangerie.metrics.gauge('broker.queue_depth', _ASYNC_PUBLISHER.depth)
+        return _ASYNC_PUBLISHER
+
+@atexit.register
+def shutdown():
+    """
+    Flush the background publisher when the worker exits.
+    :rtype: None
+    """
+    if _ASYNC_PUBLISHER is not None:
+        _ASYNC_PUBLISHER.close()
+
+def dispatch(messages):
+    """
+    Publish the events, from the background thread when the async mode is enabled.
+    :param messages: The (payload, routing_key, exchange name) to publish, in order.
+    :type messages: list
+    :rtype: None
+    """
+    messages = [(payload, routing_key, EXCHANGES.get(exchange))
+                for payload, routing_key, exchange in messages]
+    if settings.BROKER.get('async'):
+        get_async_publisher().publish_many(messages)
+    else:
+        get_publisher().publish_many(messages)
+
+def publish(payload, routing_key, exchange):
+    """
+    Publish the `payload` to the broker right now, using the `routing_key`.
+    :param payload: the data to send.
+    :type payload: dict
+    :param routing_key: The routing key used to forward the payload.
+    :type routing_key: str
+    :param exchange: The exchange to send the payload
+    :type exchange: str
+    :rtype: None
+    """
+    get_publisher().publish_many([(payload, routing_key, EXCHANGES.get(exchange))])
+
+def coalesce(events):
+    """
+    Drop the events cancelling each other (ie: a creation followed by the deletion of the same object).
+    :param events: The (payload, routing_key, exchange) events, in order.
+    :type events: list
+    :returns: The remaining events, in order.
+    :rtype: list
+    """
+    deletions = dict(((exchange, deletion), (creation, fields))
+                     for (exchange, creation), (deletion, fields) in CANCELLATIONS.items())
+    kept = []
+    for event in events:
+        payload, routing_key, exchange = event
+        cancel = deletions.get((exchange, routing_key))
+        if cancel:
+            creation, fields = cancel
+            identity = [payload.get(field) for field in fields]
+            for index in range(len(kept) - 1, -1, -1):
+                previous, previous_key, previous_exchange = kept[index]
+                if (previous_exchange, previous_key) == (exchange, creation) and \
+                   [previous.get(field) for field in fields] == identity:
+                    del kept[index]
+                    event = None
+                    break
+        if event:
+            kept.append(event)
+    return kept
+
+class Batch(object):
+    """
+    Collect the events sent during a request, to publish them at once after the commit.
+    Each event sent within a transaction is held by a callback of its commit:
+    the events of a savepoint rolled back are dropped with their callbacks.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.discarded = False
+        self.outer = None
+        self.previous = None
+
+    def add(self, payload, routing_key, exchange):
+        """
+        Add an event to the batch.
+        Within a transaction, it is held until the commit.
+        :rtype: None
+        """
+        event = (payload, routing_key, exchange)
+        if connection.in_atomic_block:
+            transaction.on_commit(functools.partial(self.committed, event))
+        else:
+            self.events.append(event)
+
+    def committed(self, event):
+        """
+        Called on commit: the event is ready.
+        :rtype: None
+        """
+        if self.outer is not None:
+            self.outer.committed(event)
+        elif not self.discarded:
+            self.events.append(event)
+
+    def flush(self):
+        """
+        Publish the events which don't cancel each other, on a single channel.
+        :rtype: None
+        """
+        events, self.events = self.events, []
+        if not events:
+            return
+        kept = coalesce(events)
+        boulangerie.metrics.incr('broker.events_coalesced', len(events) - len(kept))
+        boulangerie.metrics.incr('broker.batches_flushed')
+        dispatch(kept)
+
+    def discard(self):
+        """
+        Drop the events, including the ones waiting for a commit.
+        :rtype: None
+        """
+        self.events = []
+        self.discarded = True
+
+    def close(self, outer=None):
+        """
+        Called at the end of the batch:
+        * no transaction is running anymore: publish the ready events now.
+        * a transaction is still running: the events are handed to the `outer` batch,
+          or published on its commit, after the callbacks holding them. They are never published before it.
+        A batch ends within the savepoint it started in: the publication is only rolled back with its events.
+        :param outer: The enclosing batch, if any.
+        :type outer: None, Batch
+        :rtype: None
+        """
+        if not connection.in_atomic_block:
+            self.flush()
+        elif outer is not None:
+            self.outer = outer
+            outer.events.extend(self.events)
+            self.events = []
+        else:
+            transaction.on_commit(self.flush)
+
+_LOCAL = threading.local()
+
+def begin():
+    """
+    Start batching the events sent by the current thread.
+    :rtype: Batch
+    """
+    current = Batch()
+    current.previous = getattr(_LOCAL, 'batch', None)
+    _LOCAL.batch = current
+    return current
+
+def end(discard=False):
+    """
+    Stop batching the events sent by the current thread, and publish them unless `discard`.
+    :param discard: Drop the events, ie: the request failed.
+    :type discard: bool
+    :rtype: None
+    """
+    current = getattr(_LOCAL, 'batch', None)
+    if current is None:
+        return
+    _LOCAL.batch = current.previous
+    if discard:
+        current.discard()
+    else:
+        current.close(current.previous)
+
+@contextlib.contextmanager
+def batch():
+    """
+    Batch all the events sent within the block.
+    The events are dropped if an exception is raised.
+    """
+    current = begin()
+    try:
+        yield current
+    except:
+        end(discard=True)
+        raise
+    end()
+
+def send(payload, routing_key, exchange, aggregate=None):
     """
     Send the `payload` to the broker using the `routing_key`.
+    When the outbox is enabled, the payload is stored within the current transaction
+    and published later by the `relay_outbox` command.
+    Otherwise, within a `batch()` (ie: a request), it is published after the commit.
     :param payload: the data to send.
     :type payload: dict
     :param routing_key: The routing key used to forward the payload.
     :type routing_key: str
     :param exchange: The exchange to send the payload
     :type exchange: str
-    :rtype: bool
-    """
-    exchange = EXCHANGES.get(exchange)
-    with kombu.Connection(settings.BROKER['uri']) as conn:
-        exchange = exchange(conn.channel())
-        exchange.declare()
-        with kombu.pools.producers[conn].acquire(block=True) as producer:
-            kombu.common.maybe_declare(exchange, producer.channel)
-            producer.publish(payload, routing_key=routing_key)
+    :param aggregate: The entity the event belongs to, the outbox keeps its events ordered.
+    :type aggregate: None, str
+    :rtype: None
+    """
+    if settings.BROKER.get('outbox'):
+        from boulangerie.apps.outbox.models import Event
+        Event.objects.push(payload, routing_key, exchange, aggregate)
+        return
+    current = getattr(_LOCAL, 'batch', None)
+    if current is not None:
+        current.add(payload, routing_key, exchange)
+        return
+    dispatch([(payload, routing_key, exchange)])
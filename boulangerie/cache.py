@@ -0,0 +1,44 @@
+#-*- coding:utf-8 -*-
+"""
+In-memory cache backend with a least-recently-used eviction:
+Django's `LocMemCache` culls arbitrary keys once `MAX_ENTRIES` is reached,
+this one evicts the keys which have not been read for the longest time.
+"""
+import collections
+import itertools
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache, dummy
+
+_caches = {}
+
+class LRUCache(LocMemCache):
+    """
+    LocMemCache keeping its keys in access order.
+    """
+
+    def __init__(self, name, params):
+        super(LRUCache, self).__init__(name, params)
+        self._cache = _caches.setdefault(name, collections.OrderedDict())
+
+    def get(self, key, default=None, version=None, acquire_lock=True):
+        value = super(LRUCache, self).get(key, default, version, acquire_lock)
+        key = self.make_key(key, version=version)
+        with (self._lock.writer() if acquire_lock else dummy()):
+            if key in self._cache:
+                self._cache[key] = self._cache.pop(key)
+        return value
+
+    def _set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self._cache.pop(key, None)
+        super(LRUCache, self)._set(key, value, timeout)
+
+    def _cull(self):
+        """
+        Evict the least recently used keys: 1 / CULL_FREQUENCY of the entries, at least one.
+        """
+        if self._cull_frequency == 0:
+            self.clear()
+            return
+        count = max(1, len(self._cache) // self._cull_frequency)
+        for key in list(itertools.islice(self._cache, count)):
+            self._delete(key)
@@ -0,0 +1,26 @@
+#-*- coding:utf-8 -*-
+"""
+System checks of the settings, run by `boulangerie check` and the other commands.
+"""
+from django.conf import settings
+from django.core import checks
+
+@checks.register(checks.Tags.caches)
+def check_access_caches(app_configs, **kwargs):#pylint:disable=unused-argument
+    """
+    The caches deciding the accesses must be shared by the workers (ie: gunicorn),
+    or keep their entries a few seconds: an invalidation only reaches the worker which made the change.
+    :rtype: list
+    """
+    errors = []
+    for alias in settings.ACCESS_CACHES:
+        cache = settings.CACHES[alias]
+        timeout = cache.get('TIMEOUT', 300)
+        if cache['BACKEND'] in settings.LOCAL_CACHES and (timeout is None or timeout > settings.LOCAL_CACHE_TIMEOUT):
+            errors.append(checks.Warning(
+                'The {0} cache is per worker: its entries outlive their invalidation '
+                'on the other workers for {1} seconds.'.format(alias, timeout),
+                hint='Set a shared {0}_backend (ie: memcached, redis), or a {0}_timeout '
+                     'of {1} seconds at most.'.format(alias, settings.LOCAL_CACHE_TIMEOUT),
+                id='boulangerie.W001'))
+    return errors
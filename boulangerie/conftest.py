@@ -1,8 +1,6 @@
 #-*- coding:utf-8 -*-
 import os
-import rabbitpy
 import pytest
-from pytest_rabbitmq.factories.client import clear_rabbitmq
 from django.conf import settings
 
 def pytest_configure():
@@ -22,19 +20,76 @@ def farine_ini():
     import farine.settings
     farine.settings.load()
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """
+    The database is rolled back after each test, the caches must be too.
+    """
+    from django.core.cache import caches
+    yield
+    for cache in caches.all():
+        cache.clear()
+
+def run_commit_hooks():
+    """
+    The test transaction is never committed:
+    run the callbacks registered on commit, as the commit of the outermost transaction would.
+    """
+    from django.db import connection
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, func in callbacks:
+        func()
+
+@pytest.fixture
+def commit():
+    """
+    Commit, as far as the `transaction.on_commit()` callbacks are concerned.
+    """
+    return run_commit_hooks
+
+@pytest.fixture(autouse=True)
+def request_commit(monkeypatch):
+    """
+    Each request of the test clients ends with the commit of its transaction (ATOMIC_REQUESTS).
+    """
+    from django.test.client import Client
+    request = Client.request
+    def wrapper(self, **kwargs):#pylint:disable=missing-docstring
+        response = request(self, **kwargs)
+        run_commit_hooks()
+        return response
+    monkeypatch.setattr(Client, 'request', wrapper)
+
+class MemoryQueue(object):
+    """
+    A queue of the in-memory broker (`memory://`).
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __len__(self):
+        import boulangerie.broker
+        return boulangerie.broker.MemoryBackend.size(self.name)
+
+    def consume(self):
+        """
+        Pop the messages, until the queue is empty.
+        """
+        import boulangerie.broker
+        while True:
+            message = boulangerie.broker.MemoryBackend.get(self.name)
+            if message is None:
+                return
+            yield message
+
 @pytest.fixture
-def broker_factory(request, rabbitmq, rabbitmq_proc):
+def broker_factory(request):
+    import boulangerie.broker
     def factory(exchange_name, name):
-        channel = rabbitmq.channel()
-        exchange = rabbitpy.Exchange(channel, exchange_name, auto_delete=False, durable=True)
-        exchange.declare()
-        queue = rabbitpy.Queue(channel, name, auto_delete=False, durable=True)
-        queue.declare()
-        queue.bind(exchange, routing_key=name)
-        return queue, exchange
-    def cleanup():
-        clear_rabbitmq(rabbitmq_proc, rabbitmq)
-    request.addfinalizer(cleanup)
+        boulangerie.broker.MemoryBackend.bind(name, exchange_name, name)
+        return MemoryQueue(name), exchange_name
+    request.addfinalizer(boulangerie.broker.MemoryBackend.reset)
     return factory
 
 @pytest.fixture(autouse=True)
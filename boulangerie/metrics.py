@@ -0,0 +1,99 @@
+#-*- coding:utf-8 -*-
+"""
+Process-local metrics: counters, gauges and timings.
+They are exposed to the admins by the `/api/0.1/metrics/` endpoint.
+"""
+import threading
+
+_LOCK = threading.Lock()
+_COUNTERS = {}
+_GAUGES = {}
+_TIMINGS = {}
+_PROBES = {}
+
+def incr(name, value=1):
+    """
+    Increment the counter `name`.
+    :param name: The counter name.
+    :type name: str
+    :param value: The increment.
+    :type value: int, float
+    :rtype: None
+    """
+    with _LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + value
+
+def counter(name):
+    """
+    Retrieve the counter `name`, ie: for a callable gauge.
+    :param name: The counter name.
+    :type name: str
+    :rtype: int, float
+    """
+    with _LOCK:
+        return _COUNTERS.get(name, 0)
+
+def gauge(name, value):
+    """
+    Set the gauge `name`.
+    :param name: The gauge name.
+    :type name: str
+    :param value: The value, or a callable evaluated when the metrics are read.
+    :type value: int, float, callable
+    :rtype: None
+    """
+    with _LOCK:
+        _GAUGES[name] = value
+
+def timing(name, seconds):
+    """
+    Record a duration for `name`: count, total and max are kept.
+    :param name: The timing name.
+    :type name: str
+    :param seconds: The duration.
+    :type seconds: float
+    :rtype: None
+    """
+    with _LOCK:
+        current = _TIMINGS.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        current['count'] += 1
+        current['total'] += seconds
+        current['max'] = max(current['max'], seconds)
+
+def probe(name, function):
+    """
+    Register a gauge read from an external state, ie: the database.
+    Unlike the callable gauges, it is only evaluated by the metrics endpoint.
+    :param name: The gauge name.
+    :type name: str
+    :param function: Returns the value.
+    :type function: callable
+    :rtype: None
+    """
+    with _LOCK:
+        _PROBES[name] = function
+
+def snapshot(probes=False):
+    """
+    Retrieve all the metrics.
+    :param probes: Evaluate the probes too.
+    :type probes: bool
+    :rtype: dict
+    """
+    with _LOCK:
+        gauges = dict(_GAUGES)
+        if probes:
+            gauges.update(_PROBES)
+        result = {'counters': dict(_COUNTERS),
+                  'timings': dict((k, dict(v)) for k, v in _TIMINGS.items())}
+    result['gauges'] = dict((k, v() if callable(v) else v) for k, v in gauges.items())
+    return result
+
+def reset():
+    """
+    Reset the counters and the timings, the gauges and the probes are kept.
+    :rtype: None
+    """
+    with _LOCK:
+        _COUNTERS.clear()
+        _TIMINGS.clear()
@@ -0,0 +1,21 @@
+#-*- coding:utf-8 -*-
+"""
+Broker middleware for Django:
+the events sent during a request are batched, and published once the transaction is committed.
+The events of a failed request are dropped.
+"""
+import boulangerie.broker
+
+class Batch(object):
+
+    def process_request(self, request):#pylint:disable=unused-argument
+        boulangerie.broker.begin()
+
+
+    def process_exception(self, request, exception):#pylint:disable=unused-argument
+        boulangerie.broker.end(discard=True)
+
+
+    def process_response(self, request, response):#pylint:disable=unused-argument
+        boulangerie.broker.end(discard=response.status_code >= 500)
+        return response
@@ -0,0 +1,181 @@
+#-*- coding:utf-8 -*-
+"""
+Commands feeding the read models of the builds and of the deployments: `ConsumeCommand` applies the
+events of a service from a durable queue, `SyncCommand` pages through the service to backfill them.
+The read model modules provide `apply(events)`, `consume(body, message)`, `is_synchronized(organization)`
+and `synchronized(organization)`, and the `FIELDS` of the events they apply, cf `apply_detail()`.
+"""
+import json
+import logging
+import socket
+import farine.settings
+import kombu
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import InterfaceError, OperationalError
+from django.utils import dateparse
+import boulangerie.metrics
+import boulangerie.rpc
+
+LOGGER = logging.getLogger(__name__)
+
+#The errors an event can't be blamed for: the event waits in the queue until the database is back.
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+def _complete(event, fields, organization, uid):
+    return isinstance(event, dict) and all(field in event for field in fields) and \
+           event['owner'] == organization and event['uid'] == uid and \
+           dateparse.parse_datetime(event['date_created'] or '') is not None
+
+def apply_detail(readmodel, organization, uid, result):
+    """
+    Apply the detail of an aggregate retrieved from its service, ie: on a fallback.
+    It is only applied when all its events are complete, and belong to the aggregate.
+    :param readmodel: The read model module.
+    :type readmodel: module
+    :param result: The result of `detail(organization, uid)`.
+    :type result: dict
+    :returns: Whether the detail was applied.
+    :rtype: bool
+    """
+    events = result.get('results') or []
+    try:
+        decoded = [event if isinstance(event, dict) else json.loads(event) for event in events]
+    except (TypeError, ValueError):
+        decoded = None
+    if not decoded or not all(_complete(event, readmodel.FIELDS, organization, uid) for event in decoded):
+        LOGGER.warning('Incomplete detail of %s/%s, not applied.', organization, uid)
+        boulangerie.metrics.incr('readmodels.incomplete')
+        return False
+    readmodel.apply(events)
+    return True
+
+
+class ConsumeCommand(BaseCommand):
+    """
+    Apply the events from a durable queue bound to the exchange of the service, forever or just once:
+    the events published while the command is stopped wait in the queue.
+    The command stops, and requeues the event, when the database is unavailable. An event that can't be
+    applied is moved to the dead letter queue, `dead_letter_queue` of the settings, with its error.
+    """
+    #The name of the service, its exchange and its `farine.settings` section.
+    service = None
+    #The read model module.
+    readmodel = None
+    #The name of the settings, with `queue`, `routing_key` and `dead_letter_queue`.
+    settings_name = None
+    #The prefix of the metrics.
+    metric = None
+    noun = 'event'
+
+    def __init__(self, *args, **kwargs):
+        super(ConsumeCommand, self).__init__(*args, **kwargs)
+        self.producer = None
+        self.dead_letters = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait for the next {0}.'.format(self.noun))
+        parser.add_argument('--once', action='store_true',
+                            help='Apply the queued events then exit.')
+
+    def callback(self, body, message):
+        """
+        Apply an event: requeue it and stop when the database is unavailable,
+        dead-letter it when it can't be applied.
+        """
+        try:
+            self.readmodel.consume(body, message)
+        except TRANSIENT_ERRORS as error:
+            boulangerie.metrics.incr('{0}.requeued'.format(self.metric))
+            message.requeue()
+            raise CommandError('Cannot apply the {0} {1}, requeued: {2}'.format(self.noun, body, error))
+        except Exception as error:#pylint:disable=broad-except
+            LOGGER.exception('Cannot apply the %s %s, dead-lettered.', self.noun, body)
+            self.producer.publish(body, exchange='', routing_key=self.dead_letters.name, serializer='json',
+                                  declare=[self.dead_letters], headers={'error': repr(error)})
+            boulangerie.metrics.incr('{0}.dead_lettered'.format(self.metric))
+            message.ack()
+
+    def handle(self, *args, **options):
+        config = getattr(settings, self.settings_name)
+        exchange = kombu.Exchange(self.service, type='direct', durable=True)
+        queue = kombu.Queue(config['queue'], exchange=exchange, routing_key=config['routing_key'], durable=True)
+        self.dead_letters = kombu.Queue(config['dead_letter_queue'], routing_key=config['dead_letter_queue'],
+                                        durable=True)
+        with kombu.Connection(getattr(farine.settings, self.service)['amqp_uri']) as connection:
+            self.producer = kombu.Producer(connection.channel())
+            with kombu.Consumer(connection, queues=[queue], callbacks=[self.callback], accept=['json']):
+                while True:
+                    try:
+                        connection.drain_events(timeout=options['interval'])
+                    except socket.timeout:
+                        if options['once']:
+                            return
+
+
+class SyncCommand(BaseCommand):
+    """
+    Page through the aggregates of each organization, latest first, and apply the events of the
+    aggregates missing or behind their latest event. A synchronized organization stops at its first page
+    already up to date. With `--full`, all the aggregates are applied again: the read models are
+    idempotent, this repairs the events missed in the middle of an aggregate.
+    """
+    #The name of the service.
+    service = None
+    #The read model module.
+    readmodel = None
+    #The model of the aggregates, and its field with the id of the latest event applied.
+    model = None
+    version = None
+    #The plural name of the aggregates.
+    noun = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('organizations', nargs='*',
+                            help='The organizations to synchronize, all by default.')
+        parser.add_argument('--page-size', type=int, default=100,
+                            help='Number of {0} listed per call.'.format(self.noun))
+        parser.add_argument('--full', action='store_true',
+                            help='Page through all the {0} of the organizations, and apply them again.'
+                            .format(self.noun))
+
+    def call(self, method, *args):
+        """
+        Call the service, the client is only held for the call.
+        :raises boulangerie.rpc.Unavailable: If the service can't be called.
+        """
+        with boulangerie.rpc.client(self.service) as rpc:
+            return getattr(rpc, method)(*args)
+
+    def sync(self, organization, page_size, full):
+        """
+        Synchronize an organization.
+        :returns: The number of aggregates applied.
+        :rtype: int
+        """
+        applied = 0
+        offset = 0
+        while True:
+            result = self.call('list', organization, offset, page_size)
+            latest = [json.loads(row) for row in result.get('results', [])]
+            known = dict(self.model.objects.filter(uid__in=[row['uid'] for row in latest])
+                         .values_list('uid', self.version))
+            behind = [row['uid'] for row in latest if full or known.get(row['uid']) != row['id']]
+            for uid in behind:
+                self.readmodel.apply(self.call('detail', organization, uid).get('results', []))
+            applied += len(behind)
+            offset += page_size
+            if len(latest) < page_size or not behind:
+                break
+        self.readmodel.synchronized(organization)
+        return applied
+
+    def handle(self, *args, **options):
+        from boulangerie.apps.organizations.models import Organization
+        organizations = options['organizations'] or Organization.objects.order_by('name')\
+                                                                        .values_list('name', flat=True).iterator()
+        for organization in organizations:
+            full = options['full'] or not self.readmodel.is_synchronized(organization)
+            applied = self.sync(organization, options['page_size'], full)
+            self.stdout.write('{0}: {1} {2} applied.'.format(organization, applied, self.noun))
@@ -0,0 +1,137 @@
+#-*- coding:utf-8 -*-
+"""
+Cache of the build and deployment details, keyed by service, organization and uid:
+a finished build or a stopped deployment retrieved from its service is complete and never changes,
+it is kept `settings.RESULTS['terminal_timeout']` seconds. The other results, in progress or read from
+the local tables whose steps may still be missing, only for the timeout of the cache.
+The read models drop the details they change, cf `invalidate()`.
+The membership must be checked before `cached()` or `call()` is called.
+The results retrieved by RPC are also kept as stale copies, for `settings.RPC['stale_timeout']` seconds:
+they are served, with a `Warning` header, while the service is unavailable, cf `boulangerie.rpc.Unavailable`.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+import boulangerie.metrics
+import boulangerie.rpc
+
+#RFC 7234, section 5.5.1.
+STALE_WARNING = '110 - "Response is Stale"'
+
+def _key(service, organization, uid):
+    return u'result:{0}:{1}:{2}'.format(service, organization, uid)
+
+def _stale_key(service, method, args):
+    return u'stale:{0}:{1}:{2}'.format(service, method, u':'.join(u'{0}'.format(arg) for arg in args))
+
+def _stale(key):
+    """
+    Retrieve a stale copy, within the `except` clause of `boulangerie.rpc.Unavailable`:
+    the error is raised again without copy.
+    """
+    result = caches['results'].get(key)
+    if result is None:
+        boulangerie.metrics.incr('results_cache.unavailable')
+        raise#pylint:disable=misplaced-bare-raise
+    boulangerie.metrics.incr('results_cache.stale')
+    return result
+
+def hit_ratio():
+    """
+    The ratio of the details served from the cache.
+    :rtype: float
+    """
+    hits = boulangerie.metrics.counter('results_cache.hits')
+    total = hits + boulangerie.metrics.counter('results_cache.misses')
+    return float(hits) / total if total else 0.0
+
+boulangerie.metrics.gauge('results_cache.hit_ratio', hit_ratio)
+
+def fetch(service, method, *args):
+    """
+    Call the service, its result is kept as a stale copy.
+    :param service: The farine service.
+    :type service: str
+    :param method: The RPC method.
+    :type method: str
+    :returns: The result.
+    :rtype: object
+    :raises boulangerie.rpc.Unavailable: If the service is unavailable.
+    """
+    with boulangerie.rpc.client(service) as rpc:
+        result = getattr(rpc, method)(*args)
+    caches['results'].set(_stale_key(service, method, args), result, settings.RPC['stale_timeout'])
+    return result
+
+def call(service, method, *args):
+    """
+    Call the service, or retrieve the stale copy of its result while it is unavailable, cf `fetch()`.
+    :returns: The result, and whether it is a stale copy.
+    :rtype: tuple
+    :raises boulangerie.rpc.Unavailable: If the service is unavailable, without stale copy.
+    """
+    try:
+        return fetch(service, method, *args), False
+    except boulangerie.rpc.Unavailable:
+        return _stale(_stale_key(service, method, args)), True
+
+def cached(service, organization, uid, load, terminal):
+    """
+    Retrieve a detail from the cache, `load()` it on a miss.
+    :param service: The service of the detail: cuisson, defournement.
+    :type service: str
+    :param load: Returns the detail, and whether it was retrieved by RPC, cf `fetch()`.
+    :type load: callable
+    :param terminal: Tells if a detail won't change anymore, once complete.
+    :type terminal: callable
+    :returns: The detail, and whether it is a stale copy.
+    :rtype: tuple
+    :raises boulangerie.rpc.Unavailable: If the service is unavailable, without stale copy.
+    """
+    cache = caches['results']
+    key = _key(service, organization, uid)
+    value = cache.get(key)
+    if value is not None:
+        result, rpc = value
+        boulangerie.metrics.incr('results_cache.hits')
+        if rpc:
+            boulangerie.metrics.incr('results_cache.rpc_saved')
+        return result, False
+    boulangerie.metrics.incr('results_cache.misses')
+    try:
+        result, rpc = load()
+    except boulangerie.rpc.Unavailable:
+        return _stale(_stale_key(service, 'detail', (organization, uid))), True
+    #An unknown uid may be created later.
+    if result.get('results'):
+        if rpc and terminal(result):
+            cache.set(key, (result, rpc), settings.RESULTS['terminal_timeout'])
+        else:
+            cache.set(key, (result, rpc))
+    return result, False
+
+def response(result, stale):
+    """
+    The response of a result, flagged if it is a stale copy.
+    :rtype: rest_framework.response.Response
+    """
+    return Response(result, headers={'Warning': STALE_WARNING} if stale else None)
+
+def unavailable(service):
+    """
+    The response when the service is unavailable, without stale copy.
+    :rtype: rest_framework.response.Response
+    """
+    return Response({'error': '{0} is unavailable'.format(service)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+def invalidate(service, organization, uid):
+    """
+    Drop a detail, ie: a deployment being stopped or a step applied,
+    right now and once the transaction is committed: a concurrent request could cache the former detail.
+    :rtype: None
+    """
+    key = _key(service, organization, uid)
+    caches['results'].delete(key)
+    transaction.on_commit(lambda: caches['results'].delete(key))
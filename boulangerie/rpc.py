@@ -0,0 +1,349 @@
+#-*- coding:utf-8 -*-
+"""
+Pooled RPC clients of the farine services (ie: cuisson, defournement).
+
+A `farine.rpc.Client` connects, declares its reply queue and starts a consumer for each call,
+and can't be called twice. The clients of this module keep their connection, channel,
+reply queue and consumer across the calls, and are kept in a pool per service and per process:
+a new pool is created after a fork (ie: in each gunicorn worker), the connections inherited
+from the parent are never reused.
+Each pool guards its service, within the process: a call has a deadline, at most `max_in_flight`
+calls are made at once, and the circuit opens after `failure_threshold` consecutive failures,
+the calls failing fast for `reset_timeout` seconds before a trial call. `Unavailable` is raised then.
+
+    with boulangerie.rpc.client('cuisson') as rpc:
+        builds = rpc.list(organization, offset, limit)
+"""
+import collections
+import contextlib
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+import farine.exceptions
+import farine.rpc
+import kombu
+from django.conf import settings
+import boulangerie.metrics
+
+class Unavailable(farine.exceptions.RPCError):
+    """
+    The service can't be called: no reply in time, connection failure,
+    circuit open or too many calls in flight.
+    """
+
+class Client(farine.rpc.Client):
+    """
+    farine RPC client set up once, on its first call.
+    Its reply queue is exclusive: the broker drops it with the connection.
+    The calls still go through `__wrap_rpc__`, which the tests mock.
+    """
+    exclusive = True
+    auto_delete = True
+
+    def __init__(self, service, timeout=None):
+        super(Client, self).__init__(service, timeout)
+        self.pid = os.getpid()
+        self.channel = None
+        self.producer = None
+        self.consumer = None
+        self.correlation_id = None
+        self.pending = collections.deque()
+        self.broken = False
+        self.last_used = time.time()
+
+    def _setup(self):
+        """
+        Open the channel, declare the reply queue and start consuming it, once.
+        """
+        if self.consumer is not None:
+            return
+        self.connection.ensure_connection(max_retries=1)
+        self.channel = self.connection.channel()
+        self.producer = kombu.Producer(self.channel, exchange=self.exchange,
+                                       serializer=self.settings['serializer'])
+        self.consumer = kombu.Consumer(self.channel, queues=[self.queue], callbacks=[self.on_reply],
+                                       no_ack=True, accept=[self.settings['serializer']])
+        self.consumer.consume()
+
+    def on_reply(self, body, message):
+        """
+        Keep the replies of the current call,
+        the late replies of a previous call, ie: timed out, are dropped.
+        """
+        if message.properties.get('correlation_id') == self.correlation_id:
+            self.pending.append(body)
+
+    def __rpc__(self, *args, **kwargs):
+        """
+        Publish the call then yield the bodies of its replies, cf `farine.rpc.Client.__rpc__`:
+        all of them must be received within `timeout` seconds.
+        :raises Unavailable: If the call failed or timed out.
+        :raises farine.exceptions.RPCError: If the call failed remotely.
+        """
+        start = time.time()
+        deadline = start + self.timeout
+        try:
+            self._setup()
+            self.correlation_id = uuid.uuid4().hex
+            self.pending.clear()
+            self.producer.publish({'args': args, 'kwargs': kwargs},
+                                  routing_key='{0}__{1}'.format(self.service, self.remote),
+                                  correlation_id=self.correlation_id,
+                                  reply_to=self.queue.name,
+                                  delivery_mode=self.settings['delivery_mode'])
+        except Exception:#pylint:disable=broad-except
+            self.broken = True
+            raise Unavailable(traceback.format_exc())
+        while True:
+            while not self.pending:
+                try:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise socket.timeout()
+                    self.connection.drain_events(timeout=remaining)
+                except socket.timeout:
+                    raise Unavailable(traceback.format_exc())
+                except Exception:#pylint:disable=broad-except
+                    self.broken = True
+                    raise Unavailable(traceback.format_exc())
+            result = self.pending.popleft()
+            if result.get('__except__'):
+                raise farine.exceptions.RPCError(result['__except__'])
+            elif result.get('__end__'):
+                return
+            elif result.get('body'):
+                boulangerie.metrics.timing('rpc.{0}.{1}'.format(self.service, self.remote), time.time() - start)
+                yield result['body']
+
+    def check(self):
+        """
+        Health check: process the pending events of the connection,
+        it raises if the broker closed it.
+        :rtype: None
+        """
+        if self.consumer is None:
+            return
+        try:
+            self.connection.drain_events(timeout=0.001)
+        except socket.timeout:
+            pass
+
+    def close(self):
+        """
+        Release the connection, unless it was inherited from the parent process.
+        :rtype: None
+        """
+        if self.pid == os.getpid():
+            try:
+                self.connection.release()
+            except Exception:#pylint:disable=broad-except
+                pass
+
+class Breaker(object):
+    """
+    Circuit breaker of a service: open after `threshold` consecutive failures,
+    then half-open after `reset_timeout` seconds: one trial call closes it, or opens it again.
+    """
+
+    def __init__(self, service, threshold, reset_timeout):
+        """
+        :param service: The farine service.
+        :type service: str
+        :param threshold: The consecutive failures opening the circuit.
+        :type threshold: int
+        :param reset_timeout: Seconds before a trial call.
+        :type reset_timeout: float
+        :rtype: None
+        """
+        self.service = service
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+
+    def is_open(self):
+        """
+        Tell if the calls fail fast, ie: for the metrics.
+        :rtype: bool
+        """
+        return self.opened is not None
+
+    def allow(self):
+        """
+        Tell if a call can be made: the circuit is closed, or it is the trial call.
+        :rtype: bool
+        """
+        with self.lock:
+            if self.opened is None:
+                return True
+            if self.trial or time.time() - self.opened < self.reset_timeout:
+                return False
+            self.trial = True
+            return True
+
+    def success(self):
+        """
+        The service replied: close the circuit.
+        :rtype: None
+        """
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def abort(self):
+        """
+        The call failed before judging the service: a trial call is allowed again.
+        :rtype: None
+        """
+        with self.lock:
+            self.trial = False
+
+    def failure(self):
+        """
+        The service didn't reply: open the circuit past the threshold, or after a failed trial call.
+        :rtype: None
+        """
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+            if self.opened is not None or self.failures >= self.threshold:
+                self.opened = time.time()
+                boulangerie.metrics.incr('rpc.{0}.opened'.format(self.service))
+
+class Pool(object):
+    """
+    The idle clients of a service, its circuit breaker and its bulkhead.
+    """
+
+    def __init__(self, service, size, timeout, check_interval):
+        """
+        :param service: The farine service.
+        :type service: str
+        :param size: The idle clients kept.
+        :type size: int
+        :param timeout: Seconds to wait for the replies of a call.
+        :type timeout: float
+        :param check_interval: Seconds of idleness after which a client is checked before its use.
+        :type check_interval: float
+        :rtype: None
+        """
+        self.service = service
+        self.size = size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.idle = collections.deque()
+        self.breaker = Breaker(service, settings.RPC['failure_threshold'], settings.RPC['reset_timeout'])
+        self.bulkhead = threading.BoundedSemaphore(settings.RPC['max_in_flight'])
+
+    def acquire(self):
+        """
+        Take an idle client, checked if it has been idle for long, or create one.
+        :rtype: Client
+        """
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                rpc = self.idle.pop()
+            if time.time() - rpc.last_used > self.check_interval:
+                try:
+                    rpc.check()
+                except Exception:#pylint:disable=broad-except
+                    boulangerie.metrics.incr('rpc_pool.discarded')
+                    rpc.close()
+                    continue
+            boulangerie.metrics.incr('rpc_pool.reused')
+            return rpc
+        boulangerie.metrics.incr('rpc_pool.created')
+        return Client(self.service, self.timeout)
+
+    def release(self, rpc):
+        """
+        Give the client back, it is closed if it is broken or if the pool is full.
+        :rtype: None
+        """
+        rpc.last_used = time.time()
+        with self.lock:
+            if not rpc.broken and len(self.idle) < self.size:
+                self.idle.append(rpc)
+                return
+        boulangerie.metrics.incr('rpc_pool.discarded')
+        rpc.close()
+
+    def close(self):
+        """
+        Close the idle clients.
+        :rtype: None
+        """
+        with self.lock:
+            clients, self.idle = list(self.idle), collections.deque()
+        for rpc in clients:
+            rpc.close()
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_pool(service):
+    """
+    Retrieve the pool of the service for this process.
+    :rtype: Pool
+    """
+    with _POOLS_LOCK:
+        pool = _POOLS.get(service)
+        if pool is None or pool.pid != os.getpid():
+            pool = _POOLS[service] = Pool(service, settings.RPC['pool_size'], settings.RPC['timeout'],
+                                          settings.RPC['check_interval'])
+            boulangerie.metrics.gauge('rpc.{0}.circuit_open'.format(service), pool.breaker.is_open)
+        return pool
+
+@contextlib.contextmanager
+def client(service, timeout=None):
+    """
+    Borrow a client of the service for non-streaming calls,
+    unless the circuit is open or too many calls are in flight.
+    The block should only make the calls: a client and a slot are held until its end,
+    and an error other than `farine.exceptions.RPCError` doesn't tell whether the service is up.
+    :param service: The farine service.
+    :type service: str
+    :param timeout: Seconds to wait for the replies of a call, `settings.RPC['timeout']` by default.
+    :type timeout: float
+    :rtype: Client
+    :raises Unavailable: If the service can't be called.
+    """
+    pool = get_pool(service)
+    if not pool.bulkhead.acquire(False):
+        boulangerie.metrics.incr('rpc.{0}.rejected'.format(service))
+        raise Unavailable('Too many calls in flight to {0}.'.format(service))
+    try:
+        if not pool.breaker.allow():
+            boulangerie.metrics.incr('rpc.{0}.rejected'.format(service))
+            raise Unavailable('The circuit of {0} is open.'.format(service))
+        rpc = pool.acquire()
+        rpc.timeout = timeout or pool.timeout
+        try:
+            yield rpc
+        except Unavailable:
+            pool.breaker.failure()
+            raise
+        except farine.exceptions.RPCError:
+            #The service replied, ie: a remote error.
+            pool.breaker.success()
+            raise
+        except Exception:
+            #An error of the caller, ie: the database: the service isn't judged.
+            pool.breaker.abort()
+            raise
+        else:
+            pool.breaker.success()
+        finally:
+            pool.release(rpc)
+    finally:
+        pool.bulkhead.release()
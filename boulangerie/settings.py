@@ -23,6 +23,14 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CONFIG = configparser.SafeConfigParser(allow_no_value=True)
 CONFIG.read(os.environ.get('BOULANGERIE_INI', '/etc/boulangerie.ini'))
 
+def get_option(section, option, default=None):
+    """
+    Retrieve an optional `option` of the configuration, `default` if not set.
+    """
+    if CONFIG.has_option(section, option):
+        return CONFIG.get(section, option)
+    return default
+
 DEBUG = bool(int(CONFIG.get('general', 'debug')))
 STATIC_URL = CONFIG.get('general', 'static_url')
 STATIC_ROOT = CONFIG.get('general', 'static_root') or os.path.join(BASE_DIR, "static")
@@ -31,6 +39,45 @@ ALLOWED_HOSTS = [CONFIG.get('security', 'allowed_host')]
 
 BROKER = {
     'uri': CONFIG.get('broker', 'uri'),
+    #Store the events within the transaction, `boulangerie relay_outbox` publishes them.
+    'outbox': bool(int(get_option('broker', 'outbox', 0))),
+    #Publish from a background thread: the requests only wait for a slot in the queue.
+    'async': bool(int(get_option('broker', 'async', 0))),
+    'queue_size': int(get_option('broker', 'queue_size', 1000)),
+    #Seconds to wait for a slot, the events are stored in the outbox past this delay, cf `relay_outbox`.
+    'enqueue_timeout': float(get_option('broker', 'enqueue_timeout', 0.1)),
+}
+
+#The RPC clients of cuisson and defournement, cf `boulangerie.rpc`.
+RPC = {
+    #Idle clients kept per service and per process.
+    'pool_size': int(get_option('rpc', 'pool_size', 8)),
+    #Seconds to wait for a reply.
+    'timeout': float(get_option('rpc', 'timeout', 10)),
+    #Seconds of idleness after which a client is checked before its use.
+    'check_interval': float(get_option('rpc', 'check_interval', 30)),
+    #The circuit of a service opens after `failure_threshold` consecutive failures,
+    #a trial call is made after `reset_timeout` seconds.
+    'failure_threshold': int(get_option('rpc', 'failure_threshold', 5)),
+    'reset_timeout': float(get_option('rpc', 'reset_timeout', 30)),
+    #Calls in flight per service and per process, the next ones fail fast.
+    'max_in_flight': int(get_option('rpc', 'max_in_flight', 10)),
+    #Seconds the results are kept to be served stale while the service is unavailable.
+    'stale_timeout': int(get_option('rpc', 'stale_timeout', 86400)),
+}
+
+#The build steps published by cuisson, consumed by `boulangerie consume_builds`.
+BUILDS = {
+    'queue': get_option('builds', 'queue', 'boulangerie-builds'),
+    'routing_key': get_option('builds', 'routing_key', 'build-step'),
+    'dead_letter_queue': get_option('builds', 'dead_letter_queue', 'boulangerie-builds-dead'),
+}
+
+#The deployment events published by defournement, consumed by `boulangerie consume_deployments`.
+DEPLOYMENTS = {
+    'queue': get_option('deployments', 'queue', 'boulangerie-deployments'),
+    'routing_key': get_option('deployments', 'routing_key', 'deployment-event'),
+    'dead_letter_queue': get_option('deployments', 'dead_letter_queue', 'boulangerie-deployments-dead'),
 }
 
 QUOTAS = {
@@ -39,6 +86,8 @@ QUOTAS = {
     'max_vpcs' : CONFIG.get('quotas', 'max_vpcs'),
     'max_organizations' : CONFIG.get('quotas', 'max_organizations'),
 }
+#The plan of the owners without subscription, its quotas override the ones above.
+QUOTAS_PLAN = get_option('quotas', 'plan', 'default')
 
 DATABASES = {
     'default': {
@@ -52,8 +101,92 @@ DATABASES = {
     }
 }
 
+#The backends kept by each worker: an invalidation doesn't reach the other workers.
+LOCAL_CACHES = ('boulangerie.cache.LRUCache', 'django.core.cache.backends.locmem.LocMemCache')
+#The caches deciding the accesses (`ACCESS_CACHES`) keep their entries `LOCAL_CACHE_TIMEOUT` seconds
+#by default when they are per worker, cf `boulangerie.checks`.
+LOCAL_CACHE_TIMEOUT = 5
+ACCESS_CACHES = ('membership', 'principal', 'authorization')
+
+def access_cache(name, timeout):
+    """
+    The settings of a cache deciding the accesses:
+    `timeout` is its default with a shared backend (ie: memcached, redis), `LOCAL_CACHE_TIMEOUT` otherwise.
+    """
+    backend = get_option('cache', '{0}_backend'.format(name), LOCAL_CACHES[0])
+    return {
+        'BACKEND': backend,
+        'LOCATION': get_option('cache', '{0}_location'.format(name), name),
+        'TIMEOUT': int(get_option('cache', '{0}_timeout'.format(name),
+                                  LOCAL_CACHE_TIMEOUT if backend in LOCAL_CACHES else timeout)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(get_option('cache', '{0}_max_entries'.format(name), 10000)),
+        },
+    }
+
+#Shared caches, per worker by default: any Django cache backend can be configured.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'membership': access_cache('membership', 300),
+    #The status of the token accounts, a timeout of 0 checks the database on every request.
+    'principal': access_cache('principal', 60),
+    #The successful password checks, keyed on an HMAC of the credentials.
+    'credentials': {
+        'BACKEND': get_option('cache', 'credentials_backend', 'boulangerie.cache.LRUCache'),
+        'LOCATION': get_option('cache', 'credentials_location', 'credentials'),
+        'TIMEOUT': int(get_option('cache', 'credentials_timeout', 60)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(get_option('cache', 'credentials_max_entries', 10000)),
+        },
+    },
+    #The git accesses, cf `boulangerie.apps.keys.authorization`: its versions are kept until evicted.
+    'authorization': access_cache('authorization', 300),
+    #The build and deployment details, cf `boulangerie.results`: the timeout is for the results in progress,
+    #the terminal ones are kept `RESULTS['terminal_timeout']` seconds.
+    'results': {
+        'BACKEND': get_option('cache', 'results_backend', 'boulangerie.cache.LRUCache'),
+        'LOCATION': get_option('cache', 'results_location', 'results'),
+        'TIMEOUT': int(get_option('cache', 'results_timeout', 5)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(get_option('cache', 'results_max_entries', 10000)),
+        },
+    },
+    'quotas': {
+        'BACKEND': get_option('cache', 'quotas_backend', 'boulangerie.cache.LRUCache'),
+        'LOCATION': get_option('cache', 'quotas_location', 'quotas'),
+        'TIMEOUT': int(get_option('cache', 'quotas_timeout', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(get_option('cache', 'quotas_max_entries', 10000)),
+        },
+    },
+}
+
 SECRET_KEY = CONFIG.get('security', 'secret_key')
 
+KEYS_EXPORT = {
+    #The journal entries are resent by the deltas until they are `settle` seconds old:
+    #a longer transaction may commit a lower sequence after them.
+    'settle': int(get_option('keys', 'export_settle', 5)),
+    #The journal entries are deleted by `boulangerie prune_keys_journal` once `retention` seconds old:
+    #a gateway which didn't resync for longer takes a snapshot.
+    'retention': int(get_option('keys', 'export_retention', 7 * 86400)),
+}
+
+RESULTS = {
+    #Seconds a finished build or a stopped deployment is kept in the `results` cache.
+    'terminal_timeout': int(get_option('cache', 'results_terminal_timeout', 3600)),
+}
+
+KEYPOOL = {
+    #The pre-generated keypairs kept by `boulangerie fill_keypool`, 0 to generate them inline.
+    'size': int(get_option('keypool', 'size', 100)),
+    'bits': int(get_option('keypool', 'bits', 4096)),
+    #Encrypts the private keys of the pool.
+    'secret': get_option('keypool', 'secret', SECRET_KEY),
+}
+
 #Authorize all the web to query our API (can be a good thing to become popular)
 CORS_ORIGIN_ALLOW_ALL = True
 
@@ -77,6 +210,7 @@ INSTALLED_APPS = [
     'boulangerie.apps.deployments.apps.DeploymentsConfig',
     'boulangerie.apps.keys.apps.KeysConfig',
     'boulangerie.apps.organizations.apps.OrganizationsConfig',
+    'boulangerie.apps.outbox.apps.OutboxConfig',
     'boulangerie.apps.projects.apps.ProjectsConfig',
     'boulangerie.apps.quotas.apps.QuotasConfig',
     'boulangerie.apps.vpcs.apps.VpcsConfig',
@@ -94,6 +228,7 @@ MIDDLEWARE_CLASSES = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     #boulangerie middlewares
+    'boulangerie.middlewares.broker.Batch',
     #'boulangerie.middlewares.profile.Profile',
 ]
 
@@ -127,7 +262,7 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
-        'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
+        'boulangerie.apps.accounts.authentication.JSONWebTokenAuthentication',
     ),
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
@@ -144,8 +279,14 @@ REST_FRAMEWORK = {
 # Authentication
 AUTH_USER_MODEL = 'accounts.Account'
 
+AUTHENTICATION_BACKENDS = [
+    'boulangerie.apps.accounts.backends.CachedModelBackend',
+]
+
 
 # Default JWT preferences
+JWT_CLAIMS = bool(int(get_option('security', 'jwt_claims', 0)))
+
 JWT_AUTH = {
     'JWT_ENCODE_HANDLER':
     'rest_framework_jwt.utils.jwt_encode_handler',
@@ -153,7 +294,9 @@ JWT_AUTH = {
     'JWT_DECODE_HANDLER':
     'rest_framework_jwt.utils.jwt_decode_handler',
 
+    #Embed the organization roles in the tokens.
     'JWT_PAYLOAD_HANDLER':
+    'boulangerie.apps.accounts.tokens.payload_handler' if JWT_CLAIMS else
     'rest_framework_jwt.utils.jwt_payload_handler',
 
     'JWT_PAYLOAD_GET_USER_ID_HANDLER':
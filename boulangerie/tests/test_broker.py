@@ -0,0 +1,279 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the broker publisher.
+"""
+#pylint:disable=redefined-outer-name,protected-access
+import json
+import threading
+import time
+import kombu
+import pytest
+from django.db import transaction
+import boulangerie.broker
+import boulangerie.metrics
+from boulangerie.broker import EXCHANGES, Publisher
+
+@pytest.fixture
+def memory_queue():
+    """
+    Bind a queue on the `git` exchange of the in-memory transport.
+    """
+    conn = kombu.Connection('memory://')
+    queue = kombu.Queue('create-repo', exchange=EXCHANGES['git'], routing_key='create-repo')
+    queue(conn.channel()).declare()
+    yield queue(conn.channel())
+    conn.release()
+
+def test_publisher_reuse_connection(memory_queue):
+    """
+    Two messages published: only one connection is opened.
+    """
+    publisher = Publisher('memory://')
+    publisher.publish({'repo': 'a'}, 'create-repo', EXCHANGES['git'])
+    connection = publisher.connection
+    publisher.publish({'repo': 'b'}, 'create-repo', EXCHANGES['git'])
+    assert publisher.connection is connection
+    assert memory_queue.get(no_ack=True).payload == {'repo': 'a'}
+    assert memory_queue.get(no_ack=True).payload == {'repo': 'b'}
+    publisher.close()
+
+def test_publisher_declare_once(memory_queue, monkeypatch):#pylint:disable=unused-argument
+    """
+    The exchange is declared only for the first message.
+    """
+    declared = []
+    monkeypatch.setattr(kombu.Exchange, 'declare', lambda self, *a, **kw: declared.append(self.name))
+    publisher = Publisher('memory://')
+    for _ in range(3):
+        publisher.publish({'repo': 'a'}, 'create-repo', EXCHANGES['git'])
+    assert declared == ['git']
+    #After a connection error, the exchange is declared again.
+    publisher._on_error(Exception(), 0)
+    publisher.publish({'repo': 'a'}, 'create-repo', EXCHANGES['git'])
+    assert declared == ['git', 'git']
+    publisher.close()
+
+def test_get_publisher_fork_safe(settings, monkeypatch):
+    """
+    The process-wide publisher is shared, but recreated after a fork.
+    """
+    settings.BROKER = {'uri': 'memory://'}
+    monkeypatch.setattr(boulangerie.broker, '_PUBLISHER', None)
+    publisher = boulangerie.broker.get_publisher()
+    assert boulangerie.broker.get_publisher() is publisher
+    monkeypatch.setattr(boulangerie.broker.os, 'getpid', lambda: publisher.pid + 1)
+    assert boulangerie.broker.get_publisher() is not publisher
+
+@pytest.fixture
+def published(monkeypatch):
+    """
+    Capture the batches published.
+    """
+    batches = []
+    publisher = Publisher('memory://')
+    monkeypatch.setattr(publisher, 'publish_many', batches.append)
+    monkeypatch.setattr(boulangerie.broker, 'get_publisher', lambda: publisher)
+    return batches
+
+def test_coalesce():
+    """
+    A creation followed by the deletion of the same object cancel each other.
+    """
+    events = [
+        ({'key': 'k1', 'user': 'u'}, 'create-key', 'git'),
+        ({'repo': 'r'}, 'create-repo', 'git'),
+        ({'key': 'k2', 'user': 'u'}, 'create-key', 'git'),
+        ({'key': 'k1', 'user': 'u'}, 'delete-key', 'git'),
+        ({'namespace': 'n'}, 'delete', 'namespace'),
+    ]
+    assert boulangerie.broker.coalesce(events) == [events[1], events[2], events[4]]
+
+@pytest.mark.django_db
+def test_batch_flush(published, commit):
+    """
+    The events of a batch are published at once, after the commit, the cancelled ones are not.
+    """
+    boulangerie.metrics.reset()
+    with boulangerie.broker.batch():
+        boulangerie.broker.send({'repo': 'a'}, 'create-repo', 'git')
+        boulangerie.broker.send({'repo': 'b'}, 'create-repo', 'git')
+        boulangerie.broker.send({'repo': 'a'}, 'delete-repo', 'git')
+    assert published == []
+    commit()
+    assert published == [[({'repo': 'b'}, 'create-repo', EXCHANGES['git'])]]
+    counters = boulangerie.metrics.snapshot()['counters']
+    assert counters['broker.events_coalesced'] == 2
+    assert counters['broker.batches_flushed'] == 1
+
+@pytest.mark.django_db
+def test_batch_rollback(published, commit):
+    """
+    The events sent within a transaction rolled back are dropped,
+    the events sent after it are published.
+    """
+    with boulangerie.broker.batch():
+        try:
+            with transaction.atomic():
+                boulangerie.broker.send({'repo': 'a'}, 'create-repo', 'git')
+                raise ValueError()
+        except ValueError:
+            pass
+        boulangerie.broker.send({'repo': 'b'}, 'create-repo', 'git')
+        try:
+            with transaction.atomic():
+                boulangerie.broker.send({'repo': 'c'}, 'create-repo', 'git')
+                raise ValueError()
+        except ValueError:
+            pass
+    commit()
+    assert published == [[({'repo': 'b'}, 'create-repo', EXCHANGES['git'])]]
+
+@pytest.mark.django_db
+def test_batch_nested(published, commit):
+    """
+    A batch closed within a transaction hands its events to the enclosing batch:
+    nothing is published before the commit, nor if the transaction is rolled back.
+    """
+    with boulangerie.broker.batch():
+        with transaction.atomic(), boulangerie.broker.batch():
+            boulangerie.broker.send({'repo': 'a'}, 'create-repo', 'git')
+        assert published == []
+        boulangerie.broker.send({'repo': 'b'}, 'create-repo', 'git')
+    commit()
+    assert published == [[({'repo': 'a'}, 'create-repo', EXCHANGES['git']),
+                           ({'repo': 'b'}, 'create-repo', EXCHANGES['git'])]]
+    del published[:]
+    with pytest.raises(ValueError):
+        with transaction.atomic():
+            with boulangerie.broker.batch():
+                boulangerie.broker.send({'repo': 'c'}, 'create-repo', 'git')
+            raise ValueError()
+    commit()
+    assert published == []
+
+def test_batch_exception(published):
+    """
+    The events are dropped when the block fails.
+    """
+    with pytest.raises(ValueError):
+        with boulangerie.broker.batch():
+            boulangerie.broker.send({'repo': 'a'}, 'create-repo', 'git')
+            raise ValueError()
+    assert published == []
+
+def test_async_publisher(broker_git_create_repo):
+    """
+    The messages are published by the background thread, all of them before it stops.
+    """
+    queue, _ = broker_git_create_repo
+    publisher = boulangerie.broker.AsyncPublisher('memory://', 10, 1)
+    for repo in ('a', 'b'):
+        publisher.publish_many([({'repo': repo}, 'create-repo', EXCHANGES['git'])])
+    publisher.close()
+    assert not publisher.thread.is_alive()
+    assert [json.loads(message.body) for message in queue.consume()] == [{'repo': 'a'}, {'repo': 'b'}]
+
+@pytest.mark.django_db
+def test_async_publisher_full(monkeypatch):
+    """
+    The queue is bounded by its number of events: when it stays full, the messages are spilled to the outbox.
+    """
+    from boulangerie.apps.outbox.models import Event
+    boulangerie.metrics.reset()
+    release = threading.Event()
+    publisher = boulangerie.broker.AsyncPublisher('memory://', 2, 0.01)
+    monkeypatch.setattr(publisher.publisher, 'publish_many', lambda messages: release.wait())
+    publisher.publish_many([({'repo': 'a'}, 'create-repo', EXCHANGES['git'])])#Blocks the thread.
+    while publisher.batches:
+        time.sleep(0.01)
+    publisher.publish_many([({'repo': 'b'}, 'create-repo', EXCHANGES['git'])])#Fills the queue.
+    publisher.publish_many([({'repo': 'c'}, 'create-repo', EXCHANGES['git']),
+                            ({'repo': 'd'}, 'delete-repo', EXCHANGES['git'])])
+    assert publisher.depth() == 2
+    assert [(json.loads(event.payload), event.routing_key, event.exchange) for event in Event.objects.all()] == \
+        [({'repo': 'c'}, 'create-repo', 'git'), ({'repo': 'd'}, 'delete-repo', 'git')]
+    snapshot = boulangerie.metrics.snapshot()
+    assert snapshot['counters']['broker.enqueue_timeouts'] == 1
+    assert snapshot['counters']['broker.spilled'] == 2
+    assert snapshot['timings']['broker.enqueue_wait']['count'] == 3
+    release.set()
+    publisher.close()
+    assert publisher.depth() == 0
+
+def test_async_publisher_large_batch(broker_git_create_repo):
+    """
+    A batch larger than the queue is enqueued once the queue is empty.
+    """
+    queue, _ = broker_git_create_repo
+    publisher = boulangerie.broker.AsyncPublisher('memory://', 1, 1)
+    publisher.publish_many([({'repo': repo}, 'create-repo', EXCHANGES['git']) for repo in ('a', 'b', 'c')])
+    publisher.close()
+    assert [json.loads(message.body) for message in queue.consume()] == [{'repo': 'a'}, {'repo': 'b'}, {'repo': 'c'}]
+
+def test_async_publisher_error(monkeypatch):
+    """
+    The messages the background thread can't publish are spilled to the outbox.
+    """
+    boulangerie.metrics.reset()
+    spilled = []
+    monkeypatch.setattr(boulangerie.broker, 'spill', spilled.append)
+    publisher = boulangerie.broker.AsyncPublisher('memory://', 10, 1)
+    monkeypatch.setattr(publisher.publisher, 'publish_many', mock_error)
+    messages = [({'repo': 'a'}, 'create-repo', EXCHANGES['git'])]
+    publisher.publish_many(messages)
+    publisher.close()
+    assert spilled == [messages]
+    assert boulangerie.metrics.snapshot()['counters']['broker.publish_errors'] == 1
+
+def mock_error(messages):
+    """
+    A broker failing to publish.
+    """
+    raise IOError(len(messages))
+
+@pytest.mark.django_db
+def test_spill_error(monkeypatch):
+    """
+    The messages are dropped, and counted, when the outbox is unavailable too.
+    """
+    from boulangerie.apps.outbox.models import Event
+    boulangerie.metrics.reset()
+    monkeypatch.setattr(Event.objects, 'push', mock_error)
+    boulangerie.broker.spill([({'repo': 'a'}, 'create-repo', EXCHANGES['git'])])
+    assert boulangerie.metrics.snapshot()['counters']['broker.dropped'] == 1
+
+def test_create_backend():
+    """
+    The backend is chosen from the URI scheme.
+    """
+    assert isinstance(boulangerie.broker.create_backend('memory://'), boulangerie.broker.MemoryBackend)
+    assert isinstance(boulangerie.broker.create_backend('file:///tmp/events.jsonl'),
+                      boulangerie.broker.FileBackend)
+    assert isinstance(boulangerie.broker.create_backend('amqp://127.0.0.1:5672/'), Publisher)
+
+def test_memory_backend(broker_git_create_repo):
+    """
+    The messages are routed on the exchange and the routing key, unroutable ones are dropped.
+    """
+    queue, _ = broker_git_create_repo
+    backend = boulangerie.broker.MemoryBackend('memory://')
+    backend.publish_many([({'repo': 'a'}, 'create-repo', EXCHANGES['git']),
+                          ({'repo': 'b'}, 'create-repo', EXCHANGES['namespace']),
+                          ({'repo': 'c'}, 'unbound', EXCHANGES['git']),
+                          ({'repo': 'd'}, 'create-repo', EXCHANGES['git'])])
+    assert len(queue) == 2
+    assert [json.loads(message.body) for message in queue.consume()] == [{'repo': 'a'}, {'repo': 'd'}]
+
+def test_file_backend(tmpdir):
+    """
+    The messages are appended to the file, and read back in order.
+    """
+    uri = 'file://{0}'.format(tmpdir.join('events.jsonl'))
+    backend = boulangerie.broker.FileBackend(uri)
+    backend.publish_many([({'repo': 'a'}, 'create-repo', EXCHANGES['git'])])
+    backend.publish_many([({'namespace': 'a'}, 'create', EXCHANGES['namespace']),
+                          ({'repo': 'a'}, 'delete-repo', EXCHANGES['git'])])
+    assert [m.routing_key for m in boulangerie.broker.FileBackend.read(uri)] == \
+        ['create-repo', 'create', 'delete-repo']
+    messages = list(boulangerie.broker.FileBackend.read(uri, exchange='git', routing_key='delete-repo'))
+    assert [json.loads(message.body) for message in messages] == [{'repo': 'a'}]
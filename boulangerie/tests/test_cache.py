@@ -0,0 +1,40 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the LRU cache backend.
+"""
+from boulangerie.cache import LRUCache
+
+def test_lru_eviction():
+    """
+    Once full, the least recently read key is evicted.
+    """
+    cache = LRUCache('test-lru', {'OPTIONS': {'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 3}})
+    cache.clear()
+    for key in ('a', 'b', 'c'):
+        cache.set(key, key)
+    assert cache.get('a') == 'a'
+    cache.set('d', 'd')
+    assert cache.get('b') is None
+    assert [cache.get(key) for key in ('a', 'c', 'd')] == ['a', 'c', 'd']
+
+def test_access_cache_timeout(monkeypatch):
+    """
+    Per worker, the caches deciding the accesses keep their entries a few seconds by default.
+    """
+    from boulangerie import settings
+    assert settings.access_cache('membership', 300)['TIMEOUT'] == settings.LOCAL_CACHE_TIMEOUT
+    monkeypatch.setattr(settings, 'get_option', lambda section, option, default=None:
+                        'django.core.cache.backends.memcached.MemcachedCache' if option.endswith('_backend') else default)
+    assert settings.access_cache('membership', 300)['TIMEOUT'] == 300
+
+def test_check_access_caches(settings):
+    """
+    A per worker cache deciding the accesses, kept longer than a few seconds, is reported.
+    """
+    from boulangerie.checks import check_access_caches
+    assert check_access_caches(None) == []
+    settings.CACHES = dict(settings.CACHES, membership=dict(settings.CACHES['membership'], TIMEOUT=300))
+    assert [warning.id for warning in check_access_caches(None)] == ['boulangerie.W001']
+    settings.CACHES = dict(settings.CACHES, membership=dict(settings.CACHES['membership'],
+                                                            BACKEND='django.core.cache.backends.filebased.FileBasedCache'))
+    assert check_access_caches(None) == []
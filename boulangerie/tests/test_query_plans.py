@@ -0,0 +1,66 @@
+#-*- coding:utf-8 -*-
+"""
+Query plan regression tests: the hot queries must use an index,
+for the filter and for the sort.
+They run EXPLAIN against the configured database, Postgres or SQLite.
+"""
+import pytest
+from django.db import connection
+from boulangerie.apps.keys.models import SSHKey
+from boulangerie.apps.organizations.models import Member
+from boulangerie.apps.projects.models import Project
+from boulangerie.apps.quotas.models import Quota, Usage
+from boulangerie.apps.vpcs.models import VPC
+
+pytestmark = pytest.mark.django_db#pylint:disable=invalid-name
+
+HOT_QUERIES = {
+    'membership': lambda: Member.objects.filter(organization='orga', account='user').values_list('is_admin', 'is_owner')[:1],
+    'memberships': lambda: Member.objects.filter(account='user').values_list('organization', 'is_admin', 'is_owner'),
+    'members': lambda: Member.objects.filter(account='user'),
+    'quotas': lambda: Quota.objects.filter(owner='orga'),
+    'usage': lambda: Usage.objects.filter(owner='orga', key='max_vpcs').values_list('usage', flat=True)[:1],
+    'keys': lambda: SSHKey.objects.filter(owner='user'),
+    'projects': lambda: Project.objects.filter(owner='orga'),
+    'vpcs': lambda: VPC.objects.filter(owner='orga'),
+}
+
+def explain(queryset):
+    """
+    Retrieve the query plan of the `queryset`, one step per line.
+    On Postgres, the sequential scans are disabled: they are cheaper on almost empty tables,
+    the plan tells if an index can serve the query.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+        else:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [str(row[-1]) for row in cursor.fetchall()]
+
+def full_scans(plan):
+    """
+    The steps reading a whole table.
+    """
+    if connection.vendor == 'postgresql':
+        return [step for step in plan if 'Seq Scan' in step]
+    return [step for step in plan if step.startswith('SCAN') and 'INDEX' not in step]
+
+def sorts(plan):
+    """
+    The steps sorting the rows.
+    """
+    if connection.vendor == 'postgresql':
+        return [step for step in plan if step.strip(' ->').startswith('Sort')]
+    return [step for step in plan if 'TEMP B-TREE' in step]
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_plan(name):
+    """
+    The hot queries neither scan a table, nor sort the rows.
+    """
+    plan = explain(HOT_QUERIES[name]())
+    assert not full_scans(plan), plan
+    assert not sorts(plan), plan
@@ -0,0 +1,139 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the cache of the build and deployment details.
+"""
+#pylint:disable=redefined-outer-name,wildcard-import,unused-wildcard-import,line-too-long,unused-argument
+import mock
+import pytest
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.test import APIClient
+import boulangerie.metrics
+import boulangerie.results
+import boulangerie.rpc
+from boulangerie.apps.builds.tests.fixtures import *
+
+UID = '3b73f69f3fb94f159d8a3230596c2e3b'
+
+@pytest.fixture
+def metrics():
+    """
+    Start from empty counters.
+    """
+    boulangerie.metrics.reset()
+    yield boulangerie.metrics.counter
+    boulangerie.metrics.reset()
+
+def test_cached_terminal(metrics):
+    """
+    A terminal result is kept without timeout, the hits of a RPC result are RPC calls saved.
+    """
+    load = mock.Mock(return_value=({'count': 1, 'results': ['done']}, True))
+    with mock.patch.object(caches['results'], 'set', wraps=caches['results'].set) as cache_set:
+        for _ in range(3):
+            assert boulangerie.results.cached('cuisson', 'orga', UID, load, lambda result: True) == ({'count': 1, 'results': ['done']}, False)
+    assert load.call_count == 1
+    assert cache_set.call_args[0][2] == settings.RESULTS['terminal_timeout']
+    assert (metrics('results_cache.hits'), metrics('results_cache.misses'), metrics('results_cache.rpc_saved')) == (2, 1, 2)
+    assert boulangerie.metrics.snapshot()['gauges']['results_cache.hit_ratio'] == 2.0 / 3
+
+def test_cached_in_progress(metrics):
+    """
+    A result in progress is kept for the timeout of the cache, an empty result isn't kept.
+    """
+    with mock.patch.object(caches['results'], 'set', wraps=caches['results'].set) as cache_set:
+        boulangerie.results.cached('cuisson', 'orga', UID, lambda: ({'results': ['clone']}, False), lambda result: False)
+        assert len(cache_set.call_args[0]) == 2
+        boulangerie.results.cached('cuisson', 'orga', 'other', lambda: ({'count': 0, 'results': []}, True), lambda result: True)
+        assert cache_set.call_count == 1
+    boulangerie.results.cached('cuisson', 'orga', UID, None, None)
+    assert (metrics('results_cache.hits'), metrics('results_cache.rpc_saved')) == (1, 0)
+
+def test_cached_local_terminal():
+    """
+    A terminal result read from the local tables may miss steps: it is kept for the timeout of the cache.
+    """
+    with mock.patch.object(caches['results'], 'set', wraps=caches['results'].set) as cache_set:
+        boulangerie.results.cached('cuisson', 'orga', UID, lambda: ({'results': ['done']}, False), lambda result: True)
+    assert len(cache_set.call_args[0]) == 2
+
+def test_cached_steps_applied(user1, login, step_factory):
+    """
+    A build finished in the read model, then completed by the steps applied later, is served complete.
+    """
+    from boulangerie.apps.builds import readmodel
+    readmodel.apply([step_factory(UID, 3, 'done')])
+    path = '/api/0.1/builds/user1-default/{}/'.format(UID)
+    token = 'JWT {}'.format(login(user1))
+    assert APIClient().get(path, HTTP_AUTHORIZATION=token).json()['count'] == 1
+    readmodel.apply([step_factory(UID, 1, 'clone'), step_factory(UID, 2, 'build')])
+    assert APIClient().get(path, HTTP_AUTHORIZATION=token).json()['count'] == 3
+
+def test_cached_keys():
+    """
+    The results are keyed by service, organization and uid.
+    """
+    boulangerie.results.cached('cuisson', 'orga', UID, lambda: ({'results': ['a']}, False), lambda result: True)
+    assert boulangerie.results.cached('defournement', 'orga', UID, lambda: ({'results': ['b']}, False), lambda result: True)[0] == {'results': ['b']}
+    assert boulangerie.results.cached('cuisson', 'other', UID, lambda: ({'results': ['c']}, False), lambda result: True)[0] == {'results': ['c']}
+    boulangerie.results.invalidate('cuisson', 'orga', UID)
+    assert boulangerie.results.cached('cuisson', 'orga', UID, lambda: ({'results': ['d']}, False), lambda result: True)[0] == {'results': ['d']}
+
+def test_view_checks_membership(user1, user2, login, step_factory):
+    """
+    A finished build is retrieved once from cuisson, the membership is still checked.
+    """
+    result = {'count': 1, 'previous': None, 'next': None, 'results': [step_factory(UID, 1, 'done')]}
+    rpc = mock.Mock(return_value=result)
+    client = APIClient()
+    path = '/api/0.1/builds/user1-default/{}/'.format(UID)
+    with mock.patch('boulangerie.apps.builds.readmodel.detail', return_value=None), \
+         mock.patch('boulangerie.apps.builds.readmodel.apply'), \
+         mock.patch('farine.rpc.Client.__wrap_rpc__', rpc):
+        for _ in range(2):
+            assert client.get(path, HTTP_AUTHORIZATION='JWT {}'.format(login(user1))).json() == result
+        assert client.get(path, HTTP_AUTHORIZATION='JWT {}'.format(login(user2))).status_code == 404
+    assert rpc.call_count == 1
+
+def test_destroy_invalidates(user1, login):
+    """
+    A deployment being stopped is dropped from the cache.
+    """
+    boulangerie.results.cached('defournement', 'user1-default', UID, lambda: ({'results': ['running']}, True), lambda result: False)
+    with mock.patch('farine.rpc.Client.__wrap_rpc__', mock.Mock(return_value=True)):
+        response = APIClient().delete('/api/0.1/deployments/user1-default/{}/'.format(UID), HTTP_AUTHORIZATION='JWT {}'.format(login(user1)))
+    assert response.status_code == 204
+    assert caches['results'].get(u'result:defournement:user1-default:{}'.format(UID)) is None
+
+def test_stale(user1, login, metrics):
+    """
+    While defournement is unavailable, the deployments retrieved before are served stale,
+    the others aren't served.
+    """
+    result = {'count': 1, 'previous': None, 'next': None, 'results': ['{"status": "running"}']}
+    token = 'JWT {}'.format(login(user1))
+    path = '/api/0.1/deployments/user1-default/'
+    with mock.patch('farine.rpc.Client.__wrap_rpc__', mock.Mock(return_value=result)):
+        assert APIClient().get(path, HTTP_AUTHORIZATION=token).json() == result
+        assert APIClient().get(path + UID + '/', HTTP_AUTHORIZATION=token).json() == result
+    caches['results'].delete(u'result:defournement:user1-default:{}'.format(UID))
+    with mock.patch('farine.rpc.Client.__wrap_rpc__', mock.Mock(side_effect=boulangerie.rpc.Unavailable('timeout'))):
+        for uri in (path, path + UID + '/'):
+            response = APIClient().get(uri, HTTP_AUTHORIZATION=token)
+            assert (response.json(), response['Warning']) == (result, boulangerie.results.STALE_WARNING)
+        response = APIClient().get(path + '?offset=10', HTTP_AUTHORIZATION=token)
+        assert response.status_code == 503
+        assert not response.has_header('Warning')
+    assert (metrics('results_cache.stale'), metrics('results_cache.unavailable')) == (2, 1)
+
+def test_stale_only_on_unavailable():
+    """
+    A remote error isn't hidden by a stale copy.
+    """
+    with mock.patch('farine.rpc.Client.__wrap_rpc__', mock.Mock(return_value={'count': 0})):
+        assert boulangerie.results.call('cuisson', 'list', 'orga', 0, 10) == ({'count': 0}, False)
+    with mock.patch('farine.rpc.Client.__wrap_rpc__', mock.Mock(side_effect=KeyError)):
+        with pytest.raises(KeyError):
+            boulangerie.results.call('cuisson', 'list', 'orga', 0, 10)
+    with mock.patch('farine.rpc.Client.__wrap_rpc__', mock.Mock(side_effect=boulangerie.rpc.Unavailable)):
+        assert boulangerie.results.call('cuisson', 'list', 'orga', 0, 10) == ({'count': 0}, True)
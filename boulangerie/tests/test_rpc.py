@@ -0,0 +1,223 @@
+#-*- coding:utf-8 -*-
+"""
+Unit tests for the pooled RPC clients.
+"""
+#pylint:disable=redefined-outer-name,protected-access,unused-argument
+import threading
+import time
+import farine.exceptions
+import farine.settings
+import kombu
+import kombu.transport.memory
+import pytest
+import boulangerie.metrics
+import boulangerie.rpc
+
+@pytest.fixture
+def cuisson(monkeypatch, settings):
+    """
+    Stand-in `cuisson` service on the in-memory transport:
+    `list` returns its arguments, `fail` raises, `slow` replies twice 0.1 second apart.
+    """
+    monkeypatch.setattr(kombu.transport.memory.Transport, 'polling_interval', 0.001)
+    monkeypatch.setattr(farine.settings, 'cuisson', dict(farine.settings.cuisson, amqp_uri='memory://'), raising=False)
+    monkeypatch.setattr(boulangerie.rpc, '_POOLS', {})
+    settings.RPC = {'pool_size': 2, 'timeout': 1, 'check_interval': 30, 'failure_threshold': 2,
+                    'reset_timeout': 30, 'max_in_flight': 2, 'stale_timeout': 60}
+    conn = kombu.Connection('memory://', transport_options={'polling_interval': 0.001})
+    channel = conn.channel()
+    exchange = kombu.Exchange('cuisson', type='direct')
+    producer = kombu.Producer(channel, exchange=exchange)
+    def reply(body, message):#pylint:disable=missing-docstring
+        properties = {'routing_key': message.properties['reply_to'],
+                      'correlation_id': message.properties['correlation_id']}
+        if message.delivery_info['routing_key'] == 'cuisson__fail':
+            producer.publish({'__except__': 'Traceback: failed'}, **properties)
+        elif message.delivery_info['routing_key'] == 'cuisson__slow':
+            for _ in range(2):
+                time.sleep(0.1)
+                producer.publish({'body': body['args'], '__end__': False}, **properties)
+            producer.publish({'__end__': True}, **properties)
+        else:
+            producer.publish({'body': body['args'], '__end__': False}, **properties)
+            producer.publish({'__end__': True}, **properties)
+    queues = [kombu.Queue('cuisson__{0}'.format(method), exchange=exchange, routing_key='cuisson__{0}'.format(method))
+              for method in ('list', 'fail', 'slow')]
+    consumer = kombu.Consumer(channel, queues=queues, callbacks=[reply], no_ack=True)
+    consumer.consume()
+    stop = threading.Event()
+    def serve():#pylint:disable=missing-docstring
+        while not stop.is_set():
+            try:
+                conn.drain_events(timeout=0.01)
+            except Exception:#pylint:disable=broad-except
+                pass
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    yield
+    stop.set()
+    thread.join()
+    conn.release()
+
+@pytest.fixture
+def counters(monkeypatch):
+    """
+    Record the incremented metrics.
+    """
+    names = []
+    monkeypatch.setattr(boulangerie.metrics, 'incr', names.append)
+    return names
+
+def test_client_calls(cuisson):
+    """
+    A client is set up once and serves several calls.
+    """
+    rpc = boulangerie.rpc.Client('cuisson', 1)
+    assert rpc.list('orga', 0, 10) == ['orga', 0, 10]
+    consumer = rpc.consumer
+    assert rpc.list('orga', 10, 10) == ['orga', 10, 10]
+    assert rpc.consumer is consumer
+    rpc.close()
+
+def test_client_remote_error(cuisson):
+    """
+    A remote exception is raised as a RPC error, the client stays usable.
+    """
+    rpc = boulangerie.rpc.Client('cuisson', 1)
+    with pytest.raises(farine.exceptions.RPCError):
+        rpc.fail()
+    assert not rpc.broken
+    assert rpc.list('orga') == ['orga']
+    rpc.close()
+
+def test_client_timeout(cuisson):
+    """
+    A call without reply times out, its late replies are dropped.
+    """
+    rpc = boulangerie.rpc.Client('cuisson', 0.05)
+    with pytest.raises(boulangerie.rpc.Unavailable):
+        rpc.unknown()
+    rpc.correlation_id = 'previous'
+    rpc.on_reply({'body': 'late'}, kombu.Message(body='', properties={'correlation_id': 'other'}))
+    assert not rpc.pending
+    rpc.close()
+
+def test_pool_reuse(cuisson, counters):
+    """
+    The clients are given back to the pool and reused.
+    """
+    with boulangerie.rpc.client('cuisson') as rpc:
+        assert rpc.list('orga') == ['orga']
+    with boulangerie.rpc.client('cuisson') as other:
+        assert other is rpc
+        assert other.list('orga') == ['orga']
+    assert counters == ['rpc_pool.created', 'rpc_pool.reused']
+
+def test_pool_size(cuisson, counters):
+    """
+    The clients beyond the size of the pool are closed.
+    """
+    pool = boulangerie.rpc.get_pool('cuisson')
+    clients = [pool.acquire() for _ in range(3)]
+    for rpc in clients:
+        pool.release(rpc)
+    assert list(pool.idle) == clients[:2]
+    assert counters == ['rpc_pool.created'] * 3 + ['rpc_pool.discarded']
+
+def test_pool_discard_broken(cuisson, counters, monkeypatch):
+    """
+    A client whose connection failed is not given back,
+    an idle client failing its health check is replaced.
+    """
+    with pytest.raises(boulangerie.rpc.Unavailable):
+        with boulangerie.rpc.client('cuisson') as rpc:
+            monkeypatch.setattr(rpc.connection, 'drain_events', lambda timeout: 1 / 0)
+            rpc.list('orga')
+    assert rpc.broken
+    pool = boulangerie.rpc.get_pool('cuisson')
+    assert not pool.idle
+    with boulangerie.rpc.client('cuisson') as rpc:
+        rpc.list('orga')
+    rpc.last_used -= 60
+    monkeypatch.setattr(rpc, 'check', lambda: 1 / 0)
+    assert pool.acquire() is not rpc
+    assert counters == ['rpc_pool.created', 'rpc_pool.discarded', 'rpc_pool.created',
+                        'rpc_pool.discarded', 'rpc_pool.created']
+
+def test_pool_fork_safe(cuisson, monkeypatch):
+    """
+    The pool is shared within a process, but recreated after a fork.
+    """
+    pool = boulangerie.rpc.get_pool('cuisson')
+    assert boulangerie.rpc.get_pool('cuisson') is pool
+    monkeypatch.setattr(boulangerie.rpc.os, 'getpid', lambda: -1)
+    assert boulangerie.rpc.get_pool('cuisson') is not pool
+
+def test_client_deadline(cuisson):
+    """
+    The timeout bounds the whole call, not each reply.
+    """
+    rpc = boulangerie.rpc.Client('cuisson', 0.15)
+    with pytest.raises(boulangerie.rpc.Unavailable):
+        list(rpc.slow('orga', __stream__=True))
+    assert not rpc.broken
+    rpc.timeout = 1
+    assert list(rpc.slow('orga', __stream__=True)) == [['orga'], ['orga']]
+    rpc.close()
+
+def test_breaker(cuisson, counters, monkeypatch):
+    """
+    The circuit opens after consecutive failures, the calls fail fast until a trial call closes it.
+    A remote error doesn't count as a failure.
+    """
+    breaker = boulangerie.rpc.get_pool('cuisson').breaker
+    for _ in range(2):
+        with pytest.raises(boulangerie.rpc.Unavailable):
+            with boulangerie.rpc.client('cuisson', timeout=0.01) as rpc:
+                rpc.unknown()
+    assert breaker.is_open()
+    assert boulangerie.metrics.snapshot()['gauges']['rpc.cuisson.circuit_open']
+    with pytest.raises(boulangerie.rpc.Unavailable):
+        with boulangerie.rpc.client('cuisson') as rpc:
+            pass
+    breaker.opened -= 30
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.failure()
+    assert breaker.is_open() and not breaker.allow()
+    breaker.opened -= 30
+    with pytest.raises(farine.exceptions.RPCError):
+        with boulangerie.rpc.client('cuisson') as rpc:
+            rpc.fail()
+    assert not breaker.is_open()
+    assert counters.count('rpc.cuisson.opened') == 2
+    assert counters.count('rpc.cuisson.rejected') == 1
+
+def test_breaker_caller_error(cuisson):
+    """
+    An error of the caller neither closes nor opens the circuit, and doesn't hold the trial call.
+    """
+    breaker = boulangerie.rpc.get_pool('cuisson').breaker
+    for _ in range(2):
+        breaker.failure()
+    breaker.opened -= 30
+    with pytest.raises(ValueError):
+        with boulangerie.rpc.client('cuisson') as rpc:
+            assert rpc.list('orga') == ['orga']
+            raise ValueError()
+    assert breaker.is_open()
+    assert breaker.allow()
+
+def test_bulkhead(cuisson, counters):
+    """
+    The calls beyond `max_in_flight` fail fast, without waiting for a client.
+    """
+    with boulangerie.rpc.client('cuisson'), boulangerie.rpc.client('cuisson'):
+        with pytest.raises(boulangerie.rpc.Unavailable):
+            with boulangerie.rpc.client('cuisson'):
+                pass
+    with boulangerie.rpc.client('cuisson') as rpc:
+        assert rpc.list('orga') == ['orga']
+    assert counters.count('rpc.cuisson.rejected') == 1
+    assert not boulangerie.rpc.get_pool('cuisson').breaker.is_open()
@@ -14,5 +14,6 @@ urlpatterns = [#pylint: disable=invalid-name
     url(r'^api/0.1/', include('boulangerie.apps.projects.urls')),
     url(r'^api/0.1/', include('boulangerie.apps.quotas.urls')),
     url(r'^api/0.1/', include('boulangerie.apps.vpcs.urls')),
+    url(r'^api/0.1/metrics/$', boulangerie.views.metrics),
     url(r'^api/0.1/$', boulangerie.views.dummy)
 ]
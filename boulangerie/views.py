@@ -1,5 +1,9 @@
 #-*- coding:utf-8 -*-
 from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+import boulangerie.metrics
 
 def dummy(request):
     """
@@ -7,3 +11,11 @@ def dummy(request):
     Needed by nuxtjs : it calls /api/0.1/.
     """
     return HttpResponse("")
+
+@api_view(['GET'])
+@permission_classes((IsAdminUser,))
+def metrics(request):#pylint:disable=unused-argument
+    """
+    The process metrics, admins only.
+    """
+    return Response(boulangerie.metrics.snapshot(probes=True))
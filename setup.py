@@ -42,9 +42,7 @@ setup(
             'pytest',
             'pytest-cov',
             'pytest-django==3.0.0',
-            'pytest-rabbitmq',
             'pylint==1.6.1',
-            'rabbitpy==0.26.2',
         ],
         'doc': [
             'Sphinx==1.4.4',